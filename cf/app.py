@@ -33,6 +33,7 @@ from cf import release, USER_DIR, MANUAL_URL, DATA_DIR, USER_CONFIG_DIR
 from config import Config
 from plugins.core import PluginManager
 from cf.db import DatasourceManager
+from cf.filter.jobs import ExportJobManager
 from cf.ui import dialogs
 from cf.ui.datasources import DatasourcesDialog
 from cf.ui.widgets import ConnectionsDialog
@@ -40,6 +41,7 @@ from ui.mainwindow import MainWindow
 from ui.prefs import PreferencesDialog
 from cf.userdb import UserDB
 from cf import autocompletion
+from cf.db import resultstore
 
 import logging
 
@@ -56,6 +58,7 @@ class CFApplication(gobject.GObject):
       userdb: User database
       plugins: Plugin registry
       datasources: Datasource information
+      exports: Background export jobs
     """
 
     def __init__(self, options):
@@ -83,8 +86,13 @@ class CFApplication(gobject.GObject):
         self.run_listener()
         self.plugins = PluginManager(self)
         self.datasources = DatasourceManager(self)
+        self.exports = ExportJobManager(
+            self.config.get('export.max_workers', 2))
+        self.register_shutdown_task(self.exports.cancel_all,
+                                    _(u'Cancelling exports'), 5)
         self.recent_manager = gtk.recent_manager_get_default()
         autocompletion.setup(self)
+        resultstore.setup(self)
 
     def _check_version(self):
         """Run possible version updates."""
@@ -27,6 +27,8 @@ config changes.
 """
 
 import itertools
+import logging
+import thread
 from gettext import gettext as _
 
 import gobject
@@ -35,12 +37,20 @@ import pango
 
 import sqlparse.keywords
 
-from cf import db
+from cf.db.meta import CompletionIndex
 
 
 SQL_KEYWORDS = set(tuple(sqlparse.keywords.KEYWORDS))
 SQL_KEYWORDS.update(tuple(sqlparse.keywords.KEYWORDS_COMMON))
 
+# Maximum number of completions shown in the popup.
+MAX_COMPLETIONS = 200
+
+# Delay in milliseconds before completions are computed while typing.
+COMPLETION_DELAY = 150
+
+_keyword_index = None
+
 
 def setup(app):
     """Setup autocompletion feature.
@@ -71,7 +81,7 @@ def run_action(action, window):
         return
     if editor.textview.get_data('cf::ac_window') is not None:
         return
-    editor_autocomplete(editor)
+    get_worker(editor).schedule(delay=0)
 
 
 def editor_autocomplete(editor, popup=None, matches=None):
@@ -122,25 +132,148 @@ def editor_autocomplete_advanced(editor):
 
     If there's exactly one match, the match is applied automatically.
     Otherwise the usual :meth:`editor_autocompletion` implementation is
-    called.
+    called. The matches are computed by the completion worker, the return
+    value tells whether completion was started at all.
 
     :param editor: SQLEditor instance.
     """
-    matches = get_matches(editor)
-    if matches is None:
+    request = get_completion_request(editor)
+    if request is None:
         return False
+    get_worker(editor).submit(request, _apply_advanced, editor)
+    return True
+
+
+def _apply_advanced(matches, editor):
+    """Applies a single completion or shows the popup."""
     completions = set()
     for value in matches.itervalues():
         for compl in value:
             completions.add(compl[1][0])
     if len(completions) == 0:
-        return True
+        return
     elif len(completions) != 1:
         editor_autocomplete(editor, matches=matches)
-        return True
+        return
     value = completions.pop()
     _apply_selection(editor, value, add_blank=_is_keyword(value))
-    return True
+
+
+# ----
+# Completion Worker
+# ----
+
+class CompletionWorker(object):
+    """Computes completions for an editor in a worker thread.
+
+    Requests are debounced and only the most recent request is computed.
+    Results are passed to the callback in the main thread, but only if
+    no newer request was made and the fragment in the editor is still
+    the same.
+    """
+
+    def __init__(self, editor):
+        self.editor = editor
+        self._serial = 0
+        self._timeout = None
+        self._job = None
+        self._running = False
+        self._lock = thread.allocate_lock()
+
+    def cancel(self):
+        """Cancels pending requests and drops outstanding results."""
+        self._serial += 1
+        if self._timeout is not None:
+            gobject.source_remove(self._timeout)
+            self._timeout = None
+
+    def schedule(self, popup=None, delay=COMPLETION_DELAY):
+        """Schedules a completion request for the popup.
+
+        The request is made when there was no other request within
+        *delay* milliseconds.
+        """
+        self.cancel()
+        self._timeout = gobject.timeout_add(delay, self._on_timeout, popup)
+
+    def _on_timeout(self, popup):
+        self._timeout = None
+        request = get_completion_request(self.editor)
+        if request is not None:
+            self.submit(request, self._show_matches, popup)
+        return False
+
+    def _show_matches(self, matches, popup):
+        if (popup is not None
+            and self.editor.textview.get_data('cf::ac_window') is not popup):
+            return
+        editor_autocomplete(self.editor, popup, matches)
+
+    def submit(self, request, callback, *args):
+        """Computes matches for *request* and calls *callback*.
+
+        *request* is a tuple as returned by :meth:`get_completion_request`.
+        *callback* is called in the main thread with the matches and *args*.
+        """
+        self.cancel()
+        job = (self._serial, request, callback, args)
+        self._lock.acquire()
+        try:
+            self._job = job
+            start = not self._running
+            self._running = True
+        finally:
+            self._lock.release()
+        if start:
+            thread.start_new_thread(self._run, ())
+
+    def _run(self):
+        while True:
+            self._lock.acquire()
+            try:
+                job = self._job
+                self._job = None
+                if job is None:
+                    self._running = False
+                    return
+            finally:
+                self._lock.release()
+            self._compute(*job)
+
+    def _compute(self, serial, request, callback, args):
+        if serial != self._serial:  # outdated, don't even start
+            return
+        # Objects that need the editor's connection to be loaded are
+        # skipped, the connection is bound to the main thread.
+        load = True
+        if self.editor.connection and self.editor.connection.meta:
+            load = self.editor.connection.meta.can_refresh_in_background()
+        try:
+            matches = compute_matches(self.editor, *request, load=load)
+        except:
+            logging.exception('Failed to compute completions')
+            return
+        if matches is not None:
+            gobject.idle_add(self._deliver, serial, request[0], matches,
+                             callback, args)
+
+    def _deliver(self, serial, fragment, matches, callback, args):
+        if serial != self._serial:
+            return False
+        start, end = get_fragment_bounds(self.editor.textview.buffer)
+        if self.editor.textview.buffer.get_text(start, end) != fragment:
+            return False
+        callback(matches, *args)
+        return False
+
+
+def get_worker(editor):
+    """Returns the completion worker for an editor."""
+    worker = editor.get_data('cf::ac_worker')
+    if worker is None:
+        worker = CompletionWorker(editor)
+        editor.set_data('cf::ac_worker', worker)
+    return worker
 
 
 # ----
@@ -286,35 +419,39 @@ def apply_selection(popup, editor):
 # Helper functions to find and build the possible completions
 # ----
 
-def build_completions(editor, fragment):
+def get_keyword_index():
+    """Return the completion index for SQL keywords."""
+    global _keyword_index
+    if _keyword_index is None:
+        _keyword_index = CompletionIndex()
+        for kwd in SQL_KEYWORDS:
+            _keyword_index.add(kwd, kwd, _(u'Keyword'))
+    return _keyword_index
+
+
+def build_completions(editor, fragment, limit=MAX_COMPLETIONS):
     """Build the common completions.
 
     The returned list contains the names of database objects if the editor
     has a connection and meta information. Additionally the list contains
-    SQL keywords.
+    SQL keywords. Only completions containing *fragment* are returned,
+    at most *limit* of them.
 
     The returned list is a list of 2-tuples (completion, description) where
     description describes the object (e.g. 'Keyword', 'Table', 'Column'...).
 
     :param editor: SQLEditor instance.
     :param fragment: The fragment that should be completed.
+    :param limit: Maximum number of completions or ``None``.
     """
-    ret = []
-    # objects
+    found = get_keyword_index().find(fragment, limit)
     if editor.connection and editor.connection.meta:
-        meta = editor.connection.meta
-        [ret.append((obj.get_full_name(), obj.typestr))
-         for obj in meta.find(name__ilike=fragment,
-                              cls=(db.objects.Table,
-                                   db.objects.View,
-                                   db.objects.Sequence,
-                                   db.objects.Schema))]
-    # keywords
-    kwds = tuple(sqlparse.keywords.KEYWORDS_COMMON)
-    kwds += tuple(sqlparse.keywords.KEYWORDS)
-    [ret.append((kwd, _(u'Keyword')))
-                for kwd in kwds]
-    return ret
+        found.extend(editor.connection.meta.find_completions(fragment,
+                                                             limit))
+    found.sort(key=lambda x: (x[0], x[1].lower()))
+    if limit is not None:
+        found = found[:limit]
+    return [(name, descr) for pos, name, descr in found]
 
 
 def find_matches(completions, fragment):
@@ -383,52 +520,109 @@ def get_score(solution, fragment):
     return start, [start+i for i in range(len(fragment))]
 
 
-def get_completions_from_identifiers(editor):
-    """Similar to get_completions but only with children of an identifier."""
-    bounds = editor.textview.get_current_statement()
+def _get_children(meta, obj, load):
+    """Returns the children of *obj*, loaded only if *load* is True."""
+    if load:
+        return obj.get_children()
+    return meta.find(parent=obj)
+
+
+def get_completions_from_identifiers(editor, statement=None, load=True):
+    """Similar to get_completions but only with children of an identifier.
+
+    :param editor: SQLEditor instance.
+    :param statement: The statement to look for identifiers. If `None`
+      (default) the current statement is read from the editor.
+    :param load: If `False`, columns that weren't loaded yet are skipped.
+    """
     meta = editor.connection.meta
-    buffer_ = editor.textview.buffer
+    if statement is None:
+        bounds = editor.textview.get_current_statement()
+        if bounds:
+            statement = editor.textview.buffer.get_text(*bounds)
     completions = []
-    if bounds:
-        parsed = sqlparse.parse(buffer_.get_text(*bounds))[0]
+    if statement:
+        parsed = sqlparse.parse(statement)[0]
+        tables = []
         for alias, real_name in find_identifier(parsed).iteritems():
-            for obj in meta.find(name=real_name):
-                if obj.typeid in ('table', 'view'):
-                    [completions.append((c.name, c.typestr))
-                     for c in obj.columns.get_children()]
+            tables.extend(obj for obj in meta.find(name=real_name)
+                          if obj.typeid in ('table', 'view'))
+        # Fetch missing columns of all referenced tables at once.
+        if load:
+            meta.load_columns(tables)
+        for obj in tables:
+            [completions.append((c.name, c.typestr))
+             for c in _get_children(meta, obj.columns, load)]
     return completions
 
 
-def get_matches(editor):
-    """Get possible completions."""
+def get_completion_request(editor):
+    """Collect everything needed to compute completions.
+
+    This function reads from the text buffer and therefore must be called
+    in the main thread. It returns a 2-tuple (fragment, statement) that
+    can be passed to :meth:`compute_matches` or `None` if there's nothing
+    to complete.
+
+    :param editor: SQLEditor instance.
+    """
     buffer_ = editor.textview.buffer
     start, end = get_fragment_bounds(buffer_)
     fragment = buffer_.get_text(start, end)
-    completions = None
-    matches = None
-    if len(fragment) == 0 and editor.connection and editor.connection.meta:
-        completions = get_completions_from_identifiers(editor)
-        matches = find_matches(completions, '')
-    elif len(fragment) < 2:
+    has_meta = bool(editor.connection and editor.connection.meta)
+    if 0 < len(fragment) < 2 or (not fragment and not has_meta):
         popup = editor.textview.get_data('cf::ac_window')
         if popup is not None:
             destroy_popup(editor.textview, popup)
-        return
-    if '.' in fragment and editor.connection and editor.connection.meta:
-        parent_name, rest = fragment.split('.', 1)
+        return None
+    statement = None
+    if has_meta and (not fragment or '.' in fragment):
         bounds = editor.textview.get_current_statement()
         if bounds:
-            parsed = sqlparse.parse(buffer_.get_text(*bounds))[0]
+            statement = buffer_.get_text(*bounds)
+    return fragment, statement
+
+
+def compute_matches(editor, fragment, statement, load=True):
+    """Compute possible completions for a request.
+
+    Unlike :meth:`get_matches` this function doesn't touch any widgets and
+    may run in a worker thread. It may trigger backend round-trips when
+    children of database objects are loaded.
+
+    :param editor: SQLEditor instance.
+    :param fragment: The fragment that should be completed.
+    :param statement: The current statement or `None`.
+    :param load: If `False`, children that weren't loaded yet are skipped
+      instead of being loaded.
+    """
+    completions = None
+    matches = None
+    meta = None
+    if editor.connection:
+        meta = editor.connection.meta
+    if len(fragment) == 0 and meta:
+        completions = get_completions_from_identifiers(editor, statement,
+                                                       load)
+        matches = find_matches(completions, '')
+    if '.' in fragment and meta:
+        parent_name, rest = fragment.split('.', 1)
+        if statement:
+            parsed = sqlparse.parse(statement)[0]
             parent = find_identifier(parsed, parent_name)
-            for obj in editor.connection.meta.find(name=parent):
+            if load:
+                meta.load_columns(meta.find(name=parent))
+            for obj in meta.find(name=parent):
                 if obj is not None:
                     if obj.typeid == 'table':
-                        completions = [(c.name, c.typestr)
-                                       for c in obj.columns.get_children()]
+                        completions = [
+                            (c.name, c.typestr)
+                            for c in _get_children(meta, obj.columns, load)]
                     elif obj.typeid == 'schema':
-                        completions = [(c.name, c.typestr)
-                                       for c in obj.tables.get_children()+
-                                   obj.views.get_children()]
+                        completions = [
+                            (c.name, c.typestr)
+                            for c in (_get_children(meta, obj.tables, load)+
+                                      _get_children(meta, obj.views, load))]
                 if completions:
                     matches = find_matches(completions, rest)
     if completions is None:
@@ -437,6 +631,14 @@ def get_matches(editor):
     return matches
 
 
+def get_matches(editor):
+    """Get possible completions."""
+    request = get_completion_request(editor)
+    if request is None:
+        return None
+    return compute_matches(editor, *request)
+
+
 def get_fragment_bounds(buffer_, replace_mode=False, value=None):
     """Return start and end iter for fragment bounds.
 
@@ -504,7 +706,7 @@ def editor_key_pressed(textview, event, editor, window):
         apply_selection(window, editor)
         textview.stop_emission('key-press-event')
         return True
-    gobject.idle_add(editor_autocomplete, editor, window)
+    get_worker(editor).schedule(window)
     return False
 
 
@@ -26,7 +26,7 @@ import sys
 import thread
 import time
 from ConfigParser import ConfigParser
-from threading import Thread
+from threading import RLock, Thread, Timer
 
 import gobject
 import gtk
@@ -49,6 +49,16 @@ TRANSACTION_COMMIT_ENABLED = 1 << 2
 TRANSACTION_ROLLBACK_ENABLED = 1 << 3
 TRANSACTION_ACTIVE = TRANSACTION_COMMIT_ENABLED|TRANSACTION_ROLLBACK_ENABLED
 
+# Phases recorded in Query.timings, in order of occurrence.
+TIMING_FIRST_ROW = 'first_row'
+TIMING_EXECUTE = 'execute'
+TIMING_FETCH = 'fetch'
+TIMING_DECODE = 'decode'
+TIMING_MODEL = 'model'
+TIMING_PAINT = 'paint'
+TIMING_PHASES = (TIMING_FIRST_ROW, TIMING_EXECUTE, TIMING_FETCH,
+                 TIMING_DECODE, TIMING_MODEL, TIMING_PAINT)
+
 
 # See http://www.sqlalchemy.org/docs/05/dbengine.html#supported-dbapis
 DIALECTS = {
@@ -97,12 +107,19 @@ DIALECTS = {
         'description': _(u'Provides access to MaxDB databases'),
         'dependencies': ['sapdb'],
     },
+    'simulated': {
+        'name': 'Simulated',
+        'description': _(u'Simulates a database server for load testing'),
+        'dependencies': [],
+    },
 }
 
 
 import cf
 from cf.db import backends
 from cf.db.meta import DatabaseMeta
+from cf.db.pool import ConnectionPool
+from cf.db.resultstore import ResultStore, estimate_size
 from cf.db.url import make_url
 from cf.ui import dialogs
 from cf.utils import Emit
@@ -154,12 +171,15 @@ class Datasource(gobject.GObject):
         self.connections = set()
         self.manager = manager
         self.internal_connection = None
+        self.pool = None
         self._meta = None
         self._conn_count = 0
         self._url = None
         self._backend = None
         self.ask_for_password = False
         self.startup_commands = None
+        # Max. execution time of statements in seconds or None.
+        self.statement_timeout = None
         self.name = None
         self.description = None
         self.color = None
@@ -211,13 +231,33 @@ class Datasource(gobject.GObject):
             msg = msg % {'name': self.name or str(self.url)}
             pwd = dialogs.password(_(u'Password required'), msg)
             self.url.password = pwd  # remember while this instance lives
-        conn = self.backend.get_connection(self.url)
-        conn = Connection(self, conn)
+        pool = self._get_pool()
+        if pool is not None:
+            real_conn, created = pool.acquire()
+        else:
+            real_conn = self.backend.get_connection(self.url)
+            created = True
+        conn = Connection(self, real_conn)
         self.backend.prepare_connection(conn)
-        if self.startup_commands:
+        # Startup commands are only needed once per physical connection
+        # or after its session was reset.
+        if created and self.startup_commands:
             conn.execute(self.startup_commands)
         return conn
 
+    def _get_pool(self):
+        """Returns the connection pool or ``None`` if pooling is disabled."""
+        if (self.pool is None and self.manager is not None
+            and self.backend.supports_pooling):
+            config = self.manager.app.config
+            if config.get('connections.pool.enabled'):
+                self.pool = ConnectionPool(
+                    self,
+                    min_size=config.get('connections.pool.min_size'),
+                    max_size=config.get('connections.pool.max_size'),
+                    idle_timeout=config.get('connections.pool.idle_timeout'))
+        return self.pool
+
     def on_connection_closed(self, connection):
         if connection in self.connections:
             self.connections.remove(connection)
@@ -249,15 +289,58 @@ class Datasource(gobject.GObject):
             dialogs.error(_(u'Failed'), msg)
             return None
 
+    def open_background_connection(self):
+        """Returns a connection that isn't used by an editor.
+
+        Such connections are used to load meta information in the
+        background. They're not part of :attr:`connections` and may be
+        opened from any thread. Close them to give the physical
+        connection back to the pool.
+        """
+        return self._open_connection()
+
     def dbdisconnect_all(self):
         """Disconnect all open connections."""
+        if self._meta is not None:
+            self._meta.close()
+            self._meta = None
         while self.connections:
             conn = self.connections.pop()
             conn.close()
+        if self.pool is not None:
+            self.pool.clear()
+            self.pool = None
 
     def get_connections(self):
         return self.connections
 
+    def get_unused_connections(self):
+        """Returns connections not used by an editor or a transaction.
+
+        The internal connection used for meta information is never
+        considered as unused.
+        """
+        used = set([self.internal_connection])
+        if self.manager is not None:
+            for instance in self.manager.app.get_instances():
+                for editor in instance.get_editors():
+                    used.add(editor.get_connection())
+        return [conn for conn in self.connections
+                if conn not in used
+                and (conn.get_property('transaction-state')
+                     == TRANSACTION_IDLE)]
+
+    def close_unused_connections(self, max_idle=0):
+        """Closes unused connections.
+
+        :param max_idle: Only connections that haven't executed anything
+          for *max_idle* seconds are closed (default: 0).
+        """
+        now = time.time()
+        for conn in self.get_unused_connections():
+            if now-conn.last_used >= max_idle:
+                conn.close()
+
     def get_label(self):
         if self.name:
             return '%s (%s)' % (self.name, self.public_url)
@@ -303,6 +386,16 @@ class Connection(gobject.GObject):
         self.datasource = datasource
         self.connection = real_conn
         self.num = 0
+        self.last_used = time.time()
+        # Set by the backend if statements have to be cancelled by the
+        # client after this number of seconds.
+        self.client_timeout = None
+        # True if a statement may have changed the session, e.g. SET or
+        # CREATE TEMP TABLE.
+        self.session_changed = False
+        # Streamed query whose cursor is still open. Some drivers (e.g.
+        # MySQLdb's SSCursor) can't run other statements until it's closed.
+        self._stream = None
 
     @property
     def threadsafety(self):
@@ -339,6 +432,8 @@ class Connection(gobject.GObject):
             return '%s #%d' % (self.datasource.get_label(), self.num)
 
     def execute(self, sql):
+        self.last_used = time.time()
+        self.close_stream()
         cur = self.connection.cursor()
         cur.execute(sql)
         if cur.description:
@@ -347,8 +442,38 @@ class Connection(gobject.GObject):
     def get_dbapi_connection(self):
         return self.connection
 
+    def cancel(self):
+        """Cancel the statement currently running on this connection.
+
+        This method can be called from any thread. Returns ``True`` if a
+        cancel request was sent.
+        """
+        return self.datasource.backend.cancel(self)
+
+    def set_stream(self, query):
+        """Register *query* as the streamed query open on this connection.
+
+        Pass ``None`` to unregister it.
+        """
+        self._stream = query
+
+    def close_stream(self):
+        """Close the cursor of a streamed query still open on this connection.
+
+        The remaining rows of the query can't be fetched anymore.
+        """
+        query = self._stream
+        if query is not None:
+            query.close()
+        self._stream = None
+
     def close(self):
-        self.connection.close()
+        self.close_stream()
+        if self.datasource.pool is not None:
+            self.datasource.pool.release(self.connection,
+                                         self.session_changed)
+        else:
+            self.connection.close()
         self.emit('closed')
 
     def prepare_statement(self, sql):
@@ -357,6 +482,7 @@ class Connection(gobject.GObject):
 
     def execute_raw(self, sql):
         """Just for internal use!."""
+        self.close_stream()
         conn = self.connection
         cur = conn.cursor()
         cur.execute(sql)
@@ -472,6 +598,8 @@ class DatasourceManager(gobject.GObject):
                  datasource.ask_for_password)
         conf.set(datasource.id, 'startup_commands',
                  datasource.startup_commands or '')
+        conf.set(datasource.id, 'statement_timeout',
+                 datasource.statement_timeout or 0)
         conf.set(datasource.id, 'name', datasource.name or '')
         conf.set(datasource.id, 'description', datasource.description or '')
         conf.set(datasource.id, 'color', datasource.color or '')
@@ -497,6 +625,9 @@ class DatasourceManager(gobject.GObject):
         self.get_password_from_keyring(ds)
         ds.ask_for_password = conf.getboolean(id_, 'ask_for_password')
         ds.startup_commands = conf.get(id_, 'startup_commands') or None
+        if conf.has_option(id_, 'statement_timeout'):
+            ds.statement_timeout = (conf.getint(id_, 'statement_timeout')
+                                    or None)
         ds.name = conf.get(id_, 'name') or None
         ds.description = conf.get(id_, 'description') or None
         ds.color = conf.get(id_, 'color') or None
@@ -575,7 +706,35 @@ class DatasourceManager(gobject.GObject):
 
 
 class Query(gobject.GObject):
-    """Object representing a database query."""
+    """Object representing a database query.
+
+    While the query runs, the time spent in each phase is recorded in
+    :attr:`timings`, a dictionary mapping ``TIMING_*`` constants to
+    seconds:
+
+    ``TIMING_FIRST_ROW``
+      Time from the start of the execution until the first rows were
+      fetched.
+    ``TIMING_EXECUTE``
+      Time spent in the cursor's ``execute()``.
+    ``TIMING_FETCH``
+      Time spent fetching rows from the cursor.
+    ``TIMING_DECODE``
+      Time spent converting fetched rows for storage.
+    ``TIMING_MODEL``
+      Time spent building the grid's model and columns.
+    ``TIMING_PAINT``
+      Time from the grid setup until the results were first painted.
+
+    The last two phases are recorded by the user interface, the
+    ``rendered`` signal is emitted then. :attr:`rows_fetched` and
+    :attr:`bytes_fetched` hold the number of rows and the estimated
+    size of the rows fetched so far.
+
+    Rows of a streamed result may be fetched from another thread than
+    the one that closes the query, but only one thread at a time should
+    fetch them.
+    """
 
     __gsignals__ = {
         "started" : (gobject.SIGNAL_RUN_LAST,
@@ -583,26 +742,45 @@ class Query(gobject.GObject):
                      tuple()),
         "finished" : (gobject.SIGNAL_RUN_LAST,
                       gobject.TYPE_NONE,
-                      tuple())
+                      tuple()),
+        "rendered" : (gobject.SIGNAL_RUN_LAST,
+                      gobject.TYPE_NONE,
+                      tuple()),
     }
 
-    def __init__(self, statement, connection):
+    def __init__(self, statement, connection, page_size=None):
         """Constructor.
 
         :param statement: Raw SQL statement.
         :param connection: A database connection.
+        :param page_size: If given, the result is streamed. Only the first
+          *page_size* rows are fetched on execution, the remaining rows
+          can be fetched using :meth:`fetch_more` or :meth:`iter_rows`.
+          Defaults to ``None`` (fetch all rows at once).
         """
         self.__gobject_init__()
         self.connection = connection
         self.statement = self.connection.prepare_statement(statement)
+        self.page_size = page_size
+        self._cursor = None
+        self._cursor_lock = RLock()
+        self._position = 0
         self._parsed = None
         self.description = None
         self.rowcount = -1
         self.rows = None
+        # True when the last row of the result was fetched.
+        self.complete = False
         self.messages = []
         self.failed = False
         self.executed = False
+        self.cancelled = False
+        self.timed_out = False
         self.execution_time = None
+        self.timings = {}
+        self.rows_fetched = 0
+        self.bytes_fetched = 0
+        self._start = None
         self.coding_hint = "utf-8"
         self.errors = list()
         self.error_position = None
@@ -624,14 +802,32 @@ class Query(gobject.GObject):
             Emit(self, "started")
         else:
             self.emit("started")
-        start = time.time()
-        dbapi_conn = self.connection.get_dbapi_connection()
-        dbapi_cur = dbapi_conn.cursor()
+        start = self._start = time.time()
+        # A result still streamed from this connection would block the
+        # statement or fail with an error on some drivers.
+        self.connection.close_stream()
+        if self.page_size is not None:
+            dbapi_cur = backend.get_stream_cursor(self.connection, self,
+                                                  self.page_size)
+        else:
+            dbapi_conn = self.connection.get_dbapi_connection()
+            dbapi_cur = dbapi_conn.cursor()
         operational_error = getattr(backend.dbapi(), 'OperationalError',
                                     DummyDBAPIError)
         programming_error = getattr(backend.dbapi(), 'ProgrammingError',
                                     DummyDBAPIError)
         do_close = False
+        timer = None
+        if self.connection.client_timeout:
+            timer = Timer(self.connection.client_timeout, self._on_timeout)
+            timer.setDaemon(True)
+            timer.start()
+        if self.parsed.get_type() not in ('SELECT', 'INSERT', 'UPDATE',
+                                          'DELETE'):
+            # The connection isn't reused by the pool unless the backend
+            # can reset its session.
+            self.connection.session_changed = True
+        execute_start = time.time()
         try:
             dbapi_cur.execute(self.statement)
         except Exception, err:
@@ -646,8 +842,12 @@ class Query(gobject.GObject):
         except:
             self.failed = True
             self.errors.append(str(sys.exc_info()[1]))
+        if timer is not None:
+            timer.cancel()
         self.executed = True
         self.execution_time = time.time() - start
+        self.record_timing(TIMING_EXECUTE, time.time()-execute_start)
+        self.connection.last_used = time.time()
         if not self.failed:
             if hasattr(dbapi_cur, 'statusmessage'):
                 self.messages = [dbapi_cur.statusmessage]
@@ -655,8 +855,10 @@ class Query(gobject.GObject):
                 self.messages = []
             self.description = dbapi_cur.description
             self.rowcount = dbapi_cur.rowcount
-            if self.description:
-                self.rows = dbapi_cur.fetchall()
+            if self.page_size is not None:
+                self._fetch_first_page(dbapi_cur)
+            elif self.description:
+                self._fetch_all(dbapi_cur)
         self.connection.update_transaction_state()
         if threaded:
             Emit(self, "finished")
@@ -667,3 +869,197 @@ class Query(gobject.GObject):
         if do_close:
             logging.debug('Closing connection')
             gobject.idle_add(self.connection.close)
+
+    def cancel(self):
+        """Cancel the execution of this query.
+
+        This method can be called from any thread while :meth:`execute`
+        is running. The query fails then. Returns ``True`` if a cancel
+        request was sent.
+        """
+        if self.executed:
+            return False
+        self.cancelled = True
+        try:
+            return self.connection.cancel()
+        except:
+            logging.exception('Failed to cancel query:')
+            return False
+
+    def _on_timeout(self):
+        self.timed_out = True
+        self.cancel()
+
+    def record_timing(self, phase, seconds):
+        """Add *seconds* to the time spent in *phase*.
+
+        :param phase: One of the ``TIMING_*`` constants.
+        :param seconds: Duration in seconds.
+        """
+        self.timings[phase] = self.timings.get(phase, 0)+seconds
+
+    def get_timings(self):
+        """Return recorded timings as a list of (phase, seconds) tuples.
+
+        The phases are sorted in order of occurrence.
+        """
+        return [(phase, self.timings[phase]) for phase in TIMING_PHASES
+                if phase in self.timings]
+
+    def _fetchmany(self, dbapi_cur, size):
+        # Fetch rows and account them to the timings.
+        start = time.time()
+        rows = dbapi_cur.fetchmany(size)
+        now = time.time()
+        self.record_timing(TIMING_FETCH, now-start)
+        if rows:
+            if TIMING_FIRST_ROW not in self.timings:
+                self.timings[TIMING_FIRST_ROW] = now-self._start
+            self.rows_fetched += len(rows)
+            self.bytes_fetched += estimate_size(rows)
+        return rows
+
+    def _fetch_all(self, dbapi_cur):
+        # Rows are moved to a result store page by page, so that large
+        # results can be spilled to disk while fetching.
+        self.rows = ResultStore()
+        try:
+            while True:
+                rows = self._fetchmany(dbapi_cur, self.rows.page_size)
+                if not rows:
+                    break
+                start = time.time()
+                self.rows.extend(rows)
+                self.record_timing(TIMING_DECODE, time.time()-start)
+            self.complete = True
+        except:
+            self.failed = True
+            self.errors.append(str(sys.exc_info()[1]))
+
+    def _fetch_first_page(self, dbapi_cur):
+        # Server-side cursors (e.g. psycopg2 named cursors) don't have a
+        # description until the first rows are fetched.
+        if not self.description and getattr(dbapi_cur, 'name', None) is None:
+            return
+        try:
+            rows = self._fetchmany(dbapi_cur, self.page_size)
+            start = time.time()
+            self.rows = list(rows)
+            self.record_timing(TIMING_DECODE, time.time()-start)
+        except:
+            self.failed = True
+            self.errors.append(str(sys.exc_info()[1]))
+            return
+        self.description = dbapi_cur.description
+        self._position = len(self.rows)
+        if len(self.rows) >= self.page_size:
+            self._cursor = dbapi_cur
+            self.connection.set_stream(self)
+        else:
+            self.complete = True
+            dbapi_cur.close()
+
+    @property
+    def has_more(self):
+        """``True`` if a streamed result has rows left to fetch."""
+        return self._cursor is not None
+
+    def fetch_more(self, size=None):
+        """Fetch the next rows of a streamed result.
+
+        The rows are returned, but not added to :attr:`rows`. So it's up to
+        the caller to keep them as long as needed.
+
+        :param size: Number of rows to fetch (default: :attr:`page_size`).
+        :returns: A list of rows. The list is empty if there are no more
+          rows to fetch.
+        """
+        if size is None:
+            size = self.page_size
+        self._cursor_lock.acquire()
+        try:
+            if self._cursor is None:
+                return []
+            try:
+                rows = list(self._fetchmany(self._cursor, size))
+            except:
+                logging.exception('Query.fetch_more failed:')
+                self.errors.append(str(sys.exc_info()[1]))
+                self.close()
+                return []
+            self._position += len(rows)
+            if len(rows) < size:
+                self.complete = True
+                self.close()
+            return rows
+        finally:
+            self._cursor_lock.release()
+
+    def fetch_rows(self, offset, count):
+        """Return up to *count* rows of a streamed result starting at *offset*.
+
+        Rows behind the current cursor position are read again by
+        scrolling the cursor if the backend supports it. Otherwise an
+        empty list is returned, the caller has to keep the rows it needs
+        again.
+        """
+        first_page = self.rows or []
+        if offset + count <= len(first_page):
+            return first_page[offset:offset+count]
+        self._cursor_lock.acquire()
+        try:
+            if offset < self._position:
+                if not self._rewind(offset):
+                    return []
+            elif self._cursor is None:
+                return []
+            while self._position < offset:
+                skipped = self.fetch_more(min(offset-self._position,
+                                              self.page_size))
+                if not skipped:
+                    return []
+            return self.fetch_more(count)
+        finally:
+            self._cursor_lock.release()
+
+    def _rewind(self, offset):
+        backend = self.connection.datasource.backend
+        if (self._cursor is not None
+            and backend.scroll_cursor(self._cursor, offset)):
+            self._position = offset
+            return True
+        return False
+
+    def iter_rows(self):
+        """Iterate over all rows of the result.
+
+        For streamed results the rows are fetched page by page from the
+        cursor. Rows already returned by :meth:`fetch_more` are not
+        yielded again.
+        """
+        for row in self.rows or []:
+            yield row
+        while self.has_more:
+            for row in self.fetch_more():
+                yield row
+
+    def close(self):
+        """Close an open result cursor.
+
+        If a fetch is running in another thread, the cursor is closed
+        when it has finished.
+        """
+        self._cursor_lock.acquire()
+        try:
+            cursor = self._cursor
+            self._cursor = None
+        finally:
+            self._cursor_lock.release()
+        if cursor is None:
+            return
+        if self.connection._stream is self:
+            self.connection.set_stream(None)
+        try:
+            cursor.close()
+        except:
+            logging.exception('Failed to close cursor:')
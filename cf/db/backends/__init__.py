@@ -18,6 +18,9 @@
 
 """Database backends."""
 
+import csv
+import logging
+
 from cf.db import DIALECTS
 from cf.db import objects
 from cf.db import TRANSACTION_IDLE
@@ -26,6 +29,47 @@ from cf.db import TRANSACTION_ROLLBACK_ENABLED
 from cf.db.url import make_url, URL
 
 
+# Number of rows fetched per round-trip by Generic.bulk_export().
+BULK_EXPORT_BATCH_SIZE = 5000
+
+# Number of bytes between two progress callbacks during bulk exports.
+BULK_EXPORT_PROGRESS_INTERVAL = 1024*1024
+
+
+class _ProgressWriter(object):
+    """File-like wrapper that counts the bytes written to *fp*.
+
+    *progress* is called with the number of bytes written every
+    ``BULK_EXPORT_PROGRESS_INTERVAL`` bytes and by :meth:`finish`.
+    """
+
+    def __init__(self, fp, progress=None):
+        self._fp = fp
+        self._progress = progress
+        self._reported = 0
+        self.written = 0
+
+    def write(self, data):
+        self._fp.write(data)
+        self.written += len(data)
+        if (self._progress is not None
+            and self.written-self._reported >= BULK_EXPORT_PROGRESS_INTERVAL):
+            self._reported = self.written
+            self._progress(self.written)
+
+    def finish(self):
+        if self._progress is not None:
+            self._progress(self.written)
+        return self.written
+
+
+def _encode_csv_value(value, encoding):
+    # The csv module can't handle unicode objects.
+    if isinstance(value, unicode):
+        return value.encode(encoding)
+    return value
+
+
 class GUIOption(object):
 
     WIDGET_PASSWORD = 'password'
@@ -58,6 +102,11 @@ DEFAULT_OPTIONS = (
 class Generic(object):
 
     drivername = None
+    # Statement used to check if a pooled connection is still alive.
+    ping_statement = 'SELECT 1'
+    # Physical connections can be reused by the connection pool and
+    # connections opened from other threads see the same database.
+    supports_pooling = True
 
     @classmethod
     def get_options(cls):
@@ -138,14 +187,125 @@ class Generic(object):
         conn = self.dbapi().connect(*args, **kwds)
         return conn
 
-    def prepare_connection(self, dbapi_connection):
-        """Prepares the DB-API2 connection.
+    def prepare_connection(self, connection):
+        """Prepares a connection.
 
         This method can be overwritten by backend implementations and is
-        called after the DB-API2 connection is opened. The default
-        implementation does nothing.
+        called with a :class:`~cf.db.Connection` after the DB-API2
+        connection is opened. The default implementation applies the
+        statement timeout of the data source, implementations should
+        call it.
         """
-        pass
+        timeout = connection.datasource.statement_timeout
+        if timeout and not self.set_statement_timeout(connection, timeout):
+            # Fall back to cancelling the statement from the client.
+            connection.client_timeout = timeout
+
+    def reset_connection(self, dbapi_connection):
+        """Reset a DB-API2 connection before it's reused by the pool.
+
+        Returns ``True`` if the session state (e.g. variables, the
+        search path or temporary tables) was reset. The connection is
+        then prepared and the startup commands are executed again before
+        it's reused. The default implementation rolls back the current
+        transaction and returns ``False``. Connections that executed
+        statements changing the session are closed then.
+        """
+        dbapi_connection.rollback()
+        return False
+
+    def set_statement_timeout(self, connection, seconds):
+        """Let the server stop statements running longer than *seconds*.
+
+        Returns ``True`` if the timeout was applied. The default
+        implementation returns ``False``, the statements are then
+        cancelled using :meth:`cancel` when the timeout is exceeded.
+        """
+        return False
+
+    def cancel(self, connection):
+        """Cancel the statement currently running on a connection.
+
+        This method is called from a different thread than the one
+        executing the statement. Returns ``True`` if a cancel request
+        was sent. The default implementation returns ``False``, i.e.
+        the backend doesn't support cancelling statements.
+        """
+        return False
+
+    def check_connection(self, dbapi_connection):
+        """Return ``True`` if a DB-API2 connection is still usable.
+
+        This method is called before a pooled connection is reused. The
+        default implementation executes :attr:`ping_statement`.
+        """
+        try:
+            cursor = dbapi_connection.cursor()
+            cursor.execute(self.ping_statement)
+            cursor.fetchall()
+            cursor.close()
+        except:
+            logging.debug('Connection check failed', exc_info=True)
+            return False
+        return True
+
+    def get_stream_cursor(self, connection, query, page_size):
+        """Return a DB-API2 cursor to stream the results of a query.
+
+        Backend implementations can overwrite this method to use
+        server-side cursors. The default implementation returns a regular
+        cursor with ``arraysize`` set to *page_size*, rows are fetched
+        using ``fetchmany()``. Some drivers (e.g. cx_Oracle) use
+        ``arraysize`` as the number of rows transferred per round-trip.
+        """
+        cursor = connection.get_dbapi_connection().cursor()
+        cursor.arraysize = page_size
+        return cursor
+
+    def scroll_cursor(self, cursor, offset):
+        """Move a stream cursor to the absolute row *offset*.
+
+        Returns ``True`` if the cursor was moved. The default implementation
+        returns ``False``, i.e. the cursor can't be scrolled backwards.
+        """
+        return False
+
+    def bulk_export(self, query, fp, progress=None):
+        """Write the complete result of a query as CSV to a file.
+
+        *query* is a :class:`~cf.db.Query` that hasn't been executed yet,
+        *fp* is a file object opened for writing. *progress* is called
+        with the number of bytes written so far. Returns the number of
+        bytes written.
+
+        Only SELECT statements can be exported, other statements would
+        be executed a second time. A ``RuntimeError`` is raised for them.
+
+        The default implementation streams the rows in batches of
+        ``BULK_EXPORT_BATCH_SIZE`` through the csv module. Backends should
+        overwrite this method if the database has a native bulk path.
+        """
+        if query.parsed.get_type() != 'SELECT':
+            raise RuntimeError('Only SELECT statements can be exported'
+                               ' directly from the database')
+        writer = _ProgressWriter(fp, progress)
+        cursor = self.get_stream_cursor(query.connection, query,
+                                        BULK_EXPORT_BATCH_SIZE)
+        try:
+            cursor.execute(query.statement)
+            out = csv.writer(writer)
+            out.writerow([_encode_csv_value(col[0], query.coding_hint)
+                          for col in cursor.description])
+            while True:
+                rows = cursor.fetchmany(BULK_EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                out.writerows([_encode_csv_value(value, query.coding_hint)
+                               for value in row]
+                              for row in rows)
+        finally:
+            cursor.close()
+        return writer.finish()
 
     def get_server_info(self, connection):
         """Return human-readable server version info."""
@@ -173,6 +333,69 @@ class Generic(object):
         """Refresh child objects for parent."""
         pass
 
+    def refresh_many(self, collections, meta, connection):
+        """Refresh child objects for many collections at once.
+
+        All collections in *collections* have the same ``typeid``, e.g.
+        the column collections of all tables referenced in a statement.
+        Backends should overwrite this method to fetch the children of
+        all collections with one set-based query per type. The default
+        implementation calls :meth:`refresh` for each collection.
+        """
+        for coll in collections:
+            self.refresh(coll, meta, connection)
+
+    def get_catalog_phases(self):
+        """Return the phases of the initial catalog.
+
+        Phases are independent parts of the catalog, e.g. relations and
+        functions. They're fetched concurrently on separate connections,
+        each phase is passed to :meth:`get_catalog`. The default
+        implementation returns ``[None]``, i.e. the catalog is fetched
+        at once.
+        """
+        return [None]
+
+    def get_catalog(self, connection, keys=None, phase=None):
+        """Return the catalog rows used to build initial meta information.
+
+        Backends supporting the meta cache return a list of dictionaries
+        here and build the objects in :meth:`load_catalog`. If *keys* is
+        given, only the rows for these catalog keys are returned. If
+        *phase* is given, only the rows for this phase (see
+        :meth:`get_catalog_phases`) are returned.
+
+        The default implementation returns ``None``, then
+        :meth:`initialize` is used and nothing is cached.
+        """
+        return None
+
+    def get_catalog_state(self, connection):
+        """Return a dictionary mapping catalog keys to change tokens.
+
+        This should be a cheap query. A catalog key whose token differs
+        from the cached one is loaded again using :meth:`get_catalog`.
+        Rows with keys not mentioned here are never refreshed. The
+        default implementation returns ``None``.
+        """
+        return None
+
+    def get_catalog_key(self, row):
+        """Return the catalog key for a row returned by get_catalog()."""
+        raise NotImplementedError
+
+    def load_catalog(self, meta, connection, rows):
+        """Create or update meta objects from catalog rows.
+
+        Rows may be given in any order and objects may already exist
+        from an earlier call.
+        """
+        pass
+
+    def get_catalog_objects(self, meta, key):
+        """Return the objects to remove when a catalog key was dropped."""
+        return []
+
     def get_transaction_state(self, connection):
         """Determine transaction state for connection.
 
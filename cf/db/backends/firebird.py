@@ -25,6 +25,7 @@ from cf.db.backends import Generic, DEFAULT_OPTIONS
 class Firebird(Generic):
 
     drivername = 'firebird'
+    ping_statement = 'SELECT 1 FROM rdb$database'
 
     @classmethod
     def dbapi(cls):
@@ -24,6 +24,7 @@ from cf.db.backends import Generic, DEFAULT_OPTIONS
 class Informix(Generic):
 
     drivername = 'informix'
+    ping_statement = 'SELECT 1 FROM systables WHERE tabid = 1'
 
     @classmethod
     def dbapi(cls):
@@ -23,6 +23,7 @@ from cf.db.backends import Generic, DEFAULT_OPTIONS
 class MaxDB(Generic):
 
     drivername = 'maxdb'
+    ping_statement = 'SELECT 1 FROM dual'
 
     @classmethod
     def dbapi(cls):
@@ -18,6 +18,7 @@
 
 """MySQL backend"""
 
+import logging
 import re
 
 from cf.db import objects
@@ -117,13 +118,93 @@ class MySQL(Generic):
     def get_server_info(self, connection):
         return 'MySQL %s' % connection.connection.get_server_info()
 
+    def set_statement_timeout(self, connection, seconds):
+        # max_execution_time was added in MySQL 5.7.8 and applies to
+        # SELECT statements only.
+        try:
+            connection.execute('SET SESSION max_execution_time = %d'
+                               % (seconds*1000))
+        except self.dbapi().Error:
+            logging.debug('Failed to set statement timeout', exc_info=True)
+            return False
+        return True
+
+    def cancel(self, connection):
+        # The connection is busy, so the query is killed from a second
+        # connection.
+        thread_id = connection.get_dbapi_connection().thread_id()
+        conn = self.get_connection(connection.datasource.url)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('KILL QUERY %d' % thread_id)
+            cursor.close()
+        finally:
+            conn.close()
+        return True
+
+    def get_stream_cursor(self, connection, query, page_size):
+        # SSCursor leaves the result set on the server. Note that the
+        # connection can't execute other statements until the cursor
+        # is exhausted or closed.
+        import MySQLdb.cursors
+        conn = connection.get_dbapi_connection()
+        cursor = conn.cursor(MySQLdb.cursors.SSCursor)
+        cursor.arraysize = page_size
+        return cursor
+
     def initialize(self, meta, connection):
-        schemata = objects.Schemata(meta)
-        users = objects.Users(meta)
-        meta.set_object(schemata)
-        meta.set_object(users)
-        for item in self._query(connection, INITIAL_SQL):
+        self.load_catalog(meta, connection, self.get_catalog(connection))
+
+    def _quote(self, value):
+        return "'%s'" % value.replace('\\', '\\\\').replace("'", "''")
+
+    def get_catalog(self, connection, keys=None, phase=None):
+        if keys is None:
+            return self._query(connection, INITIAL_SQL)
+        ids = {}
+        for kind, id_ in keys:
+            ids.setdefault(kind, []).append(self._quote(id_))
+        conditions = []
+        if 'schema' in ids:
+            conditions.append("(type = 'schema' and id in (%s))"
+                              % ', '.join(ids['schema']))
+        if 'table' in ids:
+            conditions.append("(type <> 'schema' and id in (%s))"
+                              % ', '.join(ids['table']))
+        sql = ('select * from (%s) y where %s order by pos asc'
+               % (INITIAL_SQL, ' or '.join(conditions)))
+        return self._query(connection, sql)
+
+    def get_catalog_state(self, connection):
+        state = {}
+        for item in self._query(connection, CATALOG_STATE_SQL):
+            state[(item['kind'], item['id'])] = item['token']
+        return state
+
+    def get_catalog_key(self, row):
+        if row['type'] == 'schema':
+            return ('schema', row['id'])
+        return ('table', row['id'])
+
+    def get_catalog_objects(self, meta, key):
+        kind, id_ = key
+        if kind == 'schema':
+            return meta.find(oid=id_, cls=objects.Schema)
+        return meta.find(oid=id_, cls=(objects.Table, objects.View))
+
+    def load_catalog(self, meta, connection, rows):
+        schemata = meta.find_exact(cls=objects.Schemata)
+        if schemata is None:
+            schemata = objects.Schemata(meta)
+            users = objects.Users(meta)
+            meta.set_object(schemata)
+            meta.set_object(users)
+        for item in sorted(rows, key=lambda row: row['pos']):
             if item['type'] == 'schema':
+                schema = meta.find_exact(cls=objects.Schema, oid=item['id'])
+                if schema is not None:
+                    schema.name = item['name']
+                    continue
                 schema = objects.Schema(meta, parent=schemata,
                                         oid=item['id'], name=item['name'],
                                         comment=item['description'])
@@ -144,47 +225,96 @@ class MySQL(Generic):
                 else:
                     cls = objects.View
                     parent = meta.find_exact(cls=objects.Views, parent=schema)
-                obj = cls(meta, parent=parent, oid=item['id'],
-                          name=item['name'], comment=item['description'],
-                          schema=schema)
+                obj = meta.find_exact(cls=(objects.Table, objects.View),
+                                      oid=item['id'])
+                if obj is not None and not isinstance(obj, cls):
+                    meta.remove_object(obj)
+                    obj = None
+                if obj is None:
+                    obj = cls(meta, parent=parent, oid=item['id'],
+                              name=item['name'], comment=item['description'],
+                              schema=schema)
+                else:
+                    # Changed since the cache was written.
+                    obj.name = item['name']
+                    obj.comment = item['description']
+                    obj.columns.props.refresh_required = True
                 meta.set_object(obj)
 
-            if item['type'] == 'column':
-                parent = meta.find_exact(oid=item['parent'])
-                col = objects.Column(meta, parent=parent.columns,
-                                     oid=item['id'],
-                                     name=item['name'],
-                                     comment=item['description'])
-                meta.set_object(col)
-
     def _query(self, connection, sql):
         return connection.execute_raw(sql)
 
     def refresh(self, obj, meta, connection):
         if obj.typeid == 'users':
             self._refresh_users(obj, meta, connection)
-        elif obj.typeid == 'constraints':
-            self._refresh_constraints(obj, meta, connection)
-
-    def _refresh_constraints(self, coll, meta, connection):
-        sql = ("select lower(concat(table_schema, '.', table_name)) as parent,"
-               "lower(concat(table_schema, '.', table_name, '.',"
-               " constraint_name)) as id,"
-               " case when constraint_type = 'PRIMARY KEY'"
-               " then constraint_type"
-               " else concat(constraint_type, ' (', constraint_name, ')')"
-               " end as name"
-               " from information_schema.table_constraints"
-               " where lower(table_name) = '%s'"
-               "  and lower(table_schema) = '%s'"
-               % (coll.parent.name.lower(),
-                  coll.parent.parent.parent.name.lower()))
+        elif obj.typeid in ('columns', 'constraints'):
+            self.refresh_many([obj], meta, connection)
+
+    def refresh_many(self, collections, meta, connection):
+        typeid = collections[0].typeid
+        if typeid == 'columns':
+            # Columns of constraints aren't loaded here.
+            collections = [coll for coll in collections
+                           if isinstance(coll.parent, (objects.Table,
+                                                       objects.View))]
+            refresh_func = self._refresh_columns
+        elif typeid == 'constraints':
+            refresh_func = self._refresh_constraints
+        else:
+            return Generic.refresh_many(self, collections, meta, connection)
+        for offset in xrange(0, len(collections), REFRESH_BATCH_SIZE):
+            batch = collections[offset:offset+REFRESH_BATCH_SIZE]
+            refresh_func(batch, meta, connection)
+
+    def _get_table_conditions(self, collections):
+        """Returns a mapping of table IDs to collections and a condition."""
+        by_table = {}
+        conditions = []
+        for coll in collections:
+            table = coll.parent
+            by_table[table.oid] = coll
+            conditions.append("(table_schema = %s and table_name = %s)"
+                              % (self._quote(table.schema.name),
+                                 self._quote(table.name)))
+        return by_table, ' or '.join(conditions)
+
+    def _refresh_columns(self, collections, meta, connection):
+        by_table, condition = self._get_table_conditions(collections)
+        sql = COLUMNS_SQL % condition
+        seen = set()
+        for item in self._query(connection, sql):
+            coll = by_table.get(item['parent'])
+            if coll is None:
+                continue
+            col = meta.find_exact(cls=objects.Column, parent=coll,
+                                  oid=item['id'])
+            if col is None:
+                col = objects.Column(meta, parent=coll, oid=item['id'])
+                meta.set_object(col)
+            col.name = item['name']
+            col.comment = item['description']
+            col.sortorder = item['pos']
+            col.type = item['data_type']
+            col.default = item['column_default']
+            col.nullable = item['is_nullable'] == 'YES'
+            col.pk = item['column_key'] == 'PRI'
+            seen.add(col)
+        # Remove dropped columns.
+        for coll in collections:
+            for col in meta.find(cls=objects.Column, parent=coll):
+                if col not in seen:
+                    meta.remove_object(col)
+
+    def _refresh_constraints(self, collections, meta, connection):
+        by_table, condition = self._get_table_conditions(collections)
+        sql = CONSTRAINTS_SQL % condition
         for item in self._query(connection, sql):
-            con = meta.find_exact(oid=item['id'],
-                                  parent=coll.parent.constraints)
+            coll = by_table.get(item['parent'])
+            if coll is None:
+                continue
+            con = meta.find_exact(oid=item['id'], parent=coll)
             if con is None:
-                con = objects.Constraint(meta, parent=coll.parent.constraints,
-                                         oid=item['id'])
+                con = objects.Constraint(meta, parent=coll, oid=item['id'])
                 meta.set_object(con)
             con.name = item['name']
 
@@ -209,10 +339,42 @@ select lower(concat(table_schema, '.', table_name)) as id,
 table_name as name, table_comment as description, table_type as type,
 lower(table_schema) as parent, 1 as pos
 from information_schema.tables
-union
-select lower(concat(table_schema, '.', table_name, '.', column_name)) as id,
-column_name as name, column_comment as description, 'column' as type,
-lower(concat(table_schema, '.', table_name)) as parent, 3 as pos
-from information_schema.columns
 ) x order by pos asc
 """
+
+# Children are loaded on demand for up to REFRESH_BATCH_SIZE tables at once.
+REFRESH_BATCH_SIZE = 100
+
+COLUMNS_SQL = """select
+lower(concat(table_schema, '.', table_name, '.', column_name)) as id,
+lower(concat(table_schema, '.', table_name)) as parent,
+column_name as name, column_comment as description,
+ordinal_position as pos, column_type as data_type, column_default,
+is_nullable, column_key
+from information_schema.columns
+where %s
+order by table_schema, table_name, ordinal_position
+"""
+
+CONSTRAINTS_SQL = """select
+lower(concat(table_schema, '.', table_name)) as parent,
+lower(concat(table_schema, '.', table_name, '.', constraint_name)) as id,
+case when constraint_type = 'PRIMARY KEY'
+then constraint_type
+else concat(constraint_type, ' (', constraint_name, ')')
+end as name
+from information_schema.table_constraints
+where %s
+"""
+
+# Cheap query to detect catalog changes. create_time changes on ALTER
+# TABLE, update_time (if available) when data is modified.
+CATALOG_STATE_SQL = """
+select 'schema' as kind, lower(schema_name) as id, '' as token
+from information_schema.schemata
+union all
+select 'table', lower(concat(table_schema, '.', table_name)),
+concat(table_type, '/', ifnull(create_time, ''), '/',
+ifnull(update_time, ''))
+from information_schema.tables
+"""
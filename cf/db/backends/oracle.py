@@ -25,6 +25,7 @@ from cf.db.backends import Generic, GUIOption
 class Oracle(Generic):
 
     drivername = 'oracle'
+    ping_statement = 'SELECT 1 FROM dual'
 
     @classmethod
     def dbapi(cls):
@@ -112,6 +113,18 @@ class Oracle(Generic):
     def get_server_info(self, connection):
         return 'Oracle %s' % connection.connection.version
 
+    def set_statement_timeout(self, connection, seconds):
+        # Round-trip timeouts require cx_Oracle 7 and Oracle Client 18.
+        dbapi_conn = connection.get_dbapi_connection()
+        if not hasattr(dbapi_conn, 'callTimeout'):
+            return False
+        dbapi_conn.callTimeout = seconds*1000
+        return True
+
+    def cancel(self, connection):
+        connection.get_dbapi_connection().cancel()
+        return True
+
     def prepare_statement(self, sql):
         # See issue50: cx_Oracle requires str or None for cursor.execute().
         sql = str(sql)
@@ -135,7 +148,6 @@ class Oracle(Generic):
         users = objects.Users(meta)
         meta.set_object(schemata)
         meta.set_object(users)
-        tbl_cache = {}  # speed up object creation
         for item in self._query(connection, INITIAL_SQL):
             if item['TYPE'] == 'schema':
                 schema = objects.Schema(meta, oid=item['ID'],
@@ -162,36 +174,85 @@ class Oracle(Generic):
                 obj = cls(meta, parent=parent, oid=item['ID'],
                           name=item['NAME'], comment=item['DESCRIPTION'])
                 meta.set_object(obj)
-                tbl_cache[item['ID']] = obj
                 if item['TYPE'] == 'table':
                     obj.indexes = objects.Indexes(meta, parent=obj)
                     meta.set_object(obj.indexes)
                 obj.triggers = objects.Triggers(meta, parent=obj)
                 meta.set_object(obj.triggers)
 
-            if item['TYPE'] == 'column':
-                parent = tbl_cache.get(item['PARENT'])
-                if parent is None:
-                    continue
-                col = objects.Column(meta, parent=parent.columns,
-                                     oid=item['ID'],
-                                     name=item['NAME'],
-                                     comment=item['DESCRIPTION'])
-                meta.set_object(col)
-
 
     def refresh(self, obj, meta, connection):
         if obj.typeid == 'users':
             self._refresh_users(obj, meta, connection)
-        elif obj.typeid == 'constraints':
-            self._refresh_constraints(obj, meta, connection)
-        elif obj.typeid == 'indexes':
-            self._refresh_indexes(obj, meta, connection)
-        elif obj.typeid == 'triggers':
-            self._refresh_triggers(obj, meta, connection)
+        elif obj.typeid in ('columns', 'constraints', 'indexes', 'triggers'):
+            self.refresh_many([obj], meta, connection)
         elif obj.typeid == 'sequences':
             self._refresh_sequences(obj, meta, connection)
 
+    def _quote(self, value):
+        return "'%s'" % value.replace("'", "''")
+
+    def refresh_many(self, collections, meta, connection):
+        typeid = collections[0].typeid
+        if typeid == 'columns':
+            # Columns of constraints aren't loaded here.
+            collections = [coll for coll in collections
+                           if isinstance(coll.parent, (objects.Table,
+                                                       objects.View))]
+            refresh_func = self._refresh_columns
+        elif typeid == 'constraints':
+            refresh_func = self._refresh_constraints
+        elif typeid == 'indexes':
+            refresh_func = self._refresh_indexes
+        elif typeid == 'triggers':
+            refresh_func = self._refresh_triggers
+        else:
+            return Generic.refresh_many(self, collections, meta, connection)
+        # Oracle allows up to 1000 expressions in a list.
+        for offset in xrange(0, len(collections), REFRESH_BATCH_SIZE):
+            batch = collections[offset:offset+REFRESH_BATCH_SIZE]
+            refresh_func(batch, meta, connection)
+
+    def _get_table_ids(self, collections):
+        """Returns a mapping of table IDs to collections and a list."""
+        by_table = {}
+        for coll in collections:
+            by_table[coll.parent.oid] = coll
+        return by_table, ', '.join(self._quote(oid) for oid in by_table)
+
+    def _refresh_columns(self, collections, meta, connection):
+        by_table = {}
+        conditions = []
+        for coll in collections:
+            table = coll.parent
+            schema = table.parent.parent
+            by_table[table.oid] = coll
+            conditions.append("(t.owner = %s and t.table_name = %s)"
+                              % (self._quote(schema.name),
+                                 self._quote(table.name)))
+        sql = COLUMNS_SQL % ' or '.join(conditions)
+        seen = set()
+        for item in self._query(connection, sql):
+            coll = by_table.get(item['PARENT'])
+            if coll is None:
+                continue
+            col = meta.find_exact(cls=objects.Column, parent=coll,
+                                  oid=item['ID'])
+            if col is None:
+                col = objects.Column(meta, parent=coll, oid=item['ID'])
+                meta.set_object(col)
+            col.name = item['NAME']
+            col.comment = item['DESCRIPTION']
+            col.sortorder = item['POS']
+            col.type = item['DATA_TYPE']
+            col.nullable = item['NULLABLE'] == 'Y'
+            seen.add(col)
+        # Remove dropped columns.
+        for coll in collections:
+            for col in meta.find(cls=objects.Column, parent=coll):
+                if col not in seen:
+                    meta.remove_object(col)
+
     def _refresh_users(self, coll, meta, connection):
         sql = "select username from sys.all_users"
         for item in self._query(connection, sql):
@@ -203,49 +264,43 @@ class Oracle(Generic):
                 meta.set_object(u)
                 u.props.has_children = False
 
-    def _refresh_constraints(self, coll, meta, connection):
+    def _refresh_table_children(self, collections, meta, connection,
+                                sql, cls):
+        by_table, ids = self._get_table_ids(collections)
+        for item in self._query(connection, sql % ids):
+            coll = by_table[item['PARENT']]
+            obj = meta.find_exact(parent=coll, oid=item['ID'])
+            if obj is None:
+                obj = cls(meta, parent=coll, oid=item['ID'])
+                meta.set_object(obj)
+            obj.name = item['NAME']
+            obj.props.has_children = False
+
+    def _refresh_constraints(self, collections, meta, connection):
         sql = ("select lower(owner||'.'||constraint_name) as id,"
+               " lower(owner||'.'||table_name) as parent,"
                " constraint_name as name"
                " from sys.all_constraints"
-               " where lower(owner||'.'||table_name) = '%s'"
-               % coll.parent.oid)
-        for item in self._query(connection, sql):
-            con = meta.find_exact(parent=coll, oid=item['ID'])
-            if con is None:
-                con = objects.Constraint(meta, parent=coll,
-                                         oid=item['ID'])
-                meta.set_object(con)
-            con.name = item['NAME']
-            con.pros.has_children = False
-
-    def _refresh_indexes(self, coll, meta, connection):
+               " where lower(owner||'.'||table_name) in (%s)")
+        self._refresh_table_children(collections, meta, connection,
+                                     sql, objects.Constraint)
+
+    def _refresh_indexes(self, collections, meta, connection):
         sql = ("select lower(owner||'.'||index_name) as id,"
+               " lower(owner||'.'||table_name) as parent,"
                " index_name as name from sys.all_indexes"
-               " where lower(owner||'.'||table_name) = '%s'"
-               % coll.parent.oid)
-        for item in self._query(connection, sql):
-            con = meta.find_exact(parent=coll, oid=item['ID'])
-            if con is None:
-                con = objects.Index(meta, parent=coll,
-                                    oid=item['ID'])
-                meta.set_object(con)
-            con.name = item['NAME']
-            con.props.has_children = False
-
-    def _refresh_triggers(self, coll, meta, connection):
+               " where lower(owner||'.'||table_name) in (%s)")
+        self._refresh_table_children(collections, meta, connection,
+                                     sql, objects.Index)
+
+    def _refresh_triggers(self, collections, meta, connection):
         sql = ("select lower(owner||'.'||trigger_name) as id,"
+               " lower(owner||'.'||table_name) as parent,"
                " trigger_name as name"
                " from sys.all_triggers"
-               " where lower(owner||'.'||table_name) = '%s'"
-               % coll.parent.oid)
-        for item in self._query(connection, sql):
-            con = meta.find_exact(parent=coll, oid=item['ID'])
-            if con is None:
-                con = objects.Trigger(meta, parent=coll,
-                                      oid=item['ID'])
-                meta.set_object(con)
-            con.name = item['NAME']
-            con.props.has_children = False
+               " where lower(owner||'.'||table_name) in (%s)")
+        self._refresh_table_children(collections, meta, connection,
+                                     sql, objects.Trigger)
 
     def _refresh_sequences(self, coll, meta, connection):
         sql = ("select lower(sequence_owner||'.'||sequence_name) as id,"
@@ -290,14 +345,18 @@ from sys.all_views t
 left join all_tab_comments c on c.owner = t.owner
 and c.table_name = t.view_name
 and c.table_type = 'VIEW'
+) x order by pos, name"""
 
-union
+# Children are loaded on demand for up to REFRESH_BATCH_SIZE tables at once.
+REFRESH_BATCH_SIZE = 100
 
-select
+COLUMNS_SQL = """select
 lower(t.owner||'.'||t.table_name||'.'||t.column_name) as id,
 lower(t.owner||'.'||t.table_name) as parent,
-t.column_name as name, c.comments as description, 'column' as type, 4 as pos
+t.column_name as name, c.comments as description,
+t.column_id as pos, t.data_type, t.nullable
 from sys.all_tab_columns t
 left join sys.all_col_comments c on c.owner = t.owner
 and c.table_name = t.table_name and c.column_name = t.column_name
-) x order by pos, name"""
+where %s
+order by t.owner, t.table_name, t.column_id"""
@@ -24,6 +24,7 @@ from cf.db import TRANSACTION_IDLE
 from cf.db import TRANSACTION_COMMIT_ENABLED
 from cf.db import TRANSACTION_ROLLBACK_ENABLED
 from cf.db.backends import Generic, DEFAULT_OPTIONS, GUIOption
+from cf.db.backends import _ProgressWriter
 from cf.db import objects
 
 
@@ -113,10 +114,72 @@ class Postgres(Generic):
         import psycopg2.extensions as pe
         level = pe.ISOLATION_LEVEL_AUTOCOMMIT
         connection.connection.set_isolation_level(level)
+        super(Postgres, self).prepare_connection(connection)
+
+    def reset_connection(self, dbapi_connection):
+        # rollback() doesn't end transactions started with BEGIN in
+        # autocommit mode.
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('ROLLBACK')
+            cursor.execute('DISCARD ALL')
+        finally:
+            cursor.close()
+        return True
+
+    def set_statement_timeout(self, connection, seconds):
+        connection.execute('SET statement_timeout = %d' % (seconds*1000))
+        return True
+
+    def cancel(self, connection):
+        # Requires psycopg2 2.3 or later.
+        dbapi_conn = connection.get_dbapi_connection()
+        if not hasattr(dbapi_conn, 'cancel'):
+            return False
+        dbapi_conn.cancel()
+        return True
 
     def get_server_info(self, connection):
         return connection.execute('select version()')[0][0]
 
+    def get_stream_cursor(self, connection, query, page_size):
+        # Named cursors can only be declared for SELECT statements.
+        if query.parsed.get_type() != 'SELECT':
+            return super(Postgres, self).get_stream_cursor(connection, query,
+                                                           page_size)
+        conn = connection.get_dbapi_connection()
+        # The connection is in autocommit mode, so the cursor needs to
+        # survive the end of the implicit transaction.
+        cursor = conn.cursor('cf_stream_%x' % id(query), withhold=True)
+        cursor.arraysize = page_size
+        return cursor
+
+    def bulk_export(self, query, fp, progress=None):
+        # COPY only accepts queries, the default implementation refuses
+        # other statements.
+        if query.parsed.get_type() != 'SELECT':
+            return super(Postgres, self).bulk_export(query, fp, progress)
+        writer = _ProgressWriter(fp, progress)
+        # The newline ends a trailing "-- comment" in the statement.
+        sql = 'COPY (%s\n) TO STDOUT WITH CSV HEADER' % (
+            query.statement.strip().rstrip(';'))
+        cursor = query.connection.get_dbapi_connection().cursor()
+        try:
+            cursor.copy_expert(sql, writer)
+        finally:
+            cursor.close()
+        return writer.finish()
+
+    def scroll_cursor(self, cursor, offset):
+        if cursor.name is None:
+            return False
+        try:
+            cursor.scroll(offset, mode='absolute')
+        except self.dbapi().Error:
+            # Not all plans support backward scans.
+            return False
+        return True
+
     def _query(self, connection, sql):
         return connection.execute_raw(sql)
 
@@ -131,14 +194,82 @@ class Postgres(Generic):
         return search_path
 
     def initialize(self, meta, connection):
-        schemata = objects.Schemata(meta)
-        users = objects.Users(meta)
-        languages = objects.Languages(meta)
-        meta.set_object(schemata)
-        meta.set_object(users)
-        meta.set_object(languages)
+        self.load_catalog(meta, connection, self.get_catalog(connection))
+
+    def get_catalog_phases(self):
+        return [phase for phase, sql in PG_CATALOG_PHASES]
+
+    def get_catalog(self, connection, keys=None, phase=None):
+        if keys is None:
+            if phase is not None:
+                return self._query(connection,
+                                   dict(PG_CATALOG_PHASES)[phase])
+            return self._query(connection, PG_INITIAL_SQL)
+        oids = {}
+        for kind, oid in keys:
+            oids.setdefault(kind, []).append('%d' % oid)
+        conditions = []
+        for kind, objtypes, column in (
+            ('rel', "'table', 'view', 'sequence'", 'reloid'),
+            ('proc', "'function'", 'reloid'),
+            ('lang', "'language'", 'reloid'),
+            ('user', "'user'", 'reloid'),
+            # Rows of a renamed schema.
+            ('nsp', "'table', 'view', 'sequence', 'function'", 'nspoid')):
+            if kind in oids:
+                conditions.append('(objtype IN (%s) AND %s IN (%s))'
+                                  % (objtypes, column,
+                                     ', '.join(oids[kind])))
+        sql = ('SELECT * FROM (%s) cat WHERE %s'
+               % (PG_INITIAL_SQL, ' OR '.join(conditions)))
+        return self._query(connection, sql)
+
+    def get_catalog_state(self, connection):
+        state = {}
+        for item in self._query(connection, PG_CATALOG_STATE_SQL):
+            state[(item['kind'], item['oid'])] = item['token']
+        return state
+
+    def get_catalog_key(self, row):
+        if row['objtype'] in ('table', 'view', 'sequence'):
+            return ('rel', row['reloid'])
+        elif row['objtype'] == 'function':
+            return ('proc', row['reloid'])
+        elif row['objtype'] == 'language':
+            return ('lang', row['reloid'])
+        elif row['objtype'] == 'user':
+            return ('user', row['reloid'])
+        return ('nsp', row['nspoid'])
+
+    def get_catalog_objects(self, meta, key):
+        kind, oid = key
+        if kind == 'rel':
+            cls = (objects.Table, objects.View, objects.Sequence)
+        elif kind == 'proc':
+            cls = objects.Function
+        elif kind == 'lang':
+            cls = objects.Language
+        elif kind == 'user':
+            cls = objects.User
+        else:
+            cls = objects.Schema
+        return meta.find(oid=oid, cls=cls)
+
+    def load_catalog(self, meta, connection, rows):
+        schemata = meta.find_exact(cls=objects.Schemata)
+        if schemata is None:
+            schemata = objects.Schemata(meta)
+            users = objects.Users(meta)
+            languages = objects.Languages(meta)
+            meta.set_object(schemata)
+            meta.set_object(users)
+            meta.set_object(languages)
+        else:
+            users = meta.find_exact(cls=objects.Users)
+            languages = meta.find_exact(cls=objects.Languages)
         search_path = self._get_search_path(connection)
-        for item in self._query(connection, PG_INITIAL_SQL):
+        stale_schemas = set()
+        for item in rows:
             if item['nspoid'] is not None:
                 schema = meta.find_exact(oid=item['nspoid'],
                                               cls=objects.Schema,
@@ -154,6 +285,8 @@ class Postgres(Generic):
                     meta.set_object(schema)
                     funcs = objects.Functions(meta, parent=schema)
                     meta.set_object(funcs)
+                elif schema.name != item['nspname']:
+                    schema.name = item['nspname']
             else:
                 schema = None
             if item['objtype'] in ('table', 'view', 'sequence'):
@@ -171,45 +304,93 @@ class Postgres(Generic):
                 if coll is None:
                     coll = coll_cls(meta, parent=schema)
                     meta.set_object(coll)
-                obj = cls(meta, schema=schema,
-                          oid=item['reloid'], name=item['relname'],
-                          comment=item['description'],
-                          parent=coll)
-                idxs = objects.Indexes(meta, parent=obj)
-                meta.set_object(idxs)
+                obj = meta.find_exact(oid=item['reloid'], cls=cls)
+                if obj is None:
+                    obj = cls(meta, schema=schema,
+                              oid=item['reloid'], name=item['relname'],
+                              comment=item['description'],
+                              parent=coll)
+                    idxs = objects.Indexes(meta, parent=obj)
+                    meta.set_object(idxs)
+                else:
+                    # Changed since the cache was written.
+                    obj.apply_data({'schema': schema,
+                                    'name': item['relname'],
+                                    'comment': item['description'],
+                                    'parent': coll})
+                    if cls is not objects.Sequence:
+                        obj.columns.props.refresh_required = True
                 meta.set_object(obj)
             elif item['objtype'] == 'user':
-                user = objects.User(meta, name=item['relname'],
-                                    parent=users)
-                meta.set_object(user)
+                user = meta.find_exact(oid=item['reloid'], cls=objects.User)
+                if user is None:
+                    user = objects.User(meta, name=item['relname'],
+                                        oid=item['reloid'],
+                                        parent=users)
+                    meta.set_object(user)
+                else:
+                    user.name = item['relname']
+            elif item['objtype'] == 'function':
+                # Functions and languages are loaded on demand, they're
+                # loaded again when the catalog has changed.
+                if schema is not None and schema.oid not in stale_schemas:
+                    stale_schemas.add(schema.oid)
+                    funcs = meta.find_exact(cls=objects.Functions,
+                                            parent=schema)
+                    if funcs is not None:
+                        funcs.props.refresh_required = True
+            elif item['objtype'] == 'language':
+                languages.props.refresh_required = True
 
     def refresh(self, obj, meta, connection):
-        if obj.typeid == 'columns':
-            self._refresh_columns(obj, meta, connection)
+        if obj.typeid in ('columns', 'indexes', 'constraints'):
+            self.refresh_many([obj], meta, connection)
         elif obj.typeid == 'languages':
             self._refresh_languages(obj, meta, connection)
         elif obj.typeid == 'functions':
             self._refresh_functions(obj, meta, connection)
-        elif obj.typeid == 'indexes':
-            self._refresh_indexes(obj, meta, connection)
-        elif obj.typeid == 'constraints':
-            self._refresh_constraints(obj, meta, connection)
         # View definitions: select pg_get_viewdef(%(oid)s, true)
 
-    def _refresh_columns(self, coll, meta, connection):
-        table = coll.parent
-        sql = ("select att.attnum, att.attname, dsc.description"
+    def refresh_many(self, collections, meta, connection):
+        typeid = collections[0].typeid
+        if typeid == 'columns':
+            # Columns of constraints aren't loaded here.
+            collections = [coll for coll in collections
+                           if isinstance(coll.parent, (objects.Table,
+                                                       objects.View))]
+            if collections:
+                self._refresh_columns(collections, meta, connection)
+        elif typeid == 'indexes':
+            self._refresh_indexes(collections, meta, connection)
+        elif typeid == 'constraints':
+            self._refresh_constraints(collections, meta, connection)
+        else:
+            Generic.refresh_many(self, collections, meta, connection)
+
+    def _get_parent_oids(self, collections):
+        """Returns a mapping of parent OIDs to collections and an array."""
+        by_oid = {}
+        for coll in collections:
+            by_oid[coll.parent.oid] = coll
+        array = "'{%s}'::oid[]" % ','.join('%d' % oid for oid in by_oid)
+        return by_oid, array
+
+    def _refresh_columns(self, collections, meta, connection):
+        by_oid, oids = self._get_parent_oids(collections)
+        sql = ("select att.attrelid, att.attnum, att.attname,"
+               " dsc.description"
                " from pg_attribute att"
-               " left join pg_description dsc on dsc.objoid = %(tableoid)s"
+               " left join pg_description dsc on dsc.objoid = att.attrelid"
                "  and dsc.objsubid = att.attnum"
-               " where att.attrelid = %(tableoid)s"
-               " and att.attnum >= 1"
-               % {"tableoid" : table.get_data("oid")})
+               " where att.attrelid = any(%s)"
+               " and att.attnum >= 1" % oids)
         known_columns = {}
-        [known_columns.setdefault(k.name, k)
-         for k in meta.find(parent=coll, cls=objects.Column)]
+        for coll in collections:
+            for col in meta.find(parent=coll, cls=objects.Column):
+                known_columns.setdefault((coll, col.name), col)
         for item in self._query(connection, sql):
-            col = known_columns.get(item['attname'], None)
+            coll = by_oid[item['attrelid']]
+            col = known_columns.get((coll, item['attname']), None)
             if col is None:
                 col = objects.Column(meta, parent=coll)
             col.name = item['attname']
@@ -217,12 +398,14 @@ class Postgres(Generic):
             col.comment = item['description']
             meta.set_object(col)
 
-    def _refresh_constraints(self, coll, meta, connection):
-        sql = ("select con.oid, con.conname, dsc.description"
+    def _refresh_constraints(self, collections, meta, connection):
+        by_oid, oids = self._get_parent_oids(collections)
+        sql = ("select con.oid, con.conrelid, con.conname, dsc.description"
                " from pg_constraint con"
                " left join pg_description dsc on dsc.objoid = con.oid"
-               " where con.conrelid = %d" % coll.parent.oid)
+               " where con.conrelid = any(%s)" % oids)
         for item in self._query(connection, sql):
+            coll = by_oid[item['conrelid']]
             con = meta.find_exact(parent=coll, oid=item['oid'])
             if con is None:
                 con = objects.Constraint(meta, parent=coll, oid=item['oid'])
@@ -230,13 +413,15 @@ class Postgres(Generic):
             con.name = item['conname']
             con.comment = item['description']
 
-    def _refresh_indexes(self, coll, meta, connection):
-        sql = ("select rel.oid, rel.relname, dsc.description"
+    def _refresh_indexes(self, collections, meta, connection):
+        by_oid, oids = self._get_parent_oids(collections)
+        sql = ("select rel.oid, ind.indrelid, rel.relname, dsc.description"
                " from pg_index ind, pg_class rel"
                " left join pg_description dsc on dsc.objoid = rel.oid"
                " where ind.indexrelid = rel.oid"
-               " and ind.indrelid = %d" % coll.parent.oid)
+               " and ind.indrelid = any(%s)" % oids)
         for item in self._query(connection, sql):
+            coll = by_oid[item['indrelid']]
             idx = meta.find_exact(parent=coll, oid=item['oid'])
             if idx is None:
                 idx = objects.Index(meta, parent=coll, oid=item['oid'])
@@ -297,7 +482,9 @@ class Postgres(Generic):
 DRIVER = Postgres
 
 
-PG_INITIAL_SQL = """
+# The initial catalog is fetched in independent phases that may run
+# concurrently on separate connections.
+PG_RELATIONS_SQL = """
 SELECT nsp.oid AS nspoid,
        nsp.nspname,
        rel.oid AS reloid,
@@ -311,31 +498,79 @@ SELECT nsp.oid AS nspoid,
        END AS objtype --        rel.*
 
 FROM pg_class rel
-LEFT JOIN pg_description des ON des.objoid = rel.oid and des.objsubid is null
+LEFT JOIN pg_description des ON des.objoid = rel.oid and des.objsubid = 0
 LEFT JOIN pg_namespace nsp ON nsp.oid = rel.relnamespace
 WHERE rel.relkind IN ('v', 'r', 'S')
+"""
 
-UNION
-
--- languages
-SELECT NULL, NULL, lan.oid,
-                   lan.lanname,
-                   des.description, 'language'
+PG_LANGUAGES_SQL = """
+SELECT NULL AS nspoid, NULL AS nspname, lan.oid AS reloid,
+       lan.lanname AS relname, des.description, 'language' AS objtype
 FROM pg_language lan
 LEFT JOIN pg_description des ON des.objoid = lan.oid
+"""
 
-UNION
-
--- users
-SELECT NULL, NULL, use.usesysid,
-                   use.usename, NULL, 'user'
+PG_USERS_SQL = """
+SELECT NULL AS nspoid, NULL AS nspname, use.usesysid AS reloid,
+       use.usename AS relname, NULL AS description, 'user' AS objtype
 FROM pg_user use
+"""
 
-union
-
--- functions
-select nsp.oid, nsp.nspname, pro.oid, pro.proname, des.description, 'function'
+PG_FUNCTIONS_SQL = """
+select nsp.oid as nspoid, nsp.nspname, pro.oid as reloid,
+       pro.proname as relname, des.description, 'function' as objtype
 from pg_proc pro
 left join pg_namespace nsp on nsp.oid = pro.pronamespace
 left join pg_description des on des.objoid = pro.oid
 """
+
+PG_CATALOG_PHASES = (
+    ('relations', PG_RELATIONS_SQL),
+    ('functions', PG_FUNCTIONS_SQL),
+    ('users', PG_USERS_SQL),
+    ('languages', PG_LANGUAGES_SQL),
+)
+
+PG_INITIAL_SQL = '\nUNION\n'.join(sql for phase, sql in PG_CATALOG_PHASES)
+
+# Cheap query to detect catalog changes, xmin changes whenever a row
+# in the system catalog is updated. Comments are stored in
+# pg_description, their xmin is part of the token.
+PG_CATALOG_STATE_SQL = """
+SELECT 'rel' AS kind, rel.oid,
+       rel.xmin::text || '/' || coalesce(des.xmin::text, '') AS token
+FROM pg_class rel
+LEFT JOIN pg_description des
+  ON des.objoid = rel.oid AND des.classoid = 'pg_class'::regclass
+     AND des.objsubid = 0
+WHERE rel.relkind IN ('v', 'r', 'S')
+
+UNION ALL
+
+SELECT 'nsp', nsp.oid,
+       nsp.xmin::text || '/' || coalesce(des.xmin::text, '')
+FROM pg_namespace nsp
+LEFT JOIN pg_description des
+  ON des.objoid = nsp.oid AND des.classoid = 'pg_namespace'::regclass
+
+UNION ALL
+
+SELECT 'proc', pro.oid,
+       pro.xmin::text || '/' || coalesce(des.xmin::text, '')
+FROM pg_proc pro
+LEFT JOIN pg_description des
+  ON des.objoid = pro.oid AND des.classoid = 'pg_proc'::regclass
+
+UNION ALL
+
+SELECT 'lang', lan.oid,
+       lan.xmin::text || '/' || coalesce(des.xmin::text, '')
+FROM pg_language lan
+LEFT JOIN pg_description des
+  ON des.objoid = lan.oid AND des.classoid = 'pg_language'::regclass
+
+UNION ALL
+
+SELECT 'user', use.usesysid, use.usename
+FROM pg_user use
+"""
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+# crunchyfrog - a database schema browser and query tool
+# Copyright (C) 2009 Andi Albrecht <albrecht.andi@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simulated backend.
+
+Connects to the imaginary server of :mod:`cf.db.simulator`. The
+*flavor* option selects the backend that's simulated, e.g. for
+``simulated://localhost/app?flavor=mysql&objects=50000&latency=0.02``
+the MySQL backend loads the catalog, executes statements and parses
+errors.
+"""
+
+from cf.db import simulator
+from cf.db.backends import Generic, GUIOption
+from cf.db.backends.mysql import MySQL
+from cf.db.backends.oracle import Oracle
+from cf.db.backends.postgres import Postgres
+
+
+def _get_connect_params(url):
+    opts = dict(url.query)
+    if url.database:
+        opts['database'] = url.database
+    if url.username:
+        opts['user'] = url.username
+    return tuple(), opts
+
+
+class SimulatedPostgres(Postgres):
+
+    @classmethod
+    def dbapi(cls):
+        return simulator
+
+    @classmethod
+    def get_connect_params(cls, url):
+        return _get_connect_params(url)
+
+    def prepare_connection(self, connection):
+        # psycopg2.extensions can't be imported, simulated connections
+        # are always in autocommit mode.
+        Generic.prepare_connection(self, connection)
+
+
+class SimulatedMySQL(MySQL):
+
+    @classmethod
+    def dbapi(cls):
+        return simulator
+
+    @classmethod
+    def get_connect_params(cls, url):
+        return _get_connect_params(url)
+
+    def get_stream_cursor(self, connection, query, page_size):
+        # There's no SSCursor, the rows are fetched in batches.
+        return Generic.get_stream_cursor(self, connection, query, page_size)
+
+
+class SimulatedOracle(Oracle):
+
+    @classmethod
+    def dbapi(cls):
+        return simulator
+
+    @classmethod
+    def get_connect_params(cls, url):
+        return _get_connect_params(url)
+
+
+FLAVORS = {
+    'postgres': SimulatedPostgres,
+    'mysql': SimulatedMySQL,
+    'oracle': SimulatedOracle,
+}
+
+
+class Simulated(Generic):
+    """Backend for the simulated driver.
+
+    Backend methods are delegated to the backend of the flavor given in
+    the data source URL. The flavor is determined when the first
+    connection is opened.
+    """
+
+    drivername = 'simulated'
+
+    def __init__(self):
+        self._flavor_name = None
+        self._flavor = None
+
+    @classmethod
+    def dbapi(cls):
+        return simulator
+
+    @classmethod
+    def get_options(cls):
+        return (
+            GUIOption('flavor', _(u'Flavor'),
+                      widget=GUIOption.WIDGET_COMBO,
+                      choices=(
+                          ('postgres', 'PostgreSQL'),
+                          ('mysql', 'MySQL'),
+                          ('oracle', 'Oracle'),
+                      )),
+            GUIOption('objects', _(u'Number of objects'),
+                      tooltip=_(u'Number of tables, views and sequences')),
+            GUIOption('latency', _(u'Latency'),
+                      tooltip=_(u'Seconds per round-trip')),
+            GUIOption('throughput', _(u'Throughput'),
+                      tooltip=_(u'Rows per second, leave empty for'
+                                u' unlimited throughput')),
+            GUIOption('rows', _(u'Rows per table')),
+            GUIOption('database', _(u'Database')),
+            GUIOption('username', _(u'Username')),
+            )
+
+    @classmethod
+    def get_connect_params(cls, url):
+        return _get_connect_params(url)
+
+    @property
+    def flavor(self):
+        """The backend of the simulated flavor."""
+        if self._flavor is None:
+            self._flavor = FLAVORS['postgres']()
+        return self._flavor
+
+    def get_connection(self, url):
+        name = url.query.get('flavor') or 'postgres'
+        if name != self._flavor_name:
+            self._flavor_name = name
+            self._flavor = FLAVORS[name]()
+        return Generic.get_connection(self, url)
+
+
+def _delegate(name):
+    def method(self, *args, **kwds):
+        return getattr(self.flavor, name)(*args, **kwds)
+    method.__name__ = name
+    method.__doc__ = getattr(Generic, name).__doc__
+    return method
+
+
+for _name in ('should_close', 'get_error_position', 'prepare_connection',
+              'set_statement_timeout', 'reset_connection', 'cancel',
+              'check_connection', 'get_stream_cursor', 'scroll_cursor',
+              'bulk_export',
+              'get_server_info', 'prepare_statement', 'initialize',
+              'refresh', 'refresh_many', 'get_catalog_phases', 'get_catalog',
+              'get_catalog_state', 'get_catalog_key', 'load_catalog',
+              'get_catalog_objects', 'get_transaction_state', 'begin',
+              'commit', 'rollback', 'get_explain_statement'):
+    setattr(Simulated, _name, _delegate(_name))
+del _name
+
+
+DRIVER = Simulated
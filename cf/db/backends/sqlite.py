@@ -39,6 +39,8 @@ P_ERROR_MESSAGES = set([
 class SQLite(Generic):
 
     drivername = 'sqlite'
+    # SQLite connections are bound to the thread that created them.
+    supports_pooling = False
 
     @classmethod
     def get_options(cls):
@@ -84,6 +86,11 @@ class SQLite(Generic):
         connection.connection.isolation_level = None
         fpart = functools.partial(self._transaction_watcher, connection)
         connection.connection.set_authorizer(fpart)
+        super(SQLite, self).prepare_connection(connection)
+
+    def cancel(self, connection):
+        connection.get_dbapi_connection().interrupt()
+        return True
 
     def _transaction_watcher(self, connection, action_code, operation, *args):
         sqlite3 = self.dbapi()
@@ -120,25 +127,45 @@ class SQLite(Generic):
 
     def refresh(self, obj, meta, connection):
         if obj.typeid == 'columns':
-            self._refresh_columns(obj, meta, connection)
-
-    def _refresh_columns(self, obj, meta, connection):
-        table = obj.parent
+            self.refresh_many([obj], meta, connection)
+
+    def refresh_many(self, collections, meta, connection):
+        if collections[0].typeid != 'columns':
+            return Generic.refresh_many(self, collections, meta, connection)
+        # pragma_table_info() is available since SQLite 3.16.
+        if self.dbapi().sqlite_version_info < (3, 16, 0):
+            for coll in collections:
+                sql = "pragma table_info('%s')" % coll.parent.name
+                rows = [(coll.parent.name,)+tuple(item)
+                        for item in connection.execute(sql)]
+                self._refresh_columns([coll], rows, meta)
+            return
+        names = ', '.join("'%s'" % coll.parent.name.replace("'", "''")
+                          for coll in collections)
+        sql = ("select m.name, p.cid, p.name, p.type, p.\"notnull\","
+               " p.dflt_value, p.pk"
+               " from sqlite_master m, pragma_table_info(m.name) p"
+               " where m.name in (%s)" % names)
+        self._refresh_columns(collections, connection.execute(sql), meta)
+
+    def _refresh_columns(self, collections, rows, meta):
+        by_table = {}
         known_columns = {}
-        [known_columns.setdefault(k.cid, k)
-         for k in meta.find(cls=objects.Column, parent=obj)]
-        sql = "pragma table_info('%s')" % table.name  # somehow ? doesn't work
-        for item in connection.execute(sql):
-            # item is: cid, name, type, notnull, dflt_value, pk
-            col = known_columns.get(item[0], None)
+        for coll in collections:
+            by_table[coll.parent.name] = coll
+            [known_columns.setdefault((coll, k.cid), k)
+             for k in meta.find(cls=objects.Column, parent=coll)]
+        for item in rows:
+            # item is: table, cid, name, type, notnull, dflt_value, pk
+            coll = by_table[item[0]]
+            col = known_columns.get((coll, item[1]), None)
             if col is None:
-                col = objects.Column(meta, parent=obj, cid=item[0])
-            col.name = item[1]
-            col.type = item[2]
-            col.notnull = item[3]
-            col.default = item[4]
-            col.pk = item[5]
+                col = objects.Column(meta, parent=coll, cid=item[1])
+            col.name = item[2]
+            col.type = item[3]
+            col.notnull = item[4]
+            col.default = item[5]
+            col.pk = item[6]
             meta.set_object(col)
 
-
 DRIVER = SQLite
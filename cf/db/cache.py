@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# crunchyfrog - a database schema browser and query tool
+# Copyright (C) 2009 Andi Albrecht <albrecht.andi@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""On-disk cache for database meta information."""
+
+import cPickle
+import logging
+import os
+import zlib
+
+import cf
+
+
+# Increase when the file format changes, older files are ignored then.
+CACHE_VERSION = 3
+
+
+class CatalogCache(object):
+    """Persistent cache for the catalog of a data source.
+
+    The cache stores the catalog rows as returned by the backend's
+    :meth:`get_catalog` grouped by catalog key, together with the change
+    tokens returned by :meth:`get_catalog_state`. Rows are written as
+    tuples with a shared list of column names to keep the files small.
+    """
+
+    def __init__(self, datasource, dirname=None):
+        self.datasource = datasource
+        if dirname is None:
+            dirname = os.path.join(cf.USER_CONFIG_DIR, 'metacache')
+        self.filename = os.path.join(dirname, '%s.cache' % datasource.id)
+
+    def _get_signature(self):
+        return (CACHE_VERSION, self.datasource.url.drivername,
+                self.datasource.public_url)
+
+    def load(self):
+        """Returns cached data or ``None``.
+
+        The return value is a 2-tuple (rows, state) where *rows* is a
+        dictionary mapping catalog keys to lists of rows and *state*
+        maps catalog keys to change tokens.
+        """
+        if not os.path.isfile(self.filename):
+            return None
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                data = cPickle.loads(zlib.decompress(f.read()))
+            finally:
+                f.close()
+        except:
+            logging.exception('Failed to read meta cache %s', self.filename)
+            return None
+        if data.get('signature') != self._get_signature():
+            return None
+        columns = data['columns']
+        rows = {}
+        for key, values in data['rows'].iteritems():
+            rows[key] = [dict(zip(columns, value)) for value in values]
+        return rows, data['state']
+
+    def save(self, rows, state):
+        """Writes rows and change tokens to disk."""
+        columns = set()
+        for key_rows in rows.itervalues():
+            for row in key_rows:
+                columns.update(key for key in row
+                               if isinstance(key, basestring))
+        columns = sorted(columns)
+        packed = {}
+        for key, key_rows in rows.iteritems():
+            packed[key] = [tuple(row.get(column) for column in columns)
+                           for row in key_rows]
+        data = {'signature': self._get_signature(), 'columns': columns,
+                'rows': packed, 'state': state}
+        tmp_name = '%s.tmp' % self.filename
+        try:
+            dirname = os.path.dirname(self.filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            f = open(tmp_name, 'wb')
+            try:
+                f.write(zlib.compress(cPickle.dumps(data, 2)))
+            finally:
+                f.close()
+            os.rename(tmp_name, self.filename)
+        except (IOError, OSError):
+            logging.exception('Failed to write meta cache %s', self.filename)
+
+    def clear(self):
+        """Removes the cache file."""
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+# crunchyfrog - a database schema browser and query tool
+# Copyright (C) 2009 Andi Albrecht <albrecht.andi@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Columnar storage for query results.
+
+A :class:`ColumnBatch` stores rows column by column. Integers, floats,
+timestamps and dates are kept in typed arrays, strings in a single
+buffer with an array of offsets. NULL values are marked in a bitmap.
+Values of other types are kept as Python objects.
+"""
+
+from array import array
+import datetime
+import sys
+
+
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_STR = 'str'
+KIND_UNICODE = 'unicode'
+KIND_DATETIME = 'datetime'
+KIND_DATE = 'date'
+KIND_OBJECT = 'object'
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _get_kind(values):
+    types = set(type(value) for value in values if value is not None)
+    if not types:
+        return KIND_OBJECT
+    if types <= set((int, long)):
+        return KIND_INT
+    if len(types) > 1:
+        return KIND_OBJECT
+    type_ = types.pop()
+    if type_ is float:
+        return KIND_FLOAT
+    elif type_ is str:
+        return KIND_STR
+    elif type_ is unicode:
+        return KIND_UNICODE
+    elif type_ is datetime.datetime:
+        if [value for value in values
+            if value is not None and value.tzinfo is not None]:
+            return KIND_OBJECT
+        return KIND_DATETIME
+    elif type_ is datetime.date:
+        return KIND_DATE
+    return KIND_OBJECT
+
+
+class Column(object):
+    """A single column of a :class:`ColumnBatch`.
+
+    Attributes:
+      kind: One of the ``KIND_*`` constants.
+      data: Typed array with one item per row, a string buffer for
+        string columns or a list for object columns.
+      offsets: For string columns, an array with the start offset of
+        each value in *data* followed by the end offset of the last value.
+      nulls: Bitmap of NULL values as bytearray or ``None`` if the
+        column has no NULL values.
+    """
+
+    __slots__ = ('kind', 'data', 'offsets', 'nulls', 'longs')
+
+    def __init__(self, values):
+        self.kind = _get_kind(values)
+        self.offsets = None
+        self.nulls = None
+        self.longs = False
+        if None in values and self.kind != KIND_OBJECT:
+            self.nulls = bytearray((len(values)+7)//8)
+            for idx, value in enumerate(values):
+                if value is None:
+                    self.nulls[idx >> 3] |= 1 << (idx & 7)
+        try:
+            self._fill(values)
+        except OverflowError:
+            # Integers not fitting into a C long.
+            self.kind = KIND_OBJECT
+            self.nulls = None
+            self._fill(values)
+
+    def _fill(self, values):
+        kind = self.kind
+        if kind == KIND_INT:
+            self.longs = bool([value for value in values
+                               if type(value) is long])
+            self.data = array('l', [value or 0 for value in values])
+        elif kind == KIND_FLOAT:
+            self.data = array('d', [value or 0.0 for value in values])
+        elif kind in (KIND_STR, KIND_UNICODE):
+            if kind == KIND_UNICODE:
+                values = [value is not None and value.encode('utf-8') or ''
+                          for value in values]
+            else:
+                values = [value or '' for value in values]
+            self.offsets = array('l', [0])
+            end = 0
+            for value in values:
+                end += len(value)
+                self.offsets.append(end)
+            self.data = ''.join(values)
+        elif kind == KIND_DATETIME:
+            self.data = array('l', [value is not None
+                                    and self._to_micros(value) or 0
+                                    for value in values])
+        elif kind == KIND_DATE:
+            self.data = array('l', [value is not None
+                                    and value.toordinal() or 0
+                                    for value in values])
+        else:
+            self.data = list(values)
+
+    def _to_micros(self, value):
+        delta = value-_EPOCH
+        return ((delta.days*86400+delta.seconds)*1000000
+                + delta.microseconds)
+
+    def __len__(self):
+        if self.offsets is not None:
+            return len(self.offsets)-1
+        return len(self.data)
+
+    def is_null(self, index):
+        """Returns ``True`` if the value at *index* is NULL."""
+        if self.kind == KIND_OBJECT:
+            return self.data[index] is None
+        return (self.nulls is not None
+                and bool(self.nulls[index >> 3] & (1 << (index & 7))))
+
+    def get(self, index):
+        """Returns the value at *index*."""
+        kind = self.kind
+        if kind == KIND_OBJECT:
+            return self.data[index]
+        nulls = self.nulls
+        if nulls is not None and nulls[index >> 3] & (1 << (index & 7)):
+            return None
+        if kind == KIND_INT:
+            if self.longs:
+                return long(self.data[index])
+            return self.data[index]
+        elif kind == KIND_FLOAT:
+            return self.data[index]
+        elif kind == KIND_STR:
+            return self.data[self.offsets[index]:self.offsets[index+1]]
+        elif kind == KIND_UNICODE:
+            value = self.data[self.offsets[index]:self.offsets[index+1]]
+            return value.decode('utf-8')
+        elif kind == KIND_DATETIME:
+            return _EPOCH+datetime.timedelta(microseconds=self.data[index])
+        elif kind == KIND_DATE:
+            return datetime.date.fromordinal(self.data[index])
+
+    def values(self):
+        """Returns a list of all values."""
+        return [self.get(idx) for idx in xrange(len(self))]
+
+    def estimate_size(self):
+        """Returns the approximate memory used in bytes."""
+        size = sys.getsizeof(self.data)
+        if self.kind == KIND_OBJECT:
+            size += sum(sys.getsizeof(value) for value in self.data)
+        if self.offsets is not None:
+            size += sys.getsizeof(self.offsets)
+        if self.nulls is not None:
+            size += sys.getsizeof(self.nulls)
+        return size
+
+
+class ColumnBatch(object):
+    """Read-only sequence of rows stored column by column.
+
+    The batch behaves like a list of row tuples, but rows are built on
+    access. Use :meth:`get_value` to read single values and
+    :attr:`columns` to work on whole columns.
+    """
+
+    def __init__(self, rows, num_columns=None):
+        if num_columns is None:
+            num_columns = rows and len(rows[0]) or 0
+        self._length = len(rows)
+        self.columns = [Column([row[idx] for row in rows])
+                        for idx in xrange(num_columns)]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('row index out of range')
+        return tuple(column.get(index) for column in self.columns)
+
+    def __iter__(self):
+        for index in xrange(self._length):
+            yield self[index]
+
+    def get_value(self, index, column):
+        """Returns a single value."""
+        return self.columns[column].get(index)
+
+    def estimate_size(self):
+        """Returns the approximate memory used in bytes."""
+        return sum(column.estimate_size() for column in self.columns)
@@ -18,23 +18,319 @@
 
 """Database meta information."""
 
+import bisect
+import heapq
 import logging
+import sys
 import thread
+import threading
 
 import gobject
-import gtk
 
+from cf.db import objects
+from cf.db.cache import CatalogCache
 
 
+# Keys that are answered by the secondary indexes of ObjectStore.
+INDEXED_KEYS = ('parent', 'oid', 'name')
+
+
+def _get_value(obj, key):
+    """Return the value of *key* as used by DBObject.property_matches()."""
+    if obj.has_property(key):
+        return obj.get_property(key)
+    return obj.get_data(key)
+
+
+def _index_name(name):
+    if isinstance(name, basestring):
+        return name.lower()
+    return name
+
+
+class ObjectStore(object):
+    """In-memory store for database objects.
+
+    Besides the objects itself the store maintains secondary indexes
+    by class, by parent, by ``oid`` and by lower-cased name. Lookups
+    using one of these keys only touch the matching objects.
+    """
+
+    def __init__(self):
+        self._keys = {}  # object -> (cls, parent, oid, name)
+        self._by_cls = {}
+        self._by_parent = {}
+        self._by_oid = {}
+        self._by_name = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, obj):
+        return obj in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def _get_keys(self, obj):
+        return (obj.__class__,
+                _get_value(obj, 'parent'),
+                _get_value(obj, 'oid'),
+                _index_name(_get_value(obj, 'name')))
+
+    def _indexes(self):
+        return (self._by_cls, self._by_parent, self._by_oid, self._by_name)
+
+    def add(self, obj):
+        """Adds an object or updates the indexes of a known object."""
+        keys = self._get_keys(obj)
+        old_keys = self._keys.get(obj)
+        if old_keys == keys:
+            return
+        if old_keys is not None:
+            self._unindex(obj, old_keys)
+        self._keys[obj] = keys
+        for index, key in zip(self._indexes(), keys):
+            index.setdefault(key, set()).add(obj)
+
+    def remove(self, obj):
+        """Removes an object from the store."""
+        keys = self._keys.pop(obj, None)
+        if keys is not None:
+            self._unindex(obj, keys)
+
+    def _unindex(self, obj, keys):
+        for index, key in zip(self._indexes(), keys):
+            bucket = index.get(key)
+            if bucket is None:
+                continue
+            bucket.discard(obj)
+            if not bucket:
+                del index[key]
+
+    def update(self, obj):
+        """Refreshes the indexes for *obj* if it's part of the store."""
+        if obj in self._keys:
+            self.add(obj)
+
+    def _get_class_candidates(self, objcls):
+        buckets = [objs for cls, objs in self._by_cls.iteritems()
+                   if issubclass(cls, objcls)]
+        if len(buckets) == 1:
+            return buckets[0]
+        res = set()
+        for bucket in buckets:
+            res.update(bucket)
+        return res
+
+    def find(self, **kwds):
+        """Returns a list of objects matching all keywords.
+
+        The smallest index bucket for the given keywords is used as the
+        candidate set, the remaining keywords are applied as filters.
+        """
+        candidates = None
+        for key, index in (('parent', self._by_parent),
+                           ('oid', self._by_oid),
+                           ('name', self._by_name)):
+            if key not in kwds:
+                continue
+            if key == 'name':
+                value = _index_name(kwds[key])
+            else:
+                value = kwds[key]
+            try:
+                bucket = index.get(value, ())
+            except TypeError:  # unhashable, fall back to filtering
+                continue
+            if candidates is None or len(bucket) < len(candidates):
+                candidates = bucket
+            if not candidates:
+                return []
+        objcls = kwds.pop('cls', None)
+        if objcls is not None:
+            if candidates is None:
+                candidates = self._get_class_candidates(objcls)
+            else:
+                candidates = [obj for obj in candidates
+                              if isinstance(obj, objcls)]
+        elif candidates is None:
+            candidates = self._keys
+        res = list(candidates)
+        for key, value in kwds.iteritems():
+            res = [obj for obj in res if obj.property_matches(key, value)]
+        return res
+
+
+class CompletionIndex(object):
+    """Index of names for autocompletion.
+
+    Lower-cased names are kept in a sorted list for prefix lookups and
+    in a trigram index for substring lookups. Entries can be added and
+    removed at any time, the sorted list is brought up to date on the
+    next lookup.
+    """
+
+    def __init__(self):
+        self._entries = {}  # key -> (name, description)
+        self._by_name = {}  # lower-cased name -> set of keys
+        self._trigrams = {}  # trigram -> set of lower-cased names
+        self._sorted = []
+        self._unsorted = False
+        self._stale = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _iter_trigrams(self, lname):
+        for i in xrange(len(lname)-2):
+            yield lname[i:i+3]
+
+    def add(self, key, name, description):
+        """Adds or replaces the entry for *key*."""
+        if self._entries.get(key) == (name, description):
+            return
+        self.remove(key)
+        self._entries[key] = (name, description)
+        lname = name.lower()
+        keys = self._by_name.get(lname)
+        if keys is None:
+            keys = self._by_name[lname] = set()
+            self._sorted.append(lname)
+            self._unsorted = True
+            for trigram in self._iter_trigrams(lname):
+                self._trigrams.setdefault(trigram, set()).add(lname)
+        keys.add(key)
+
+    def remove(self, key):
+        """Removes the entry for *key*, if any."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        lname = entry[0].lower()
+        keys = self._by_name[lname]
+        keys.discard(key)
+        if keys:
+            return
+        del self._by_name[lname]
+        self._stale = True
+        for trigram in self._iter_trigrams(lname):
+            names = self._trigrams[trigram]
+            names.discard(lname)
+            if not names:
+                del self._trigrams[trigram]
+
+    def clear(self):
+        self.__init__()
+
+    def _prepare(self):
+        if self._stale:
+            self._sorted = sorted(self._by_name)
+        elif self._unsorted:
+            # New names are appended, sort() merges them in one pass.
+            self._sorted.sort()
+        self._stale = self._unsorted = False
+
+    def _find_prefixed(self, fragment, limit):
+        names = []
+        idx = bisect.bisect_left(self._sorted, fragment)
+        while idx < len(self._sorted):
+            lname = self._sorted[idx]
+            if not lname.startswith(fragment):
+                break
+            names.append(lname)
+            if limit is not None and len(names) >= limit:
+                break
+            idx += 1
+        return names
+
+    def _find_containing(self, fragment):
+        if len(fragment) < 3:
+            return [lname for lname in self._sorted if fragment in lname]
+        buckets = []
+        for trigram in set(self._iter_trigrams(fragment)):
+            bucket = self._trigrams.get(trigram)
+            if not bucket:
+                return []
+            buckets.append(bucket)
+        buckets.sort(key=len)
+        names = buckets[0].intersection(*buckets[1:])
+        return [lname for lname in names if fragment in lname]
+
+    def find(self, fragment, limit=None):
+        """Returns entries containing *fragment*, best matches first.
+
+        The returned list contains 3-tuples (position, name, description)
+        where *position* is the index of *fragment* within *name*.
+        Entries are ordered by position and name. If *limit* is given,
+        at most *limit* names are looked at.
+        """
+        self._prepare()
+        fragment = fragment.lower()
+        names = self._find_prefixed(fragment, limit)
+        if limit is None or len(names) < limit:
+            names = [(lname.index(fragment), lname)
+                     for lname in self._find_containing(fragment)]
+            if limit is None:
+                names.sort()
+            else:
+                names = heapq.nsmallest(limit, names)
+        else:
+            names = [(0, lname) for lname in names]
+        res = []
+        for pos, lname in names:
+            entries = [self._entries[key] for key in self._by_name[lname]]
+            entries.sort()
+            res.extend((pos, name, descr) for name, descr in entries)
+        return res
+
 
 class DatabaseMeta(object):
+    """Meta information about a data source.
+
+    Meta information is loaded in the background on separate connections
+    if the DB-API2 module and the backend allow it. Independent phases of
+    the catalog (see :meth:`Generic.get_catalog_phases`) are loaded
+    concurrently. If the module is threadsafe on connection level, one
+    of these connections is kept for further queries on meta information
+    so that they don't queue behind the queries of the user.
+
+    Objects, the completion index and :attr:`conn` are used from the
+    main thread, loader threads and completion workers. The methods of
+    this class serialize access to them, use :meth:`find_completions`
+    instead of reading :attr:`completions` directly. Lookups don't wait
+    for queries on meta information, only loading and refreshing
+    objects is serialized with them.
+    """
 
     def __init__(self, datasource):
         self.datasource = datasource
         self.app = datasource.manager.app
         self.conn = self.datasource.internal_connection
-        self._items = set()
-        if self.conn.threadsafety >= 2:
+        self._own_conn = None
+        self._items = ObjectStore()
+        self.completions = CompletionIndex()
+        self._cache = None
+        self._catalog = {}  # catalog key -> rows
+        self._catalog_state = {}
+        # Guards the objects and the indexes. It's never held while
+        # waiting for the database.
+        self._lock = threading.RLock()
+        # Serializes loading and refreshing objects and the use of
+        # self.conn, including the queries needed for that.
+        self._load_lock = threading.RLock()
+        self._threaded = False
+        self._cancelled = False
+        self.progress = (0, 0)  # (finished phases, number of phases)
+        if (datasource.id is not None
+            and self.app.config.get('meta.cache_enabled')):
+            self._cache = CatalogCache(datasource)
+        # Connections of backends without pooling (SQLite) may not see
+        # the same database, e.g. for ":memory:" or temporary tables.
+        if self.conn.threadsafety >= 1 and self.backend.supports_pooling:
             thread.start_new_thread(self.initialize, (True,))
         else:
             self.initialize()
@@ -44,49 +340,353 @@ class DatabaseMeta(object):
         return self.datasource.backend
 
     def get_server_info(self):
-        return self.backend.get_server_info(self.conn)
+        self._load_lock.acquire()
+        try:
+            return self.backend.get_server_info(self.conn)
+        finally:
+            self._load_lock.release()
+
+    def cancel(self):
+        """Cancels loading meta information.
+
+        Phases that are already running are finished, but their results
+        are dropped.
+        """
+        self._cancelled = True
+
+    def close(self):
+        """Cancels loading and closes the connection of this object."""
+        self.cancel()
+        self._load_lock.acquire()
+        try:
+            conn = self._own_conn
+            self._own_conn = None
+            self.conn = None
+        finally:
+            self._load_lock.release()
+        if conn is not None:
+            conn.close()
+
+    def _open_connection(self):
+        if not self._threaded:
+            return self.datasource.internal_connection
+        return self.datasource.open_background_connection()
+
+    def _close_connection(self, conn):
+        if conn is not self.datasource.internal_connection:
+            conn.close()
+
+    def _set_status(self, msg=None):
+        if msg is None:
+            func, args = self.app.pop_status_message, (100,)
+        else:
+            func, args = self.app.set_status_message, (msg, 100)
+        if self._threaded:
+            gobject.idle_add(func, *args)
+        else:
+            func(*args)
+
+    def _phase_finished(self):
+        done, total = self.progress
+        self.progress = (done+1, total)
+        if total > 1:
+            msg = _(u'Loading database structure (%(done)d/%(total)d)...')
+            self._set_status(msg % {'done': done+1, 'total': total})
 
     def initialize(self, threaded=False):
-        """Called after instance creation to prepare intial data."""
-        if threaded:
-            gtk.gdk.threads_enter()
-        self.app.set_status_message(_(u'Loading database structure...'), 100)
-        if threaded:
-            gtk.gdk.threads_leave()
+        """Called after instance creation to prepare intial data.
+
+        If *threaded* is ``True``, the data is loaded on separate
+        connections.
+        """
+        self._threaded = threaded
+        self._set_status(_(u'Loading database structure...'))
+        conn = None
+        revalidate = False
         try:
-            self.backend.initialize(self, self.conn)
+            conn = self._open_connection()
+            revalidate = self._initialize_catalog(conn)
         except:
             msg = 'DatabaseMeta.initialize failed (driver: %s):'
             msg = msg % self.backend.drivername
             logging.exception(msg)
-        if threaded:
-            gtk.gdk.threads_enter()
-        self.app.pop_status_message(100)
-        if threaded:
-            gtk.gdk.threads_leave()
+        self._set_status()
+        if revalidate and not self._cancelled:
+            try:
+                self._revalidate_catalog(conn)
+            except:
+                msg = 'DatabaseMeta: revalidating cache failed (driver: %s):'
+                msg = msg % self.backend.drivername
+                logging.exception(msg)
+        if conn is None or not threaded:
+            return
+        # Keep the connection if it can be used from other threads.
+        self._load_lock.acquire()
+        try:
+            keep = not self._cancelled and conn.threadsafety >= 2
+            if keep:
+                self._own_conn = self.conn = conn
+        finally:
+            self._load_lock.release()
+        if not keep:
+            self._close_connection(conn)
+
+    def _group_catalog(self, rows):
+        grouped = {}
+        for row in rows:
+            key = self.backend.get_catalog_key(row)
+            grouped.setdefault(key, []).append(row)
+        return grouped
+
+    def _initialize_catalog(self, conn):
+        """Loads the initial meta information.
+
+        Returns ``True`` if the information was loaded from the cache and
+        needs to be revalidated.
+        """
+        backend = self.backend
+        state = None
+        if self._cache is not None:
+            cached = self._cache.load()
+            if cached is not None:
+                self._catalog, self._catalog_state = cached
+                rows = []
+                for key_rows in self._catalog.itervalues():
+                    rows.extend(key_rows)
+                self._load_lock.acquire()
+                try:
+                    backend.load_catalog(self, conn, rows)
+                finally:
+                    self._load_lock.release()
+                return True
+            # Fetch the state first, changes made while the catalog is
+            # read are picked up on the next revalidation.
+            state = backend.get_catalog_state(conn)
+        rows = self._fetch_catalog(conn)
+        if rows is None:
+            backend.initialize(self, conn)
+        elif state is not None and not self._cancelled:
+            self._catalog = self._group_catalog(rows)
+            self._catalog_state = state
+            self._cache.save(self._catalog, state)
+        return False
+
+    def _fetch_catalog(self, conn):
+        """Fetches and loads the catalog phase by phase.
+
+        Returns all catalog rows or ``None`` if the backend doesn't
+        support catalogs. Raises an exception if a phase failed.
+        """
+        backend = self.backend
+        phases = backend.get_catalog_phases()
+        self.progress = (0, len(phases))
+        results = {}
+        errors = []
+
+        def run(phase, phase_conn=None):
+            try:
+                if phase_conn is None:
+                    phase_conn = self._open_connection()
+                    own_conn = True
+                else:
+                    own_conn = False
+                try:
+                    if self._cancelled:
+                        return
+                    rows = backend.get_catalog(phase_conn, phase=phase)
+                    if rows is None:
+                        results[phase] = None
+                        return
+                    self._load_lock.acquire()
+                    try:
+                        if not self._cancelled:
+                            backend.load_catalog(self, phase_conn, rows)
+                            results[phase] = rows
+                            self._phase_finished()
+                    finally:
+                        self._load_lock.release()
+                finally:
+                    if own_conn:
+                        self._close_connection(phase_conn)
+            except:
+                errors.append(sys.exc_info())
+
+        threads = []
+        if self._threaded:
+            for phase in phases[1:]:
+                worker = threading.Thread(target=run, args=(phase,))
+                worker.start()
+                threads.append(worker)
+            run(phases[0], conn)
+        else:
+            for phase in phases:
+                run(phase, conn)
+        for worker in threads:
+            worker.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        if None in results.values():
+            return None
+        rows = []
+        for phase in phases:
+            rows.extend(results.get(phase, []))
+        return rows
+
+    def _revalidate_catalog(self, conn):
+        """Applies catalog changes since the cache was written."""
+        backend = self.backend
+        state = backend.get_catalog_state(conn)
+        if state is None:
+            return
+        old_state = self._catalog_state
+        changed = [key for key, token in state.iteritems()
+                   if old_state.get(key) != token]
+        removed = [key for key in old_state if key not in state]
+        if not changed and not removed:
+            return
+        rows = []
+        if changed:
+            rows = backend.get_catalog(conn, changed)
+        self._load_lock.acquire()
+        try:
+            for key in removed:
+                for obj in backend.get_catalog_objects(self, key):
+                    self.remove_object(obj)
+                self._catalog.pop(key, None)
+            for key in changed:
+                self._catalog.pop(key, None)
+            self._catalog.update(self._group_catalog(rows))
+            backend.load_catalog(self, conn, rows)
+        finally:
+            self._load_lock.release()
+        self._catalog_state = state
+        self._cache.save(self._catalog, state)
 
     def set_object(self, obj):
         """Adds or replaces an object."""
-        if obj in self._items:
+        self._lock.acquire()
+        try:
+            self._items.add(obj)
+            self._index_completion(obj)
+        finally:
+            self._lock.release()
+
+    def remove_object(self, obj):
+        """Removes an object and its children."""
+        self._lock.acquire()
+        try:
+            for child in self.find(parent=obj):
+                self.remove_object(child)
             self._items.remove(obj)
-        self._items.add(obj)
+            self.completions.remove(obj)
+        finally:
+            self._lock.release()
+
+    def update_object(self, obj):
+        """Updates the indexes after indexed attributes have changed."""
+        self._lock.acquire()
+        try:
+            if obj in self._items:
+                self._items.update(obj)
+                self._index_completion(obj)
+        finally:
+            self._lock.release()
+
+    def _index_completion(self, obj):
+        if isinstance(obj, (objects.Table, objects.View,
+                            objects.Sequence, objects.Schema)):
+            self.completions.add(obj, obj.get_full_name(), obj.typestr)
+
+    def can_refresh_in_background(self):
+        """Returns True if objects can be refreshed in other threads.
+
+        Otherwise refreshing objects requires :attr:`conn`, which is
+        used by an editor in the main thread.
+        """
+        conn = self.conn
+        if conn is None:
+            return False
+        if conn.threadsafety >= 2:
+            return True
+        return conn.threadsafety >= 1 and self.backend.supports_pooling
+
+    def _open_refresh_connection(self):
+        # Connections of modules that aren't threadsafe on connection
+        # level may only be used by the thread of their editor.
+        if (self.conn.threadsafety >= 2
+            or not self.can_refresh_in_background()):
+            return self.conn
+        return self.datasource.open_background_connection()
+
+    def _close_refresh_connection(self, conn):
+        if conn is not self.conn:
+            conn.close()
 
     def get_children(self, parent=None):
         """Get child objects for parent."""
         if parent is not None and parent.props.refresh_required:
-            self.backend.refresh(parent, self, self.conn)
-            parent.props.refresh_required = False
+            self._load_lock.acquire()
+            try:
+                if parent.props.refresh_required:
+                    conn = self._open_refresh_connection()
+                    try:
+                        self.backend.refresh(parent, self, conn)
+                    finally:
+                        self._close_refresh_connection(conn)
+                    parent.props.refresh_required = False
+            finally:
+                self._load_lock.release()
         return self.find(parent=parent)
 
+    def load_columns(self, tables):
+        """Loads the columns of many tables and views at once."""
+        self.refresh_collections([table.columns for table in tables
+                                  if isinstance(table, (objects.Table,
+                                                        objects.View))])
+
+    def refresh_collections(self, collections):
+        """Refreshes many collections with as few queries as possible.
+
+        Only collections that weren't loaded yet are refreshed. They're
+        grouped by type and each group is passed to the backend's
+        :meth:`refresh_many`.
+        """
+        self._load_lock.acquire()
+        try:
+            by_type = {}
+            for coll in collections:
+                group = by_type.setdefault(coll.typeid, [])
+                if coll.props.refresh_required and coll not in group:
+                    group.append(coll)
+            groups = [group for group in by_type.itervalues() if group]
+            if not groups:
+                return
+            conn = self._open_refresh_connection()
+            try:
+                for group in groups:
+                    self.backend.refresh_many(group, self, conn)
+                    for coll in group:
+                        coll.props.refresh_required = False
+            finally:
+                self._close_refresh_connection(conn)
+        finally:
+            self._load_lock.release()
+
     def find(self, **kwds):
         """Find an object using searchterm."""
-        res = list(self._items)
-        if 'cls' in kwds:
-            objcls = kwds.pop('cls')
-            res = filter(lambda x: isinstance(x, objcls), res)
-        for key, value in kwds.iteritems():
-            res = filter(lambda x: x.property_matches(key, value), res)
-        return res
+        self._lock.acquire()
+        try:
+            return self._items.find(**kwds)
+        finally:
+            self._lock.release()
+
+    def find_completions(self, fragment, limit=None):
+        """Returns completions for *fragment*, see CompletionIndex.find()."""
+        self._lock.acquire()
+        try:
+            return self.completions.find(fragment, limit)
+        finally:
+            self._lock.release()
 
     def find_exact(self, **kwds):
         """Like :meth:`find`, but returns exactly one match or ``None``."""
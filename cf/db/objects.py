@@ -95,6 +95,9 @@ class GObjectBase(gobject.GObject):
         else:
             raise AttributeError, 'unknown property %s' % property.name
 
+    def has_property(self, name):
+        return name in self._data
+
     def apply_data(self, data):
         """Applies data to the object.
 
@@ -113,39 +116,15 @@ class GObjectBase(gobject.GObject):
 
 
 
-class DBObject(GObjectBase):
+class DBObjectMixin(object):
+    """Methods shared by :class:`DBObject` and :class:`LeafObject`."""
 
-    __gproperties__ = {
-        'name' : (
-            gobject.TYPE_STRING,
-            'Name', 'Object name',
-            '',
-            gobject.PARAM_READWRITE),
-        'comment' : (
-            gobject.TYPE_STRING,
-            'Comment', 'Object comment',
-            '',
-            gobject.PARAM_READWRITE),
-        'refresh_required' : (
-            gobject.TYPE_BOOLEAN,
-            'Refresh required', 'Refresh required',
-            True,
-            gobject.PARAM_READWRITE),
-        'has_children': (
-            gobject.TYPE_BOOLEAN,
-            'Has children', 'Has children',
-            True,
-            gobject.PARAM_READWRITE),
-        }
+    __slots__ = ()
 
     typeid = ''
     typestr = u'???'
     icon = 'gtk-missing-image'
 
-    def __init__(self, meta, **kwds):
-        GObjectBase.__init__(self, initial_data=kwds)
-        self.meta = meta
-
     def __repr__(self):
         return '<%s "%s" at 0x%07x>' % (self.__class__.__name__,
                                         self.get_display_name(), id(self))
@@ -167,7 +146,7 @@ class DBObject(GObjectBase):
                 cmp_func = lambda x, y: bool(p.match(x))
         else:
             cmp_func = lambda x, y: x == y
-        if name in self._data:
+        if self.has_property(name):
             cmp_value = self.get_property(name)
         else:
             cmp_value = self.get_data(name)
@@ -191,6 +170,216 @@ class DBObject(GObjectBase):
                                 gtk.ICON_LOOKUP_GENERIC_FALLBACK)
 
 
+class DBObject(GObjectBase, DBObjectMixin):
+
+    __gproperties__ = {
+        'name' : (
+            gobject.TYPE_STRING,
+            'Name', 'Object name',
+            '',
+            gobject.PARAM_READWRITE),
+        'comment' : (
+            gobject.TYPE_STRING,
+            'Comment', 'Object comment',
+            '',
+            gobject.PARAM_READWRITE),
+        'refresh_required' : (
+            gobject.TYPE_BOOLEAN,
+            'Refresh required', 'Refresh required',
+            True,
+            gobject.PARAM_READWRITE),
+        'has_children': (
+            gobject.TYPE_BOOLEAN,
+            'Has children', 'Has children',
+            True,
+            gobject.PARAM_READWRITE),
+        }
+
+    def __init__(self, meta, **kwds):
+        GObjectBase.__init__(self, initial_data=kwds)
+        self.meta = meta
+
+    def do_set_property(self, property, value):
+        GObjectBase.do_set_property(self, property, value)
+        # Keep the lookup indexes of the meta object in sync.
+        meta = getattr(self, 'meta', None)
+        if meta is not None and property.name in ('name', 'parent'):
+            meta.update_object(self)
+
+
+class _LeafProperty(object):
+    """Descriptor for a property of a :class:`LeafObject`.
+
+    Values are stored in a slot, unset slots fall back to the default.
+    """
+
+    __slots__ = ('name', 'slot', 'default')
+
+    def __init__(self, name, slot, default):
+        self.name = name
+        self.slot = slot
+        self.default = default
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return self.slot.__get__(instance, owner)
+        except AttributeError:
+            return self.default
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+        instance._property_changed(self.name)
+
+
+class LeafObjectMeta(type):
+    """Creates slots and attributes from the ``properties`` dictionary."""
+
+    def __new__(cls, name, bases, dct):
+        inherited = set()
+        for base in bases:
+            inherited.update(getattr(base, '_descriptors', {}))
+        properties = dct.pop('properties', {})
+        new_props = [key for key in properties if key not in inherited]
+        dct['__slots__'] = (tuple(dct.get('__slots__', ()))
+                            + tuple('_p_%s' % key for key in new_props))
+        new_cls = type.__new__(cls, name, bases, dct)
+        descriptors = {}
+        for base in reversed(bases):
+            descriptors.update(getattr(base, '_descriptors', {}))
+        for key in properties:
+            slot = getattr(new_cls, '_p_%s' % key)
+            descriptor = _LeafProperty(key, slot, properties[key])
+            descriptors[key] = descriptor
+            # Like DBObjectMeta, but methods (e.g. has_children) win.
+            if not callable(getattr(new_cls, key, None)):
+                setattr(new_cls, key, descriptor)
+        new_cls._descriptors = descriptors
+        return new_cls
+
+
+class _LeafProps(object):
+    """Emulates the ``props`` attribute of GObjects."""
+
+    __slots__ = ('_obj',)
+
+    def __init__(self, obj):
+        object.__setattr__(self, '_obj', obj)
+
+    def __getattr__(self, name):
+        return self._obj.get_property(name)
+
+    def __setattr__(self, name, value):
+        self._obj.set_property(name, value)
+
+
+class _LeafNotifier(gobject.GObject):
+    """Emits signals on behalf of a :class:`LeafObject`."""
+
+    __gsignals__ = {
+        'changed': (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE,
+                    (gobject.TYPE_STRING,)),
+        }
+
+
+class LeafObject(DBObjectMixin):
+    """Compact representation of objects without children.
+
+    Catalogs may contain hundreds of thousands of columns, indexes and
+    constraints. Instead of being a GObject, each leaf object stores
+    its properties in slots and class-level defaults. Properties are
+    declared in the ``properties`` dictionary of a class, mapping
+    property names to default values.
+
+    The object provides the same property API as :class:`DBObject`
+    (attributes, :attr:`props`, :meth:`get_property`,
+    :meth:`set_property`, :meth:`get_data` and :meth:`set_data`).
+    A GObject is only created when :meth:`connect` is called. It emits
+    ``notify`` for changed properties.
+    """
+
+    __metaclass__ = LeafObjectMeta
+    __slots__ = ('meta', '_notifier', '__dict__')
+
+    properties = {
+        'name': '',
+        'comment': '',
+        'refresh_required': False,
+        'has_children': False,
+        'parent': None,
+        'oid': None,
+        }
+
+    def __init__(self, meta, **kwds):
+        # Fill the slots directly, there's nothing to notify yet.
+        descriptors = self._descriptors
+        for key, value in kwds.iteritems():
+            if key in descriptors:
+                descriptors[key].slot.__set__(self, value)
+            else:
+                self.__dict__[key] = value
+        self.meta = meta
+        self._notifier = None
+
+    def _property_changed(self, name):
+        # Keep the lookup indexes of the meta object in sync.
+        if name in ('name', 'parent'):
+            self.meta.update_object(self)
+        if self._notifier is not None:
+            self._notifier.emit('changed', name)
+
+    @property
+    def props(self):
+        return _LeafProps(self)
+
+    def has_property(self, name):
+        return name in self._descriptors
+
+    def get_property(self, name):
+        if name not in self._descriptors:
+            raise AttributeError, 'unknown property %s' % name
+        return self._descriptors[name].__get__(self, None)
+
+    def set_property(self, name, value):
+        if name not in self._descriptors:
+            raise AttributeError, 'unknown property %s' % name
+        self._descriptors[name].__set__(self, value)
+
+    def get_data(self, key):
+        return self.__dict__.get(key)
+
+    def set_data(self, key, value):
+        self.__dict__[key] = value
+
+    def apply_data(self, data):
+        """Applies data to the object (see :meth:`GObjectBase.apply_data`)."""
+        for key, value in data.iteritems():
+            if key in self._descriptors:
+                self._descriptors[key].__set__(self, value)
+            else:
+                self.__dict__[key] = value
+
+    def connect(self, detailed_signal, callback, *args):
+        """Connects to ``notify`` or ``notify::<property>``.
+
+        The callback receives this object and the property name.
+        """
+        signal, detail = (detailed_signal.split('::', 1) + [None])[:2]
+        if signal != 'notify':
+            raise TypeError, 'unknown signal name: %s' % detailed_signal
+        if self._notifier is None:
+            self._notifier = _LeafNotifier()
+        notifier = self._notifier
+        def changed(notifier, name):
+            if detail is None or detail == name:
+                callback(self, name, *args)
+        return notifier.connect('changed', changed)
+
+    def disconnect(self, handler_id):
+        self._notifier.disconnect(handler_id)
+
+
 class Collection(DBObject):
     """Base class for collections.
 
@@ -480,37 +669,26 @@ class Columns(Collection):
         self.objects.append(col)
         return col
 
-class Column(DBObject):
+class Column(LeafObject):
 
-    __gproperties__ = {"sortorder" : (gobject.TYPE_INT,
-                                      "Sort order", "Sort order", -1, 10000, -1,
-                                      gobject.PARAM_READWRITE),
-                       "type" : (gobject.TYPE_PYOBJECT,
-                                 "Data type", "Data type",
-                                 gobject.PARAM_READWRITE),
-                       "default" : (gobject.TYPE_PYOBJECT,
-                                    "Default", "Default value",
-                                    gobject.PARAM_READWRITE),
-                       "pk" : (gobject.TYPE_BOOLEAN,
-                               "Primary key", "Primary key", False,
-                               gobject.PARAM_READWRITE),
-                       "nullable" : (gobject.TYPE_BOOLEAN,
-                                     "Nullable", "Nullable", False,
-                                     gobject.PARAM_READWRITE),
-                       "parent" : (gobject.TYPE_PYOBJECT,
-                                   "Parent", "Parent object",
-                                   gobject.PARAM_READWRITE)}
+    properties = {
+        'sortorder': -1,
+        'type': None,
+        'default': None,
+        'pk': False,
+        'nullable': False,
+        }
 
     icon = 'gdbo-column'
+    typeid = 'column'
+    typestr = _(u'Column')
 
     def __init__(self, meta, parent, *args, **kwargs):
         kwargs["parent"] = parent
-        DBObject.__init__(self, meta, *args, **kwargs)
-        self.typeid = "column"
-        self.typestr = _(u"Column")
+        LeafObject.__init__(self, meta, *args, **kwargs)
 
     def __cmp__(self, other):
-        if not isinstance(other, Column) and isinstance(other, DBObject):
+        if not isinstance(other, Column) and isinstance(other, DBObjectMixin):
             return cmp(self.props.name, other.props.name)
         elif isinstance(other, Column):
             return cmp(self.props.sortorder, other.props.sortorder)
@@ -529,35 +707,25 @@ class Constraints(Collection):
         self.objects.append(c)
         return c
 
-class Constraint(DBObject):
+class Constraint(LeafObject):
 
-    __gproperties__ = {"type" : (gobject.TYPE_STRING,
-                                 "Sort order", "Sort order", None,
-                                 gobject.PARAM_READWRITE),
-                       "check_expression" : (gobject.TYPE_STRING,
-                                             "Check expression", "Check expression", "",
-                                             gobject.PARAM_READWRITE),
-                       "columns" : (gobject.TYPE_PYOBJECT,
-                                    "Primary/unique columns", "Primary key/unique columns",
-                                    gobject.PARAM_READWRITE),
-                       "fkcolumns" : (gobject.TYPE_PYOBJECT,
-                                      "Foreign key columns", "Foreign key columns",
-                                      gobject.PARAM_READWRITE),
-                       "parent" : (gobject.TYPE_PYOBJECT,
-                                   "Parent object", "Parent object",
-                                   gobject.PARAM_READWRITE)}
+    properties = {
+        'type': None,
+        'check_expression': '',
+        'columns': None,
+        'fkcolumns': None,
+        }
 
     icon = 'gtk-spell-check'
+    typeid = 'constraint'
+    typestr = _(u'Constraint')
 
     def __init__(self, meta, parent, *args, **kwargs):
         kwargs["parent"] = parent
-        DBObject.__init__(self, meta, *args, **kwargs)
-        self.typeid = "constraint"
-        self.typestr = _(u"Constraint")
+        LeafObject.__init__(self, meta, *args, **kwargs)
         self.columns = Columns(self.meta, parent=self)
         self.meta.set_object(self.columns)
         self.fkcolumns = Columns(self.meta, parent=self)
-        self.props.has_children = False
 
 class Function(DBObject):
 
@@ -828,16 +996,12 @@ class Languages(Collection):
         self.typestr = _(u"Languages")
 
 
-class Index(DBObject):
+class Index(LeafObject):
 
     icon = 'stock_navigator-indexes'
     typeid = 'index'
     typestr = _(u'Index')
 
-    def __init__(self, meta, **kwds):
-        DBObject.__init__(self, meta, **kwds)
-        self.props.has_children = False
-
 
 class Indexes(Collection):
 
@@ -848,10 +1012,9 @@ class Indexes(Collection):
         Collection.__init__(self, meta, Index, **kwds)
 
 
+gobject.type_register(_LeafNotifier)
 gobject.type_register(Columns)
-gobject.type_register(Column)
 gobject.type_register(Constraints)
-gobject.type_register(Constraint)
 gobject.type_register(Functions)
 gobject.type_register(Function)
 gobject.type_register(Schemata)
@@ -868,5 +1031,4 @@ gobject.type_register(Views)
 gobject.type_register(View)
 gobject.type_register(Languages)
 gobject.type_register(Language)
-gobject.type_register(Index)
 gobject.type_register(Indexes)
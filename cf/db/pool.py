@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# crunchyfrog - a database schema browser and query tool
+# Copyright (C) 2009 Andi Albrecht <albrecht.andi@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Connection pooling."""
+
+import logging
+import thread
+import time
+
+import gobject
+
+
+# Interval in seconds between two runs of the idle connection reaper.
+REAP_INTERVAL = 30
+
+
+class ConnectionPool(object):
+    """Pool of physical DB-API2 connections for a data source.
+
+    Connections given back with :meth:`release` are reset using the
+    backend's :meth:`reset_connection` and kept for reuse. Connections
+    that changed their session (e.g. variables or temporary tables) are
+    closed instead, unless the backend was able to reset the session.
+    Before a pooled connection is handed out again, it's checked using
+    the backend's :meth:`check_connection`. Connections that were idle
+    for more than *idle_timeout* seconds are closed, but at least
+    *min_size* idle connections are kept open.
+
+    The reaper additionally closes connections of the data source that
+    are neither used by an editor nor in a transaction.
+    """
+
+    def __init__(self, datasource, min_size=0, max_size=5, idle_timeout=300):
+        self.datasource = datasource
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # (DB-API2 connection, release time, reset), oldest first
+        self._idle = []
+        self._lock = thread.allocate_lock()
+        self._reaper = None
+
+    def __len__(self):
+        return len(self._idle)
+
+    def acquire(self):
+        """Returns a DB-API2 connection.
+
+        The return value is a 2-tuple (connection, created) where *created*
+        is ``True`` if a new physical connection was opened or if the
+        session of a pooled connection was reset. The connection needs
+        to be set up again then.
+        """
+        backend = self.datasource.backend
+        while True:
+            self._lock.acquire()
+            try:
+                if not self._idle:
+                    break
+                conn, released, reset = self._idle.pop()
+            finally:
+                self._lock.release()
+            if backend.check_connection(conn):
+                self._start_reaper()
+                return conn, reset
+            self._close(conn)
+        conn = backend.get_connection(self.datasource.url)
+        self._start_reaper()
+        return conn, True
+
+    def release(self, conn, session_changed=False):
+        """Gives a DB-API2 connection back to the pool.
+
+        The connection is closed if it can't be reset, if the pool is
+        full or if *session_changed* is ``True`` and the backend can't
+        reset the session.
+        """
+        try:
+            reset = self.datasource.backend.reset_connection(conn)
+        except:
+            logging.debug('Failed to reset pooled connection', exc_info=True)
+            self._close(conn)
+            return
+        if session_changed and not reset:
+            # The next user would inherit the session state.
+            self._close(conn)
+            return
+        self._lock.acquire()
+        try:
+            keep = len(self._idle) < self.max_size
+            if keep:
+                self._idle.append((conn, time.time(), reset))
+        finally:
+            self._lock.release()
+        if not keep:
+            self._close(conn)
+
+    def reap(self, now=None):
+        """Closes connections idle for more than *idle_timeout* seconds.
+
+        Returns the number of closed connections.
+        """
+        if now is None:
+            now = time.time()
+        self._lock.acquire()
+        try:
+            expired = []
+            keep = []
+            for item in self._idle:
+                if (now-item[1] >= self.idle_timeout
+                    and len(self._idle)-len(expired) > self.min_size):
+                    expired.append(item[0])
+                else:
+                    keep.append(item)
+            self._idle = keep
+        finally:
+            self._lock.release()
+        for conn in expired:
+            self._close(conn)
+        return len(expired)
+
+    def clear(self):
+        """Closes all idle connections."""
+        self._lock.acquire()
+        try:
+            idle = self._idle
+            self._idle = []
+        finally:
+            self._lock.release()
+        for item in idle:
+            self._close(item[0])
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except:
+            logging.debug('Failed to close pooled connection', exc_info=True)
+
+    def _start_reaper(self):
+        if self._reaper is None and self.idle_timeout > 0:
+            self._reaper = gobject.timeout_add(REAP_INTERVAL*1000,
+                                               self._on_reap)
+
+    def _on_reap(self):
+        self.datasource.close_unused_connections(self.idle_timeout)
+        self.reap()
+        if not self._idle and not self.datasource.connections:
+            self._reaper = None
+            return False
+        return True
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+# crunchyfrog - a database schema browser and query tool
+# Copyright (C) 2009 Andi Albrecht <albrecht.andi@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Result storage with spilling to disk.
+
+Query results are kept in :class:`ResultStore` instances. All stores
+share a :class:`MemoryBudget`. When the rows held in memory exceed the
+budget, the last recently used pages of any store are written to a
+temporary file and read back when they're accessed again.
+
+Complete pages are converted to :class:`cf.db.columnar.ColumnBatch`
+instances unless columnar storage is turned off.
+"""
+
+import copy_reg
+import cPickle
+import logging
+import sys
+import tempfile
+import thread
+import weakref
+
+from cf.db.columnar import ColumnBatch
+
+
+# Number of rows per page.
+DEFAULT_PAGE_SIZE = 1000
+
+
+def _reduce_buffer(value):
+    return buffer, (str(value),)
+
+# BLOB values are returned as buffer objects, cPickle can write them but
+# fails to read them back.
+copy_reg.pickle(buffer, _reduce_buffer)
+
+
+class MemoryBudget(object):
+    """Memory limit shared by result stores.
+
+    *limit* is the number of bytes that all pages held in memory may use
+    or ``None`` for no limit. Sizes are estimates based on
+    ``sys.getsizeof``.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self._lru = []  # (store ref, page number, size), oldest first
+        self._lock = thread.allocate_lock()
+
+    def add(self, store, page_no, size):
+        """Accounts a page that's now held in memory."""
+        self._lock.acquire()
+        try:
+            self._lru.append((store._ref, page_no, size))
+            self.used += size
+        finally:
+            self._lock.release()
+        self.enforce()
+
+    def touch(self, store, page_no):
+        """Marks a page as recently used."""
+        self._lock.acquire()
+        try:
+            for idx, entry in enumerate(self._lru):
+                if entry[0] is store._ref and entry[1] == page_no:
+                    if idx != len(self._lru)-1:
+                        del self._lru[idx]
+                        self._lru.append(entry)
+                    break
+        finally:
+            self._lock.release()
+
+    def release(self, ref):
+        """Forgets all pages of a store."""
+        self._lock.acquire()
+        try:
+            keep = []
+            for entry in self._lru:
+                if entry[0] is ref:
+                    self.used -= entry[2]
+                else:
+                    keep.append(entry)
+            self._lru = keep
+        finally:
+            self._lock.release()
+
+    def enforce(self):
+        """Spills pages until the memory used is within the limit."""
+        while True:
+            self._lock.acquire()
+            try:
+                if (self.limit is None or self.used <= self.limit
+                    or not self._lru):
+                    return
+                ref, page_no, size = self._lru.pop(0)
+                self.used -= size
+            finally:
+                self._lock.release()
+            store = ref()
+            if store is not None:
+                store._spill(page_no)
+
+
+default_budget = MemoryBudget()
+
+# Store complete pages column by column.
+default_columnar = True
+
+
+def setup(app):
+    """Apply the configured memory budget.
+
+    :param app: Application instance.
+    """
+    global default_columnar
+    _set_limit(app.config.get('editor.results.memory_budget'))
+    default_columnar = app.config.get('editor.results.columnar')
+    app.config.connect('changed', on_config_changed)
+
+
+def on_config_changed(config, key, value):
+    global default_columnar
+    if key == 'editor.results.memory_budget':
+        _set_limit(value)
+    elif key == 'editor.results.columnar':
+        default_columnar = value
+
+
+def _set_limit(megabytes):
+    if megabytes:
+        default_budget.limit = megabytes*1024*1024
+    else:
+        default_budget.limit = None
+    default_budget.enforce()
+
+
+def estimate_size(rows):
+    """Returns the estimated memory used by a list of rows in bytes."""
+    if isinstance(rows, ColumnBatch):
+        return sys.getsizeof(rows)+rows.estimate_size()
+    # Only a few rows are measured, it's an estimate anyway.
+    samples = [rows[0], rows[len(rows)//2], rows[-1]]
+    size = 0
+    for row in samples:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return sys.getsizeof(rows)+size*len(rows)//len(samples)
+
+
+class ResultStore(object):
+    """Append-only sequence of rows that's spilled to disk if needed.
+
+    Rows are stored in pages of *page_size* rows. Complete pages are
+    accounted to *budget* (defaults to the application-wide budget) and
+    may be written to a temporary file at any time. The store can be
+    read from any thread.
+
+    If *columnar* is ``True`` (defaults to the configured setting),
+    complete pages are stored as `cf.db.columnar.ColumnBatch`.
+    """
+
+    def __init__(self, page_size=DEFAULT_PAGE_SIZE, budget=None,
+                 columnar=None):
+        self.page_size = page_size
+        self.budget = budget or default_budget
+        if columnar is None:
+            columnar = default_columnar
+        self.columnar = columnar
+        self._pages = []  # list of rows or None if spilled
+        self._locations = {}  # page number -> (file offset, length)
+        self._resident = set()  # page numbers accounted to the budget
+        self._last_page = None
+        self._length = 0
+        self._file = None
+        self._lock = thread.allocate_lock()
+        budget = self.budget
+        self._ref = weakref.ref(self, lambda ref: budget.release(ref))
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('row index out of range')
+        page_no, offset = divmod(index, self.page_size)
+        return self._get_page(page_no)[offset]
+
+    def get_value(self, index, column):
+        """Returns a single value without building the whole row."""
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('row index out of range')
+        page_no, offset = divmod(index, self.page_size)
+        page = self._get_page(page_no)
+        if isinstance(page, ColumnBatch):
+            return page.get_value(offset, column)
+        return page[offset][column]
+
+    def __iter__(self):
+        for page_no in xrange(len(self._pages)):
+            for row in self._get_page(page_no):
+                yield row
+
+    def extend(self, rows):
+        """Appends rows."""
+        pages = []
+        self._lock.acquire()
+        try:
+            for row in rows:
+                if not self._pages or len(self._pages[-1]) >= self.page_size:
+                    self._pages.append([])
+                page = self._pages[-1]
+                page.append(row)
+                self._length += 1
+                if len(page) == self.page_size:
+                    page_no = len(self._pages)-1
+                    if self.columnar:
+                        page = ColumnBatch(page)
+                        self._pages[page_no] = page
+                    self._resident.add(page_no)
+                    pages.append((page_no, page))
+        finally:
+            self._lock.release()
+        for page_no, page in pages:
+            self.budget.add(self, page_no, estimate_size(page))
+
+    def append(self, row):
+        """Appends a single row."""
+        self.extend([row])
+
+    def close(self):
+        """Releases memory and the temporary file."""
+        self.budget.release(self._ref)
+        self._lock.acquire()
+        try:
+            self._pages = []
+            self._locations = {}
+            self._resident = set()
+            self._last_page = None
+            self._length = 0
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        finally:
+            self._lock.release()
+
+    def _get_page(self, page_no):
+        self._lock.acquire()
+        try:
+            page = self._pages[page_no]
+            loaded = page is None
+            if loaded:
+                offset, length = self._locations[page_no]
+                self._file.seek(offset)
+                page = cPickle.loads(self._file.read(length))
+                self._pages[page_no] = page
+                self._resident.add(page_no)
+            touch = (not loaded and page_no != self._last_page
+                     and page_no in self._resident)
+            self._last_page = page_no
+        finally:
+            self._lock.release()
+        if loaded:
+            self.budget.add(self, page_no, estimate_size(page))
+        elif touch:
+            self.budget.touch(self, page_no)
+        return page
+
+    def _spill(self, page_no):
+        self._lock.acquire()
+        try:
+            if page_no not in self._resident:
+                # The store was closed in the meantime.
+                return
+            # The budget doesn't account the page anymore, even if it
+            # can't be written. It's kept in memory then.
+            self._resident.discard(page_no)
+            if page_no not in self._locations:
+                try:
+                    data = cPickle.dumps(self._pages[page_no], 2)
+                    if self._file is None:
+                        self._file = tempfile.TemporaryFile(
+                            prefix='cf-results-')
+                    self._file.seek(0, 2)
+                    offset = self._file.tell()
+                    self._file.write(data)
+                except Exception:
+                    logging.exception('Failed to spill result page')
+                    return
+                self._locations[page_no] = (offset, len(data))
+            self._pages[page_no] = None
+            if self._last_page == page_no:
+                self._last_page = None
+        finally:
+            self._lock.release()
@@ -0,0 +1,1040 @@
+# -*- coding: utf-8 -*-
+
+# crunchyfrog - a database schema browser and query tool
+# Copyright (C) 2009 Andi Albrecht <albrecht.andi@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simulated DB-API2 driver.
+
+The driver doesn't talk to a database server. It answers the catalog
+queries of the Postgres, MySQL and Oracle backends from a generated
+catalog and returns generated rows for queries on the generated
+tables. This allows to load-test meta data loading and query execution
+without a server.
+
+Each call to ``execute()`` or a fetch method is a round-trip taking
+*latency* seconds. Rows are transferred with *throughput* rows per
+second. Statements like ``SELECT pg_sleep(2)`` keep the imaginary
+server busy. Running calls can be cancelled and are stopped when the
+statement timeout is exceeded, errors look like the ones raised by the
+real drivers.
+
+Connection arguments:
+
+  flavor
+    ``postgres`` (default), ``mysql`` or ``oracle``.
+  objects
+    Number of tables, views and sequences in the catalog.
+  latency
+    Seconds per round-trip.
+  throughput
+    Rows per second, unlimited if not given.
+  rows
+    Number of rows in each table.
+  seed
+    Seed for generating the catalog.
+
+Arguments may be given as strings, so that they can be taken from the
+query part of a data source URL.
+"""
+
+import csv
+import datetime
+import itertools
+import random
+import re
+import thread
+import threading
+import time
+import weakref
+
+
+apilevel = '2.0'
+threadsafety = 2
+paramstyle = 'pyformat'
+
+# Default number of rows in each table.
+DEFAULT_ROWS = 1000
+
+# Number of relations per schema.
+SCHEMA_SIZE = 500
+
+# OIDs of generated objects start here, like in PostgreSQL.
+FIRST_OID = 16384
+
+_WORDS = ('account', 'address', 'audit', 'customer', 'event', 'invoice',
+          'item', 'log', 'order', 'payment', 'product', 'region', 'session',
+          'shipment', 'stock', 'user')
+
+_BASE_DATE = datetime.datetime(2000, 1, 1)
+
+
+class Warning(StandardError):
+    pass
+
+
+class Error(StandardError):
+    # Set on errors of the postgres flavor, like psycopg2 does.
+    pgerror = None
+    pgcode = None
+
+
+class InterfaceError(Error):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class DataError(DatabaseError):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+class InternalError(DatabaseError):
+    pass
+
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+class NotSupportedError(DatabaseError):
+    pass
+
+
+class QueryCanceledError(OperationalError):
+    """Raised when a statement was cancelled (postgres flavor)."""
+
+
+class _Error(object):
+    """Error details used by the oracle flavor, like in cx_Oracle."""
+
+    def __init__(self, message, code=None, offset=None):
+        self.message = message
+        self.code = code
+        self.offset = offset
+
+    def __str__(self):
+        return self.message
+
+
+class _Extensions(object):
+    """Constants from psycopg2.extensions used by the Postgres backend."""
+
+    ISOLATION_LEVEL_AUTOCOMMIT = 0
+    TRANSACTION_STATUS_IDLE = 0
+    TRANSACTION_STATUS_ACTIVE = 1
+    TRANSACTION_STATUS_INTRANS = 2
+    TRANSACTION_STATUS_INERROR = 3
+
+extensions = _Extensions
+
+
+# Type codes used in cursor descriptions.
+TYPE_INTEGER = 1
+TYPE_TEXT = 2
+TYPE_TIMESTAMP = 3
+TYPE_NUMERIC = 4
+
+
+class _TypeObject(object):
+
+    def __init__(self, *values):
+        self.values = values
+
+    def __eq__(self, other):
+        return other in self.values
+
+    def __ne__(self, other):
+        return other not in self.values
+
+
+STRING = _TypeObject(TYPE_TEXT)
+BINARY = _TypeObject()
+NUMBER = _TypeObject(TYPE_INTEGER, TYPE_NUMERIC)
+DATETIME = _TypeObject(TYPE_TIMESTAMP)
+ROWID = _TypeObject()
+
+
+class Relation(object):
+    """A generated table, view or sequence."""
+
+    __slots__ = ('oid', 'schema', 'name', 'kind', 'token')
+
+    def __init__(self, oid, schema, name, kind):
+        self.oid = oid
+        self.schema = schema
+        self.name = name
+        self.kind = kind
+        self.token = 1
+
+    def get_columns(self):
+        """Returns a list of 3-tuples (position, name, type code)."""
+        columns = [(1, 'id', TYPE_INTEGER)]
+        for pos in xrange(2, 3+self.oid % 9):
+            name = '%s_%d' % (_WORDS[(self.oid+pos) % len(_WORDS)], pos)
+            columns.append((pos, name, TYPE_INTEGER+pos % 4))
+        return columns
+
+
+class Catalog(object):
+    """Generated catalog with *size* relations.
+
+    About three quarters of the relations are tables, the rest are
+    views and sequences. Relations are spread over one schema per
+    ``SCHEMA_SIZE`` relations. There's one function per ten relations.
+    """
+
+    def __init__(self, size, seed=0):
+        rnd = random.Random(seed)
+        oids = itertools.count(FIRST_OID)
+        self.schemas = [(oids.next(), 'public')]
+        for idx in xrange(1, max(1, size//SCHEMA_SIZE)):
+            self.schemas.append((oids.next(), 'schema_%d' % idx))
+        self.relations = []
+        for idx in xrange(size):
+            value = rnd.random()
+            if value < .75:
+                kind = 'table'
+            elif value < .95:
+                kind = 'view'
+            else:
+                kind = 'sequence'
+            name = '%s_%s_%d' % (rnd.choice(_WORDS), rnd.choice(_WORDS), idx)
+            self.relations.append(Relation(oids.next(),
+                                           rnd.choice(self.schemas),
+                                           name, kind))
+        self.functions = []
+        for idx in xrange(size//10):
+            self.functions.append((oids.next(), rnd.choice(self.schemas),
+                                   'fn_%s_%d' % (rnd.choice(_WORDS), idx)))
+        self.users = [(10, 'postgres')]
+        for idx in xrange(max(1, size//1000)):
+            self.users.append((oids.next(), 'user_%d' % idx))
+        self.languages = [(12, 'internal'), (13, 'c'), (14, 'sql'),
+                          (oids.next(), 'plpgsql')]
+        self.by_oid = dict((rel.oid, rel) for rel in self.relations)
+        self._by_name = None
+        self._lock = thread.allocate_lock()
+
+    def find(self, name, schema=None):
+        """Returns the relation called *name* or ``None``."""
+        self._lock.acquire()
+        try:
+            if self._by_name is None:
+                self._by_name = {}
+                for rel in self.relations:
+                    self._by_name[(rel.schema[1], rel.name)] = rel
+                    self._by_name.setdefault((None, rel.name), rel)
+        finally:
+            self._lock.release()
+        return self._by_name.get((schema and schema.lower(), name.lower()))
+
+    def touch(self, count, seed=0):
+        """Simulates DDL on *count* relations, their tokens change."""
+        rnd = random.Random(seed)
+        for rel in rnd.sample(self.relations, min(count,
+                                                   len(self.relations))):
+            rel.token += 1
+
+
+_catalogs = {}
+_catalogs_lock = thread.allocate_lock()
+
+
+def get_catalog(size, seed=0):
+    """Returns the shared catalog for *size* and *seed*.
+
+    Catalogs are generated once and shared by all connections.
+    """
+    _catalogs_lock.acquire()
+    try:
+        key = (size, seed)
+        if key not in _catalogs:
+            _catalogs[key] = Catalog(size, seed)
+        return _catalogs[key]
+    finally:
+        _catalogs_lock.release()
+
+
+def _get_value(type_code, pos, row):
+    if type_code == TYPE_INTEGER:
+        if pos == 1:
+            return row+1
+        return (row*7919+pos) % 100000
+    elif type_code == TYPE_TEXT:
+        if row % 10 == 9:
+            return None
+        return '%s %d' % (_WORDS[(row+pos) % len(_WORDS)], row)
+    elif type_code == TYPE_TIMESTAMP:
+        return _BASE_DATE+datetime.timedelta(minutes=row)
+    return (row*31+pos) % 100000 / 100.0
+
+
+class _GeneratedRows(object):
+    """Read-only sequence of generated rows."""
+
+    def __init__(self, columns, count):
+        self.columns = columns
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('row index out of range')
+        return tuple(_get_value(type_code, pos, index)
+                     for pos, name, type_code in self.columns)
+
+
+_P_QUOTED = re.compile(r"'((?:[^']|'')*)'")
+_P_SELECT = re.compile(r'^select\s+(?P<columns>.+?)\s+from\s+'
+                       r'(?P<name>[\w$."]+)', re.IGNORECASE|re.DOTALL)
+_P_SLEEP = re.compile(r'(?:pg_|dbms_session\.|dbms_lock\.)?sleep\s*'
+                      r'\(\s*(?P<seconds>[\d.]+)\s*\)', re.IGNORECASE)
+_P_COPY = re.compile(r'^COPY \((?P<query>.*)\) TO STDOUT WITH CSV HEADER$',
+                     re.DOTALL)
+
+
+def _get_quoted(text):
+    return [value.replace("''", "'") for value in _P_QUOTED.findall(text)]
+
+
+def _get_position(statement, word):
+    """Returns the offset of *word* in *statement* (case-insensitive)."""
+    match = re.search(r'\b%s\b' % re.escape(word), statement, re.IGNORECASE)
+    if match is None:
+        return 0
+    return match.start()
+
+
+class _Flavor(object):
+    """Answers the catalog queries of a backend and raises its errors."""
+
+    name = None
+    server_version = None
+    # Relation kinds in the catalog of this flavor.
+    kinds = ('table', 'view', 'sequence')
+
+    def fold(self, name):
+        """Returns the name of an object as stored in the catalog."""
+        return name
+
+    def session(self, conn, sql):
+        """Handles session statements, returns ``True`` if handled."""
+        return False
+
+    def catalog(self, conn, sql):
+        """Returns (column names, rows) for catalog queries or ``None``."""
+        return None
+
+    def unknown_relation(self, conn, sql, name):
+        raise ProgrammingError('relation %s does not exist' % name)
+
+    def cancelled(self, conn):
+        return OperationalError('statement cancelled')
+
+    def timed_out(self, conn):
+        return OperationalError('statement timeout')
+
+
+class _Postgres(_Flavor):
+
+    name = 'postgres'
+    server_version = ('PostgreSQL 9.6.24 on x86_64-pc-linux-gnu'
+                      ' (simulated)')
+
+    def __init__(self):
+        from cf.db.backends import postgres
+        self._phases = dict((sql.strip(), phase)
+                            for phase, sql in postgres.PG_CATALOG_PHASES)
+        self._initial = postgres.PG_INITIAL_SQL.strip()
+        self._keys_prefix = ('SELECT * FROM (%s) cat WHERE '
+                             % postgres.PG_INITIAL_SQL)
+        self._state = postgres.PG_CATALOG_STATE_SQL.strip()
+
+    def session(self, conn, sql):
+        lower = sql.lower()
+        if lower.startswith('set statement_timeout'):
+            value = int(sql.split('=', 1)[1].strip().strip("'"))
+            conn.statement_timeout = value and value/1000.0 or None
+        elif lower in ('begin', 'start transaction'):
+            conn.status = extensions.TRANSACTION_STATUS_INTRANS
+        elif lower in ('commit', 'end', 'rollback'):
+            conn.status = extensions.TRANSACTION_STATUS_IDLE
+        elif lower == 'discard all':
+            conn.statement_timeout = None
+        else:
+            return False
+        return True
+
+    def _get_rows(self, catalog, phase):
+        if phase == 'relations':
+            return [(rel.schema[0], rel.schema[1], rel.oid, rel.name, None,
+                     rel.kind) for rel in catalog.relations]
+        elif phase == 'functions':
+            return [(schema[0], schema[1], oid, name, None, 'function')
+                    for oid, schema, name in catalog.functions]
+        elif phase == 'users':
+            return [(None, None, oid, name, None, 'user')
+                    for oid, name in catalog.users]
+        return [(None, None, oid, name, None, 'language')
+                for oid, name in catalog.languages]
+
+    def _get_catalog(self, catalog):
+        rows = []
+        for phase in ('relations', 'functions', 'users', 'languages'):
+            rows.extend(self._get_rows(catalog, phase))
+        return rows
+
+    def catalog(self, conn, sql):
+        catalog = conn.catalog
+        names = ('nspoid', 'nspname', 'reloid', 'relname', 'description',
+                 'objtype')
+        if sql in self._phases:
+            return names, self._get_rows(catalog, self._phases[sql])
+        elif sql == self._initial:
+            return names, self._get_catalog(catalog)
+        elif sql.startswith(self._keys_prefix):
+            return names, self._get_keys(catalog, sql)
+        elif sql == self._state:
+            rows = [('rel', rel.oid, str(rel.token))
+                    for rel in catalog.relations]
+            rows.extend(('nsp', oid, '1') for oid, name in catalog.schemas)
+            rows.extend(('proc', oid, '1')
+                        for oid, schema, name in catalog.functions)
+            rows.extend(('lang', oid, '1') for oid, name in catalog.languages)
+            rows.extend(('user', oid, name) for oid, name in catalog.users)
+            return ('kind', 'oid', 'token'), rows
+        lower = sql.lower()
+        if lower == 'show search_path':
+            return ('search_path',), [('"$user",public',)]
+        elif lower == 'select current_user':
+            return ('current_user',), [(conn.user or 'postgres',)]
+        elif lower == 'select version()':
+            return ('version',), [(self.server_version,)]
+        elif ' from pg_attribute att' in sql:
+            rows = []
+            for rel in self._get_relations(catalog, sql):
+                if rel.kind != 'sequence':
+                    rows.extend((rel.oid, pos, name, None)
+                                for pos, name, type_code
+                                in rel.get_columns())
+            return ('attrelid', 'attnum', 'attname', 'description'), rows
+        elif ' from pg_constraint con' in sql:
+            rows = [(rel.oid+10000000, rel.oid, '%s_pkey' % rel.name, None)
+                    for rel in self._get_relations(catalog, sql)
+                    if rel.kind == 'table']
+            return ('oid', 'conrelid', 'conname', 'description'), rows
+        elif ' from pg_index ind' in sql:
+            rows = [(rel.oid+20000000, rel.oid, '%s_pkey' % rel.name, None)
+                    for rel in self._get_relations(catalog, sql)
+                    if rel.kind == 'table']
+            return ('oid', 'indrelid', 'relname', 'description'), rows
+        elif ' from pg_language lan' in sql:
+            return (('oid', 'lanname', 'description'),
+                    [(oid, name, None) for oid, name in catalog.languages])
+        elif ' from pg_proc pro' in sql:
+            nspoid = int(re.search(r'pronamespace = (\d+)', sql).group(1))
+            return (('oid', 'proname', 'description'),
+                    [(oid, name, None)
+                     for oid, schema, name in catalog.functions
+                     if schema[0] == nspoid])
+        return None
+
+    def _get_relations(self, catalog, sql):
+        oids = re.search(r"'\{([\d,]*)\}'::oid\[\]", sql).group(1)
+        return [catalog.by_oid[int(oid)] for oid in oids.split(',')
+                if oid and int(oid) in catalog.by_oid]
+
+    def _get_keys(self, catalog, sql):
+        rows = []
+        conditions = re.findall(r'objtype IN \(([^)]*)\) AND (\w+) IN '
+                                r'\(([^)]*)\)', sql[len(self._keys_prefix):])
+        for objtypes, column, oids in conditions:
+            objtypes = set(_get_quoted(objtypes))
+            oids = set(int(oid) for oid in oids.split(','))
+            col_idx = column == 'nspoid' and 0 or 2
+            rows.extend(row for row in self._get_catalog(catalog)
+                        if row[5] in objtypes and row[col_idx] in oids)
+        return rows
+
+    def _error(self, cls, message, code):
+        err = cls(message)
+        err.pgerror = message
+        err.pgcode = code
+        return err
+
+    def unknown_relation(self, conn, sql, name):
+        offset = _get_position(sql, name)
+        lines = sql[:offset].splitlines(True)
+        lineno = max(1, len(lines))
+        if lines and not lines[-1].endswith('\n'):
+            column = len(lines[-1])
+        else:
+            column = 0
+            lineno = len(lines)+1
+        prefix = 'LINE %d: ' % lineno
+        message = ('ERROR:  relation "%s" does not exist\n%s%s\n%s^\n'
+                   % (name, prefix, sql.splitlines()[lineno-1],
+                      ' '*(len(prefix)+column)))
+        return self._error(ProgrammingError, message, '42P01')
+
+    def cancelled(self, conn):
+        return self._error(QueryCanceledError,
+                           'ERROR:  canceling statement due to user request\n',
+                           '57014')
+
+    def timed_out(self, conn):
+        return self._error(QueryCanceledError,
+                           'ERROR:  canceling statement due to statement'
+                           ' timeout\n', '57014')
+
+
+class _MySQL(_Flavor):
+
+    name = 'mysql'
+    server_version = '5.7.44-simulated'
+    kinds = ('table', 'view')
+
+    def __init__(self):
+        from cf.db.backends import mysql
+        self._initial = mysql.INITIAL_SQL.strip()
+        self._keys_prefix = ('select * from (%s) y where '
+                             % mysql.INITIAL_SQL)
+        self._state = mysql.CATALOG_STATE_SQL.strip()
+        self._columns_prefix = mysql.COLUMNS_SQL.split('%s')[0]
+        self._constraints_prefix = mysql.CONSTRAINTS_SQL.split('%s')[0]
+
+    def session(self, conn, sql):
+        lower = sql.lower()
+        if lower.startswith('set session max_execution_time'):
+            value = int(sql.split('=', 1)[1])
+            conn.statement_timeout = value and value/1000.0 or None
+        elif lower.startswith('kill query'):
+            thread_id = int(sql.split()[-1])
+            other = _connections.get(thread_id)
+            if other is None:
+                raise OperationalError(1094, 'Unknown thread id: %d'
+                                       % thread_id)
+            other.cancel()
+        elif lower in ('begin', 'start transaction', 'commit', 'rollback'):
+            pass
+        else:
+            return False
+        return True
+
+    def _get_catalog(self, catalog):
+        rows = [(name, name, None, 'schema', None, 0)
+                for oid, name in catalog.schemas]
+        for rel in catalog.relations:
+            if rel.kind in self.kinds:
+                rows.append(('%s.%s' % (rel.schema[1], rel.name), rel.name,
+                             '', rel.kind == 'table' and 'BASE TABLE'
+                             or 'VIEW', rel.schema[1], 1))
+        return rows
+
+    def catalog(self, conn, sql):
+        catalog = conn.catalog
+        names = ('id', 'name', 'description', 'type', 'parent', 'pos')
+        if sql == self._initial:
+            return names, self._get_catalog(catalog)
+        elif sql.startswith(self._keys_prefix):
+            return names, self._get_keys(catalog, sql)
+        elif sql == self._state:
+            rows = [('schema', name, '') for oid, name in catalog.schemas]
+            rows.extend(('table', '%s.%s' % (rel.schema[1], rel.name),
+                         'BASE TABLE/%d/' % rel.token)
+                        for rel in catalog.relations
+                        if rel.kind in self.kinds)
+            return ('kind', 'id', 'token'), rows
+        elif sql.startswith(self._columns_prefix):
+            rows = []
+            for rel in self._get_relations(catalog, sql):
+                parent = '%s.%s' % (rel.schema[1], rel.name)
+                for pos, name, type_code in rel.get_columns():
+                    rows.append(('%s.%s' % (parent, name), parent, name, '',
+                                 pos, self._get_type(type_code), None,
+                                 pos == 1 and 'NO' or 'YES',
+                                 pos == 1 and 'PRI' or ''))
+            return ('id', 'parent', 'name', 'description', 'pos',
+                    'data_type', 'column_default', 'is_nullable',
+                    'column_key'), rows
+        elif sql.startswith(self._constraints_prefix):
+            rows = []
+            for rel in self._get_relations(catalog, sql):
+                if rel.kind == 'table':
+                    parent = '%s.%s' % (rel.schema[1], rel.name)
+                    rows.append((parent, '%s.primary' % parent,
+                                 'PRIMARY KEY'))
+            return ('parent', 'id', 'name'), rows
+        elif sql.endswith(' from mysql.user'):
+            return ('name',), [('%s@localhost' % name, )
+                               for oid, name in catalog.users]
+        return None
+
+    def _get_type(self, type_code):
+        return {TYPE_INTEGER: 'int(11)', TYPE_TEXT: 'varchar(255)',
+                TYPE_TIMESTAMP: 'datetime',
+                TYPE_NUMERIC: 'decimal(10,2)'}[type_code]
+
+    def _get_relations(self, catalog, sql):
+        relations = []
+        for schema, name in re.findall(r"\(table_schema = ('(?:[^']|'')*') "
+                                       r"and table_name = ('(?:[^']|'')*')\)",
+                                       sql):
+            rel = catalog.find(_get_quoted(name)[0], _get_quoted(schema)[0])
+            if rel is not None and rel.kind in self.kinds:
+                relations.append(rel)
+        return relations
+
+    def _get_keys(self, catalog, sql):
+        schemas = set()
+        tables = set()
+        for kind, ids in re.findall(r"\(type (=|<>) 'schema' and id in "
+                                    r"\(([^)]*)\)\)", sql):
+            if kind == '=':
+                schemas.update(_get_quoted(ids))
+            else:
+                tables.update(_get_quoted(ids))
+        return [row for row in self._get_catalog(catalog)
+                if (row[3] == 'schema' and row[0] in schemas)
+                or (row[3] != 'schema' and row[0] in tables)]
+
+    def unknown_relation(self, conn, sql, name):
+        return ProgrammingError(1146, "Table '%s.%s' doesn't exist"
+                                % (conn.database or 'public', name))
+
+    def cancelled(self, conn):
+        return OperationalError(1317, 'Query execution was interrupted')
+
+    def timed_out(self, conn):
+        return OperationalError(3024, 'Query execution was interrupted,'
+                                ' maximum statement execution time exceeded')
+
+
+class _Oracle(_Flavor):
+
+    name = 'oracle'
+    server_version = '19.0.0.0.0'
+
+    def __init__(self):
+        from cf.db.backends import oracle
+        self._initial = oracle.INITIAL_SQL.strip()
+        self._columns_prefix = oracle.COLUMNS_SQL.split('%s')[0]
+
+    def fold(self, name):
+        return name.upper()
+
+    def session(self, conn, sql):
+        return sql.lower() in ('commit', 'rollback')
+
+    def _get_id(self, rel):
+        return '%s.%s' % (rel.schema[1], rel.name)
+
+    def catalog(self, conn, sql):
+        catalog = conn.catalog
+        lower = sql.lower()
+        if sql == self._initial:
+            rows = [(name, None, name.upper(), None, 'schema', 1)
+                    for oid, name in catalog.schemas]
+            for rel in catalog.relations:
+                if rel.kind != 'sequence':
+                    rows.append((self._get_id(rel), rel.schema[1],
+                                 rel.name.upper(), None, 'table',
+                                 rel.kind == 'table' and 2 or 3))
+            return ('ID', 'PARENT', 'NAME', 'DESCRIPTION', 'TYPE',
+                    'POS'), rows
+        elif sql.startswith(self._columns_prefix):
+            rows = []
+            for owner, name in re.findall(r"\(t\.owner = ('(?:[^']|'')*') "
+                                          r"and t\.table_name = "
+                                          r"('(?:[^']|'')*')\)", sql):
+                rel = catalog.find(_get_quoted(name)[0],
+                                   _get_quoted(owner)[0])
+                if rel is None or rel.kind == 'sequence':
+                    continue
+                parent = self._get_id(rel)
+                for pos, name, type_code in rel.get_columns():
+                    rows.append(('%s.%s' % (parent, name), parent,
+                                 name.upper(), None, pos,
+                                 self._get_type(type_code),
+                                 pos == 1 and 'N' or 'Y'))
+            return ('ID', 'PARENT', 'NAME', 'DESCRIPTION', 'POS',
+                    'DATA_TYPE', 'NULLABLE'), rows
+        elif ' from sys.all_constraints' in lower:
+            return self._get_children(catalog, sql, 'pk_%s')
+        elif ' from sys.all_indexes' in lower:
+            return self._get_children(catalog, sql, 'pk_%s')
+        elif ' from sys.all_triggers' in lower:
+            return self._get_children(catalog, sql, 'trg_%s', 5)
+        elif ' from sys.all_sequences' in lower:
+            owner = _get_quoted(sql.split('=', 1)[1])[0]
+            return ('ID', 'NAME'), [(self._get_id(rel), rel.name.upper())
+                                    for rel in catalog.relations
+                                    if rel.kind == 'sequence'
+                                    and rel.schema[1] == owner]
+        elif lower == 'select username from sys.all_users':
+            return ('USERNAME',), [(name.upper(),)
+                                   for oid, name in catalog.users]
+        return None
+
+    def _get_type(self, type_code):
+        return {TYPE_INTEGER: 'NUMBER', TYPE_TEXT: 'VARCHAR2',
+                TYPE_TIMESTAMP: 'DATE', TYPE_NUMERIC: 'NUMBER'}[type_code]
+
+    def _get_children(self, catalog, sql, pattern, every=1):
+        ids = set(_get_quoted(sql[sql.rindex(' in ('):]))
+        rows = []
+        for rel_id in ids:
+            schema, name = rel_id.split('.', 1)
+            rel = catalog.find(name, schema)
+            if rel is None or rel.kind != 'table' or rel.oid % every:
+                continue
+            name = pattern % rel.name
+            rows.append(('%s.%s' % (schema, name), rel_id, name.upper()))
+        return ('ID', 'PARENT', 'NAME'), rows
+
+    def unknown_relation(self, conn, sql, name):
+        return DatabaseError(_Error('ORA-00942: table or view does not exist',
+                                    942, _get_position(sql, name)))
+
+    def cancelled(self, conn):
+        return OperationalError(_Error('ORA-01013: user requested cancel of'
+                                       ' current operation', 1013))
+
+    def timed_out(self, conn):
+        return OperationalError(_Error('DPI-1067: call timeout of %d ms'
+                                       ' exceeded with ORA-3156'
+                                       % conn.callTimeout, 3156))
+
+
+FLAVORS = {
+    'postgres': _Postgres,
+    'mysql': _MySQL,
+    'oracle': _Oracle,
+}
+
+_flavors = {}
+
+# Open connections by thread ID, used for KILL QUERY.
+_connections = weakref.WeakValueDictionary()
+_thread_ids = itertools.count(1)
+
+
+def _get_flavor(name):
+    _catalogs_lock.acquire()
+    try:
+        if name not in _flavors:
+            if name not in FLAVORS:
+                raise InterfaceError('Unknown flavor: %s' % name)
+            _flavors[name] = FLAVORS[name]()
+        return _flavors[name]
+    finally:
+        _catalogs_lock.release()
+
+
+class Connection(object):
+    """Connection to the imaginary server."""
+
+    def __init__(self, flavor='postgres', objects=1000, latency=0,
+                 throughput=None, rows=DEFAULT_ROWS, seed=0, database=None,
+                 user=None, **kwds):
+        self.flavor = _get_flavor(flavor)
+        self.catalog = get_catalog(int(objects), int(seed))
+        self.latency = float(latency or 0)
+        self.throughput = throughput and float(throughput) or None
+        self.rows = int(rows)
+        self.database = database
+        self.user = user
+        self.closed = False
+        self.statement_timeout = None
+        # Call timeout in milliseconds (oracle flavor).
+        self.callTimeout = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.version = self.flavor.server_version
+        self._thread_id = _thread_ids.next()
+        _connections[self._thread_id] = self
+        self._cancelled = threading.Event()
+        self._busy = False
+        self._deadline = None
+
+    def cursor(self, name=None, withhold=False):
+        """Returns a cursor.
+
+        Named cursors are server-side cursors that can be scrolled.
+        """
+        if self.closed:
+            raise InterfaceError('connection already closed')
+        return Cursor(self, name, withhold)
+
+    def commit(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+        _connections.pop(self._thread_id, None)
+
+    def cancel(self):
+        """Cancels the running call, can be called from any thread."""
+        if self._busy:
+            self._cancelled.set()
+
+    # Flavor specific methods used by the backends.
+
+    def set_isolation_level(self, level):
+        pass
+
+    def get_transaction_status(self):
+        return self.status
+
+    def thread_id(self):
+        return self._thread_id
+
+    def get_server_info(self):
+        return self.version
+
+    # The imaginary server.
+
+    def _get_timeout(self):
+        if self.callTimeout:
+            return self.callTimeout/1000.0
+        return self.statement_timeout
+
+    def _begin(self):
+        if self.closed:
+            raise InterfaceError('connection already closed')
+        self._cancelled.clear()
+        timeout = self._get_timeout()
+        if timeout:
+            self._deadline = time.time()+timeout
+        else:
+            self._deadline = None
+        self._busy = True
+
+    def _end(self, failed=False):
+        self._busy = False
+        if failed and self.status == extensions.TRANSACTION_STATUS_INTRANS:
+            self.status = extensions.TRANSACTION_STATUS_INERROR
+
+    def _wait(self, seconds):
+        """Keeps the server busy for *seconds*."""
+        if (self._deadline is not None
+            and time.time()+seconds > self._deadline):
+            if not self._cancelled.wait(max(0, self._deadline-time.time())):
+                raise self.flavor.timed_out(self)
+        elif seconds > 0:
+            self._cancelled.wait(seconds)
+        if self._cancelled.isSet():
+            raise self.flavor.cancelled(self)
+
+    def _transfer(self, count):
+        """A round-trip transferring *count* rows."""
+        seconds = self.latency
+        if self.throughput:
+            seconds += count/self.throughput
+        self._wait(seconds)
+
+    def _execute(self, sql):
+        """Returns (description, rows) for a statement."""
+        statement = sql
+        sql = sql.strip()
+        if sql.endswith(';'):
+            sql = sql[:-1].rstrip()
+        self._transfer(0)
+        if self.status == extensions.TRANSACTION_STATUS_INERROR:
+            if sql.lower() not in ('rollback', 'commit'):
+                raise InternalError('current transaction is aborted,'
+                                    ' commands ignored until end of'
+                                    ' transaction block')
+        if self.flavor.session(self, sql):
+            return None, None
+        result = self.flavor.catalog(self, sql)
+        if result is not None:
+            names, rows = result
+            description = [(name, None, None, None, None, None, True)
+                           for name in names]
+            return description, rows
+        match = _P_SLEEP.search(sql)
+        if match is not None:
+            self._wait(float(match.group('seconds')))
+        match = _P_SELECT.match(sql)
+        if match is None:
+            if sql.lower().startswith('select'):
+                return [('?column?', TYPE_INTEGER, None, None, None, None,
+                         True)], [(1,)]
+            return None, None
+        name = match.group('name').replace('"', '')
+        if name.lower() == 'dual':
+            return [('1', TYPE_INTEGER, None, None, None, None,
+                     True)], [(1,)]
+        if '.' in name:
+            schema, name = name.split('.', 1)
+        else:
+            schema = None
+        rel = self.catalog.find(name, schema)
+        if rel is None or rel.kind not in self.flavor.kinds:
+            raise self.flavor.unknown_relation(self, statement,
+                                               match.group('name'))
+        columns = rel.get_columns()
+        if match.group('columns').strip().lower() == 'count(*)':
+            return [('count', TYPE_INTEGER, None, None, None, None,
+                     False)], [(self.rows,)]
+        selected = [col.strip().lower()
+                    for col in match.group('columns').split(',')]
+        if [col for col in columns if col[1] in selected]:
+            columns = [col for col in columns if col[1] in selected]
+        description = [(self.flavor.fold(col_name), type_code, None, None,
+                        None, None, pos != 1)
+                       for pos, col_name, type_code in columns]
+        return description, _GeneratedRows(columns, self.rows)
+
+
+class Cursor(object):
+
+    def __init__(self, connection, name=None, withhold=False):
+        self.connection = connection
+        self.name = name
+        self.withhold = withhold
+        self.arraysize = 1
+        self.description = None
+        self.rowcount = -1
+        self.closed = False
+        self._rows = None
+        self._pos = 0
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                break
+            yield row
+
+    def execute(self, operation, parameters=None):
+        if self.closed:
+            raise InterfaceError('cursor already closed')
+        if parameters:
+            operation = operation % parameters
+        conn = self.connection
+        conn._begin()
+        try:
+            self.description, self._rows = conn._execute(operation)
+        except:
+            self.description = self._rows = None
+            conn._end(failed=True)
+            raise
+        conn._end()
+        self._pos = 0
+        if self._rows is not None and self.name is None:
+            self.rowcount = len(self._rows)
+        else:
+            self.rowcount = -1
+
+    def _fetch(self, size):
+        if self._rows is None:
+            raise ProgrammingError('no results to fetch')
+        rows = self._rows[self._pos:self._pos+size]
+        conn = self.connection
+        conn._begin()
+        try:
+            conn._transfer(len(rows))
+        except:
+            conn._end(failed=True)
+            raise
+        conn._end()
+        self._pos += len(rows)
+        return rows
+
+    def fetchone(self):
+        rows = self._fetch(1)
+        if rows:
+            return rows[0]
+        return None
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        return self._fetch(size)
+
+    def fetchall(self):
+        if self._rows is None:
+            raise ProgrammingError('no results to fetch')
+        return self._fetch(len(self._rows)-self._pos)
+
+    def scroll(self, value, mode='relative'):
+        if self._rows is None:
+            raise ProgrammingError('no results to fetch')
+        if mode == 'absolute':
+            pos = value
+        else:
+            pos = self._pos+value
+        if not 0 <= pos <= len(self._rows):
+            raise ProgrammingError('scroll destination out of bounds')
+        if self.name is not None:
+            # MOVE on a server-side cursor is a round-trip.
+            conn = self.connection
+            conn._begin()
+            try:
+                conn._transfer(0)
+            finally:
+                conn._end()
+        self._pos = pos
+
+    def copy_expert(self, sql, file, size=8192):
+        """Runs COPY (query) TO STDOUT WITH CSV HEADER."""
+        match = _P_COPY.match(sql.strip())
+        if match is None:
+            raise NotSupportedError('Only COPY (query) TO STDOUT WITH CSV'
+                                    ' HEADER is supported')
+        self.execute(match.group('query'))
+        out = csv.writer(file)
+        out.writerow([col[0] for col in self.description])
+        while True:
+            rows = self.fetchmany(size)
+            if not rows:
+                break
+            out.writerows(rows)
+
+    def setinputsizes(self, sizes):
+        pass
+
+    def setoutputsize(self, size, column=None):
+        pass
+
+    def close(self):
+        self.closed = True
+        self._rows = None
+
+
+def connect(*args, **kwds):
+    """Returns a :class:`Connection`."""
+    return Connection(*args, **kwds)
@@ -19,11 +19,14 @@
 """Export filter"""
 
 import datetime
+import decimal
+import itertools
 import os
 import pwd
 import types
 
 from cf.plugins.core import ExportPlugin
+from cf.utils import Emit
 
 class CSVExportFilter(ExportPlugin):
     id = "crunchyfrog.export.csv"
@@ -34,6 +37,7 @@ class CSVExportFilter(ExportPlugin):
     homepage = "http://cf.andialbrecht.de"
     version = "0.1"
     has_options = False
+    supports_bulk_export = True
 
     file_filter_name = _(u"Text CSV (.csv)")
     file_filter_pattern = ["*.csv"]
@@ -44,10 +48,25 @@ class CSVExportFilter(ExportPlugin):
     def export(self, description, rows, options):
         import csv
         fp = open(options["filename"], "w")
-        w = csv.writer(fp)
-        w.writerow([x[0] for x in description])
-        w.writerows(rows)
-        fp.close()
+        try:
+            w = csv.writer(fp)
+            w.writerow([x[0] for x in description])
+            w.writerows(self.iter_progress(rows, options.get("row_count")))
+        finally:
+            fp.close()
+
+    def export_query(self, query, options):
+        backend = query.connection.datasource.backend
+        progress = options.get("progress")
+        def on_progress(count):
+            Emit(self, "bulk-progress", count)
+            if progress is not None:
+                progress(count)
+        fp = open(options["filename"], "wb")
+        try:
+            backend.bulk_export(query, fp, on_progress)
+        finally:
+            fp.close()
 
 class OOCalcExportFilter(ExportPlugin):
     id = "crunchyfrog.export.odc"
@@ -74,9 +93,11 @@ class OOCalcExportFilter(ExportPlugin):
         for i in range(len(description)):
             doc.set_cell_value(i+1, 1, "string", description[i][0])
         doc.set_cell_property('bold', False)
-        for i in range(len(rows)):
-            for j in range(len(rows[i])):
-                value = rows[i][j]
+        # ooolib keeps the whole document in memory until it's saved.
+        rows = self.iter_progress(rows, options.get("row_count"))
+        for i, row in enumerate(rows):
+            for j in range(len(row)):
+                value = row[j]
                 if value == None:
                     continue
                 if type(value) == types.FloatType:
@@ -109,19 +130,307 @@ class XlsExportFilter(ExportPlugin):
     def export(self, description, rows, options):
         from xlwt import Workbook, easyxf
         doc = Workbook(encoding='utf-8')
-	sheet = doc.add_sheet('Sheet 1', cell_overwrite_ok=True)
+        sheet = doc.add_sheet('Sheet 1', cell_overwrite_ok=True)
         header_format = easyxf('font: bold True')
         for i in range(len(description)):
             sheet.write(0, i, description[i][0], header_format)
         date_format = easyxf(num_format_str='YYYY-MM-DD')
-        for i in range(len(rows)):
-            for j in range(len(rows[i])):
-               value = rows[i][j]
-	       if isinstance(value, datetime.datetime):
-		   sheet.row(i+1).set_cell_date(j, value, date_format)
-	       else:
-	           sheet.row(i+1).write(j, value)
-	       if((i % 500) == 0):
-		   sheet.flush_row_data
+        rows = self.iter_progress(rows, options.get("row_count"))
+        for i, row in enumerate(rows):
+            sheet_row = sheet.row(i+1)
+            for j in range(len(row)):
+                value = row[j]
+                if isinstance(value, datetime.datetime):
+                    sheet_row.set_cell_date(j, value, date_format)
+                else:
+                    sheet_row.write(j, value)
+            # Serialize finished rows to keep memory usage low.
+            if (i % 500) == 0:
+                sheet.flush_row_data()
         doc.save(options["filename"])
 
+
+def iter_chunks(rows, size):
+    """Yields lists of at most *size* rows."""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def get_column_kinds(description, dbapi=None):
+    """Returns a list of column kinds for a DB-API2 description.
+
+    The kind is one of ``"string"``, ``"binary"``, ``"number"``,
+    ``"datetime"`` or ``None`` if the type code is unknown. *dbapi* is
+    the DB-API2 module the type codes are compared with. Only strings
+    and binaries determine the Arrow type, the type codes don't tell
+    integers from floats or dates from timestamps.
+    """
+    kinds = []
+    for col in description:
+        type_code = col[1]
+        kind = None
+        if dbapi is not None and type_code is not None:
+            for name in ("STRING", "BINARY", "NUMBER", "DATETIME"):
+                if type_code == getattr(dbapi, name, None):
+                    kind = name.lower()
+                    break
+        kinds.append(kind)
+    return kinds
+
+
+# Largest precision of a 128 bit decimal.
+MAX_DECIMAL_PRECISION = 38
+
+
+def infer_type(pyarrow, values):
+    """Returns the Arrow type of *values*.
+
+    Values of mixed types, e.g. numbers and strings, are written as
+    strings.
+    """
+    try:
+        return pyarrow.array(list(values)).type
+    except (TypeError, ValueError, pyarrow.ArrowException):
+        return pyarrow.string()
+
+
+def resolve_type(pyarrow, kind, column, values):
+    """Returns the Arrow type of a column.
+
+    *kind* is the column's kind as returned by :func:`get_column_kinds`,
+    *column* the column's entry in the description and *values* are the
+    column's values in the first chunk. The values are only used if the
+    kind doesn't determine the type. Decimals get the precision and
+    scale from the description if available, otherwise the largest
+    precision, as later chunks may have more digits.
+    """
+    if kind == "string":
+        return pyarrow.string()
+    if kind == "binary":
+        return pyarrow.binary()
+    type_ = infer_type(pyarrow, values)
+    if pyarrow.types.is_null(type_):
+        # No values to infer the type from.
+        if kind == "number":
+            return pyarrow.float64()
+        return pyarrow.string()
+    if pyarrow.types.is_integer(type_):
+        return pyarrow.int64()
+    if pyarrow.types.is_decimal(type_):
+        precision, scale = (tuple(column[4:6])+(None, None))[:2]
+        if (precision and scale is not None
+            and precision <= MAX_DECIMAL_PRECISION):
+            return pyarrow.decimal128(precision, scale)
+        return pyarrow.decimal128(MAX_DECIMAL_PRECISION, type_.scale)
+    return type_
+
+
+def convert_values(pyarrow, values, type_):
+    """Returns *values* as a list suitable for an array of *type_*."""
+    if pyarrow.types.is_string(type_):
+        return [value if value is None or isinstance(value, basestring)
+                else unicode(value)
+                for value in values]
+    if pyarrow.types.is_floating(type_):
+        return [float(value) if isinstance(value, decimal.Decimal)
+                else value
+                for value in values]
+    return list(values)
+
+
+def make_array(pyarrow, values, type_):
+    """Returns an Arrow array of *type_* holding *values*.
+
+    Values of other types are cast safely, e.g. integers to floats.
+    Raises `ValueError` if a value doesn't fit, e.g. a float with
+    fractional digits in an integer column.
+    """
+    values = convert_values(pyarrow, values, type_)
+    array = None
+    if not (pyarrow.types.is_string(type_)
+            or pyarrow.types.is_binary(type_)):
+        try:
+            array = pyarrow.array(values)
+        except (TypeError, ValueError, pyarrow.ArrowException):
+            # Mixed values, converted directly.
+            pass
+    if array is not None and array.type == type_:
+        return array
+    if array is not None and not pyarrow.types.is_null(array.type):
+        # Unlike the conversion when building an array, casts don't
+        # truncate values silently.
+        try:
+            return array.cast(type_)
+        except pyarrow.ArrowNotImplementedError:
+            pass
+        except (TypeError, ValueError, pyarrow.ArrowException), err:
+            raise ValueError(str(err))
+    try:
+        return pyarrow.array(values, type=type_)
+    except (TypeError, ValueError, pyarrow.ArrowException), err:
+        raise ValueError(str(err))
+
+
+class ColumnarExportFilter(ExportPlugin):
+    """Base class for filters writing Apache Arrow record batches.
+
+    Rows are read in chunks of ``row_group_size`` rows, converted to
+    typed columns and written as one record batch (or Parquet row group)
+    per chunk as they arrive. The schema is taken from the description,
+    the first chunk resolves the types the description leaves open (see
+    :func:`resolve_type`). Later chunks are cast to that schema, the
+    export fails if their values don't fit.
+    """
+    author = "Andi Albrecht"
+    license = "GPL"
+    homepage = "http://cf.andialbrecht.de"
+    version = "0.1"
+    has_options = True
+
+    compression_choices = []
+    default_compression = None
+    default_row_group_size = 65536
+
+    def __init__(self, app):
+        ExportPlugin.__init__(self, app)
+
+    def show_options(self, description, rows):
+        import gtk
+        dlg = gtk.Dialog(_(u"Export options"), None,
+                         gtk.DIALOG_MODAL|gtk.DIALOG_DESTROY_WITH_PARENT,
+                         (gtk.STOCK_OK, gtk.RESPONSE_OK))
+        table = gtk.Table(2, 2)
+        table.set_border_width(6)
+        table.set_row_spacings(6)
+        table.set_col_spacings(6)
+        lbl = gtk.Label(_(u"_Compression:"))
+        lbl.set_use_underline(True)
+        lbl.set_alignment(0, 0.5)
+        table.attach(lbl, 0, 1, 0, 1, gtk.FILL, gtk.FILL)
+        combo = gtk.combo_box_new_text()
+        for choice in self.compression_choices:
+            combo.append_text(choice or _(u"None"))
+        combo.set_active(self.compression_choices.index(
+            self.default_compression))
+        combo.set_sensitive(len(self.compression_choices) > 1)
+        lbl.set_mnemonic_widget(combo)
+        table.attach(combo, 1, 2, 0, 1)
+        lbl = gtk.Label(_(u"_Rows per batch:"))
+        lbl.set_use_underline(True)
+        lbl.set_alignment(0, 0.5)
+        table.attach(lbl, 0, 1, 1, 2, gtk.FILL, gtk.FILL)
+        spin = gtk.SpinButton(gtk.Adjustment(self.default_row_group_size,
+                                             1, 10000000, 1000, 10000))
+        lbl.set_mnemonic_widget(spin)
+        table.attach(spin, 1, 2, 1, 2)
+        dlg.vbox.pack_start(table)
+        dlg.show_all()
+        dlg.run()
+        options = {
+            "compression": self.compression_choices[combo.get_active()],
+            "row_group_size": spin.get_value_as_int(),
+        }
+        dlg.destroy()
+        return options
+
+    def export(self, description, rows, options):
+        import pyarrow
+        compression = options.get("compression", self.default_compression)
+        size = options.get("row_group_size", self.default_row_group_size)
+        kinds = get_column_kinds(description, options.get("dbapi"))
+        rows = self.iter_progress(rows, options.get("row_count"))
+        chunks = iter_chunks(rows, size)
+        first = next(chunks, [])
+        columns = zip(*first) or [()]*len(description)
+        schema = pyarrow.schema([
+            pyarrow.field(col[0], resolve_type(pyarrow, kind, col, values))
+            for col, kind, values in zip(description, kinds, columns)])
+        writer = self.open_writer(options["filename"], schema, compression)
+        try:
+            for chunk in itertools.chain([first], chunks):
+                if chunk:
+                    self.write_batch(writer,
+                                     self._make_batch(pyarrow, schema, chunk))
+        finally:
+            writer.close()
+
+    def _make_batch(self, pyarrow, schema, chunk):
+        arrays = []
+        for values, field in zip(zip(*chunk), schema):
+            try:
+                arrays.append(make_array(pyarrow, values, field.type))
+            except ValueError, err:
+                raise RuntimeError(_(u"Column %(name)s doesn't fit the type"
+                                     u" %(type)s: %(error)s")
+                                   % {"name": field.name,
+                                      "type": field.type,
+                                      "error": err})
+        return pyarrow.RecordBatch.from_arrays(arrays, schema.names)
+
+    def open_writer(self, filename, schema, compression):
+        """Returns a writer for record batches."""
+        raise NotImplementedError
+
+    def write_batch(self, writer, batch):
+        """Writes a record batch."""
+        raise NotImplementedError
+
+
+class ArrowExportFilter(ColumnarExportFilter):
+    id = "crunchyfrog.export.arrow"
+    name = _(u"Apache Arrow Export")
+    description = _(u"Export query results as Apache Arrow IPC files")
+
+    file_filter_name = _(u"Apache Arrow (.arrow)")
+    file_filter_pattern = ["*.arrow"]
+
+    @property
+    def compression_choices(self):
+        # Compressed IPC files require pyarrow 2.0 or later.
+        try:
+            import pyarrow.ipc
+        except ImportError:
+            return [None]
+        if hasattr(pyarrow.ipc, "IpcWriteOptions"):
+            return [None, "lz4", "zstd"]
+        return [None]
+
+    def open_writer(self, filename, schema, compression):
+        import pyarrow.ipc
+        if compression is None:
+            return pyarrow.ipc.RecordBatchFileWriter(filename, schema)
+        if not hasattr(pyarrow.ipc, "IpcWriteOptions"):
+            raise RuntimeError(_(u"Compressed Arrow files require pyarrow"
+                                 u" 2.0 or later"))
+        options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+        return pyarrow.ipc.RecordBatchFileWriter(filename, schema,
+                                                 options=options)
+
+    def write_batch(self, writer, batch):
+        writer.write_batch(batch)
+
+
+class ParquetExportFilter(ColumnarExportFilter):
+    id = "crunchyfrog.export.parquet"
+    name = _(u"Apache Parquet Export")
+    description = _(u"Export query results as Apache Parquet files")
+
+    file_filter_name = _(u"Apache Parquet (.parquet)")
+    file_filter_pattern = ["*.parquet"]
+
+    compression_choices = [None, "snappy", "gzip", "zstd"]
+    default_compression = "snappy"
+
+    def open_writer(self, filename, schema, compression):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(filename, schema,
+                                             compression=compression or "none")
+
+    def write_batch(self, writer, batch):
+        import pyarrow
+        # Each chunk becomes one row group.
+        writer.write_table(pyarrow.Table.from_batches([batch]))
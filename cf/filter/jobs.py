@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+# crunchyfrog - a database schema browser and query tool
+# Copyright (C) 2009 Andi Albrecht <albrecht.andi@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Background export jobs."""
+
+import logging
+import os
+import Queue
+import thread
+import threading
+import time
+
+import gobject
+
+from cf.db import Query
+from cf.plugins.core import EXPORT_PROGRESS_INTERVAL
+
+
+JOB_QUEUED = 0
+JOB_RUNNING = 1
+JOB_FINISHED = 2
+JOB_FAILED = 3
+JOB_CANCELLED = 4
+
+
+class ExportCancelled(Exception):
+    """Raised in the worker thread when a job was cancelled."""
+
+
+class ExportJob(object):
+    """An export running in the background.
+
+    The rows to export are given as *rows*, an iterable that's safe to
+    read from another thread. If *bulk* is ``True``, the statement of
+    *query* is executed again on a connection of its own and the
+    plugin's ``export_query`` writes the result.
+
+    The job's attributes are updated by the worker thread, listen to the
+    signals of `ExportJobManager` to get notified about changes.
+    """
+
+    def __init__(self, plugin, options, description=None, rows=None,
+                 query=None, bulk=False):
+        self.plugin = plugin
+        self.options = options
+        self.description = description
+        self.rows = rows
+        self.query = query
+        self.bulk = bulk
+        self.filename = options["filename"]
+        self.status = JOB_QUEUED
+        self.rows_written = 0
+        self.row_count = options.get("row_count")
+        self.bytes_written = None
+        self.error = None
+        self._cancelled = threading.Event()
+        self._report = None
+
+    def __repr__(self):
+        return '<ExportJob %r>' % self.filename
+
+    def get_label(self):
+        """Returns a human-readable description of the job."""
+        return os.path.basename(self.filename)
+
+    def cancel(self):
+        """Cancels the job.
+
+        The job stops with the next batch of rows and the partially
+        written file is removed.
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.isSet()
+
+    @property
+    def done(self):
+        return self.status in (JOB_FINISHED, JOB_FAILED, JOB_CANCELLED)
+
+    def _check_cancelled(self):
+        if self._cancelled.isSet():
+            raise ExportCancelled()
+
+    def _iter_rows(self, rows):
+        for row in rows:
+            self._check_cancelled()
+            yield row
+            self.rows_written += 1
+            if self.rows_written % EXPORT_PROGRESS_INTERVAL == 0:
+                self._report(self)
+
+    def _on_bytes_written(self, count):
+        self._check_cancelled()
+        self.bytes_written = count
+        self._report(self)
+
+    def run(self, report):
+        """Runs the export.
+
+        This method is called in a worker thread. *report* is called
+        with the job as argument whenever the progress changes.
+        """
+        self._report = report
+        self.status = JOB_RUNNING
+        report(self)
+        query = None
+        conn = None
+        try:
+            self._check_cancelled()
+            if self.bulk:
+                datasource = self.query.connection.datasource
+                conn = datasource.open_background_connection()
+                query = Query(self.query.statement, conn)
+                options = dict(self.options)
+                options["progress"] = self._on_bytes_written
+                self.plugin.export_query(query, options)
+            else:
+                self.plugin.export(self.description,
+                                   self._iter_rows(self.rows), self.options)
+            self.status = JOB_FINISHED
+        except ExportCancelled:
+            self.status = JOB_CANCELLED
+        except Exception, err:
+            logging.exception('Export to %s failed:', self.filename)
+            self.error = err
+            self.status = JOB_FAILED
+        if query is not None:
+            query.close()
+        if conn is not None:
+            conn.close()
+        if self.status != JOB_FINISHED and os.path.isfile(self.filename):
+            try:
+                os.remove(self.filename)
+            except OSError:
+                logging.exception('Failed to remove %s', self.filename)
+        report(self)
+
+
+class ExportJobManager(gobject.GObject):
+    """Runs export jobs on a pool of worker threads.
+
+    An instance of this class is accessible through the ``exports``
+    attribute of an `CFApplication`_ instance. Up to *max_workers* jobs
+    run concurrently, further jobs are queued.
+
+    :Signals:
+
+        job-added
+            ``def callback(manager, job, user_param1, ...)``
+
+            Emitted when a job was submitted.
+
+        job-changed
+            ``def callback(manager, job, user_param1, ...)``
+
+            Emitted when a job started, made progress or finished.
+
+    Signals are emitted in the main thread.
+    """
+
+    __gsignals__ = {
+        "job-added" : (gobject.SIGNAL_RUN_LAST,
+                       gobject.TYPE_NONE,
+                       (gobject.TYPE_PYOBJECT,)),
+        "job-changed" : (gobject.SIGNAL_RUN_LAST,
+                         gobject.TYPE_NONE,
+                         (gobject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self, max_workers=2):
+        self.__gobject_init__()
+        self.max_workers = max_workers
+        self.jobs = []
+        self._queue = Queue.Queue()
+        self._workers = 0
+        self._idle_workers = 0
+        self._lock = thread.allocate_lock()
+
+    def submit(self, job):
+        """Queues a job for execution."""
+        self.jobs.append(job)
+        self.emit("job-added", job)
+        self._lock.acquire()
+        try:
+            start = False
+            if self._idle_workers:
+                self._idle_workers -= 1
+            elif self._workers < self.max_workers:
+                self._workers += 1
+                start = True
+        finally:
+            self._lock.release()
+        self._queue.put(job)
+        if start:
+            worker = threading.Thread(target=self._run)
+            worker.setDaemon(True)
+            worker.start()
+        return job
+
+    def get_active_jobs(self):
+        """Returns a list of jobs that are queued or running."""
+        return [job for job in self.jobs if not job.done]
+
+    def cancel_all(self, timeout=None):
+        """Cancels all active jobs.
+
+        If *timeout* is given, wait at most *timeout* seconds for the
+        jobs to stop.
+        """
+        active = self.get_active_jobs()
+        for job in active:
+            job.cancel()
+        if timeout is not None:
+            end = time.time()+timeout
+            while (time.time() < end
+                   and [job for job in active if not job.done]):
+                time.sleep(.05)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job.cancelled:
+                job.status = JOB_CANCELLED
+                self._report(job)
+            else:
+                job.run(self._report)
+            self._lock.acquire()
+            self._idle_workers += 1
+            self._lock.release()
+
+    def _report(self, job):
+        gobject.idle_add(self._emit_changed, job)
+
+    def _emit_changed(self, job):
+        self.emit("job-changed", job)
+        if job.done and job in self.jobs:
+            self.jobs.remove(job)
+        return False
@@ -33,6 +33,13 @@ except ImportError, err:
     pass
 else:
     from cf.filter.exportfilter import XlsExportFilter
+try:
+    import pyarrow
+except ImportError:
+    pass
+else:
+    from cf.filter.exportfilter import ArrowExportFilter
+    from cf.filter.exportfilter import ParquetExportFilter
 
 try: from cf.db.backends.mysql import MySQL
 except ImportError, err:
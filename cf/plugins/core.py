@@ -32,10 +32,14 @@ PLUGIN_TYPE_GENERIC = 0
 PLUGIN_TYPE_EXPORT = 2
 PLUGIN_TYPE_EDITOR = 3
 
+# Number of rows between two progress signals of export plugins.
+EXPORT_PROGRESS_INTERVAL = 1000
+
 from cf import USER_PLUGIN_DIR, PLUGIN_DIR
 
 from cf.plugins.mixins import InstanceMixin, MenubarMixin, EditorMixin
 from cf.plugins.mixins import UserDBMixin
+from cf.utils import Emit
 
 
 class GenericPlugin(gobject.GObject):
@@ -92,20 +96,96 @@ class BottomPanePlugin(GenericPlugin):
     """A plugin that lives in the bottom pane."""
 
 class ExportPlugin(GenericPlugin):
-    """Export filter base class"""
+    """Export filter base class
+
+    The ``export`` method receives an iterable of rows. This may be a
+    list but also an iterator reading from a streaming cursor, so
+    export filters should write the rows incrementally and iterate them
+    only once. Wrap the rows with ``iter_progress`` to report progress.
+
+    Filters with ``supports_bulk_export`` set to ``True`` can also export
+    the complete result of a query with ``export_query``. The data is then
+    written by the backend (see ``Generic.bulk_export``) without going
+    through the result grid.
+
+    :Signals:
+
+        progress
+            ``def callback(plugin, rows_written, row_count, user_param1, ...)``
+
+            Emitted every ``EXPORT_PROGRESS_INTERVAL`` rows and when the
+            export is finished. `row_count` is the total number of rows
+            or ``None`` if unknown.
+
+        bulk-progress
+            ``def callback(plugin, bytes_written, user_param1, ...)``
+
+            Emitted while ``export_query`` writes the target file.
+
+    Exports run in a worker thread, the signals are emitted in the main
+    thread.
+    """
     icon = "gtk-save-as"
     file_filter_name = None
     file_filter_mime = []
     file_filter_pattern = []
     has_options = False
+    supports_bulk_export = False
     plugin_type = PLUGIN_TYPE_EXPORT
 
+    __gsignals__ = {
+        "progress" : (gobject.SIGNAL_RUN_LAST,
+                      gobject.TYPE_NONE,
+                      (gobject.TYPE_PYOBJECT, gobject.TYPE_PYOBJECT)),
+        "bulk-progress" : (gobject.SIGNAL_RUN_LAST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_PYOBJECT,)),
+    }
+
     def __init__(self, app):
         GenericPlugin.__init__(self, app)
 
     def export(self, description, rows, options=dict()):
+        """Exports rows
+
+        :Parameter:
+            description
+                DB-API2 cursor description
+            rows
+                Iterable of rows
+            options
+                Dictionary with at least a ``filename`` key. If the number
+                of rows is known, it's given as ``row_count``. If known,
+                the DB-API2 module that produced the rows is given as
+                ``dbapi`` to interpret the type codes in `description`.
+        """
+        raise NotImplementedError
+
+    def export_query(self, query, options=dict()):
+        """Exports the complete result of a query
+
+        Only called if ``supports_bulk_export`` is ``True``.
+
+        :Parameter:
+            query
+                A `cf.db.Query` instance that hasn't been executed yet
+            options
+                Dictionary with at least a ``filename`` key. If given,
+                ``progress`` is called with the number of bytes written.
+                Exceptions raised by this callable abort the export.
+        """
         raise NotImplementedError
 
+    def iter_progress(self, rows, row_count=None):
+        """Yields rows and emits the ``progress`` signal."""
+        count = 0
+        for row in rows:
+            yield row
+            count += 1
+            if count % EXPORT_PROGRESS_INTERVAL == 0:
+                Emit(self, "progress", count, row_count)
+        Emit(self, "progress", count, row_count)
+
     def show_options(self, description, rows):
         return dict()
 
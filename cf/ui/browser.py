@@ -114,7 +114,7 @@ class Browser(gtk.ScrolledWindow, pane.PaneItem):
             model, iter = treeselection.get_selected()
             obj = model.get_value(iter, 0)
             # row_draggable(path) doesn't work somehow...
-            if isinstance(obj, objects.DBObject) \
+            if isinstance(obj, objects.DBObjectMixin) \
             and not isinstance(obj, objects.Collection):
                 if hasattr(obj, 'schema'):
                     # If we're directly associated with a schema, include it as a prefix
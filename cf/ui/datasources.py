@@ -332,6 +332,8 @@ class DatasourceEditDialog(object):
                 child.set_active(data['ask_for_password'])
         buffer_ = self.widget_startup_commands.get_buffer()
         buffer_.set_text(datasource.startup_commands or '')
+        spin = self.builder.get_object('spin_statement_timeout')
+        spin.set_value(datasource.statement_timeout or 0)
         check = self.builder.get_object('check_color')
         check.set_active(datasource.color is not None)
         if datasource.color is not None:
@@ -471,6 +473,8 @@ class DatasourceEditDialog(object):
             ds.color = None
         buffer_ = self.widget_startup_commands.get_buffer()
         ds.startup_commands = buffer_.get_text(*buffer_.get_bounds()) or None
+        spin = self.builder.get_object('spin_statement_timeout')
+        ds.statement_timeout = spin.get_value_as_int() or None
         return ds
 
     def clean_data(self):
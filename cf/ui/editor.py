@@ -31,13 +31,15 @@ import gtk
 import gtksourceview2
 import pango
 
-from cf.db import Query
+from cf.db import Query, TIMING_FIRST_ROW, TIMING_EXECUTE, TIMING_FETCH
+from cf.db import TIMING_DECODE, TIMING_MODEL, TIMING_PAINT
+from cf.db.resultstore import ResultStore
 from cf.plugins.core import PLUGIN_TYPE_EXPORT
 from cf.ui import dialogs
 from cf.ui.confirmsave import ConfirmSaveDialog
 from cf.ui.pane import PaneItem
 from cf.ui.widgets import DataExportDialog
-from cf.ui.widgets.grid import Grid
+from cf.ui.widgets.grid import Grid, RowWindow
 from cf.ui.widgets.sqlview import SQLView
 from cf.utils import to_uri
 
@@ -80,6 +82,11 @@ class Editor(gobject.GObject, PaneItem):
                          'is the buffer dirty?',
                          False,
                          gobject.PARAM_READWRITE),
+        'query-running': (gobject.TYPE_BOOLEAN,
+                          'query running',
+                          'is a query running?',
+                          False,
+                          gobject.PARAM_READABLE),
         }
 
     def __init__(self, win):
@@ -95,6 +102,7 @@ class Editor(gobject.GObject, PaneItem):
         self._buffer_dirty = False
         self.__conn_close_tag = None
         self._query_timer = None
+        self._running_query = None
         self._filename = None
         self._filecontent_read = ""
         self.builder = gtk.Builder()
@@ -129,6 +137,8 @@ class Editor(gobject.GObject, PaneItem):
     def do_get_property(self, param):
         if param.name == 'buffer-dirty':
             return self._buffer_dirty
+        elif param.name == 'query-running':
+            return self._running_query is not None
 
     def do_set_property(self, param, value):
         if param.name == 'buffer-dirty':
@@ -205,14 +215,23 @@ class Editor(gobject.GObject, PaneItem):
         query.path_status = self.results.add_message("")
         self._query_timer = gobject.timeout_add(50, self.update_exectime,
                                                 start, query)
+        self._running_query = query
+        self.notify('query-running')
 
     def on_query_finished(self, query, tag_notice):
         if self._query_timer:
             gobject.source_remove(self._query_timer)
             self._query_timer = None
+        self._running_query = None
+        self.notify('query-running')
         self.results.set_query(query)
         if query.failed:
-            msg = _(u'Query failed (%(sec).3f seconds)')
+            if query.timed_out:
+                msg = _(u'Query timed out (%(sec).3f seconds)')
+            elif query.cancelled:
+                msg = _(u'Query cancelled (%(sec).3f seconds)')
+            else:
+                msg = _(u'Query failed (%(sec).3f seconds)')
             msg = msg % {"sec": query.execution_time}
             type_ = 'error'
             if query.error_position:
@@ -231,11 +250,19 @@ class Editor(gobject.GObject, PaneItem):
                          "num": query.rowcount}
             type_ = 'info'
         self.results.add_message(msg, type_, query.path_status)
+        if query.description and not query.failed:
+            query.path_timings = self.results.add_message(
+                self._format_timings(query))
+            query.connect('rendered', self.on_query_rendered)
         self.win.statusbar.push(1, msg)
         if self.connection.handler_is_connected(tag_notice):
             self.connection.disconnect(tag_notice)
         self.textview.grab_focus()
 
+    def on_query_rendered(self, query):
+        self.results.add_message(self._format_timings(query),
+                                 path=query.path_timings, activate=False)
+
     def on_show_in_main_window(self, *args):
         gobject.idle_add(self.show_in_main_window)
 
@@ -323,6 +350,21 @@ class Editor(gobject.GObject, PaneItem):
         self.connection.begin()
         self.results.add_message('BEGIN TRANSACTION', 'info')
 
+    def can_cancel_query(self):
+        """Returns True if the running query can be cancelled.
+
+        Statements on connections that can't be shared between threads
+        (e.g. SQLite) are executed in the main thread and block the UI
+        until they're finished.
+        """
+        return bool(self._running_query is not None
+                    and self.connection.threadsafety >= 2)
+
+    def cancel_query(self):
+        """Cancel the running query, if any."""
+        if self.can_cancel_query():
+            self._running_query.cancel()
+
     def execute_query(self, statement_at_cursor=False):
         # TODO(andi): This method needs some refactoring:
         #   - the actual execution code is doubled
@@ -338,7 +380,8 @@ class Editor(gobject.GObject, PaneItem):
                 if not stmt.strip():
                     start_line += add_offset
                     continue
-                query = Query(stmt, self.connection)
+                query = Query(stmt, self.connection,
+                              page_size=self._get_page_size())
 #                query.coding_hint = self.connection.coding_hint
                 gtk.gdk.threads_enter()
                 query.set_data('editor_start_line', start_line)
@@ -409,7 +452,8 @@ class Editor(gobject.GObject, PaneItem):
                 if not stmt.strip():
                     line_offset += add_offset
                     continue
-                query = Query(stmt, self.connection)
+                query = Query(stmt, self.connection,
+                              page_size=self._get_page_size())
                 query.set_data('editor_start_line', line_offset)
 #                query.coding_hint = self.connection.coding_hint
                 query.connect("started", self.on_query_started)
@@ -417,6 +461,10 @@ class Editor(gobject.GObject, PaneItem):
                 query.execute()
                 line_offset += add_offset
 
+    def _get_page_size(self):
+        """Return the number of rows to fetch at once or None."""
+        return self.app.config.get('editor.results.page_size') or None
+
     def explain(self):
         self.results.assure_visible()
         buf = self.textview.get_buffer()
@@ -582,6 +630,21 @@ class Editor(gobject.GObject, PaneItem):
             win.destroy()
         self.set_data("win", None)
 
+    def _format_timings(self, query):
+        labels = {TIMING_FIRST_ROW: _(u'first row'),
+                  TIMING_EXECUTE: _(u'execute'),
+                  TIMING_FETCH: _(u'fetch'),
+                  TIMING_DECODE: _(u'decode'),
+                  TIMING_MODEL: _(u'model'),
+                  TIMING_PAINT: _(u'paint')}
+        phases = [u'%s %.3f' % (labels[phase], seconds)
+                  for phase, seconds in query.get_timings()]
+        msg = _(u'Timings (seconds): %(phases)s; '
+                u'%(rows)d rows, %(size).1f KB fetched')
+        return msg % {'phases': u', '.join(phases),
+                      'rows': query.rows_fetched,
+                      'size': query.bytes_fetched/1024.0}
+
     def update_exectime(self, start, query):
         lbl = _("Query running... (%.3f seconds)" % (time.time()-start))
         self.results.add_message(lbl, path=query.path_status)
@@ -912,7 +975,8 @@ class ResultsView(object):
         statement = self.grid.query.statement
         gtk.gdk.threads_enter()
         dlg = DataExportDialog(self.instance.app, self.instance,
-                               data, selected, statement, description)
+                               data, selected, statement, description,
+                               query=self.grid.query)
         if dlg.run() == gtk.RESPONSE_OK:
             dlg.hide()
             dlg.export_data()
@@ -961,15 +1025,18 @@ class ResultsView(object):
         self._update_btn_export_state()
         gobject.idle_add(self.widget.set_current_page, curr_page)
 
-    def add_message(self, msg, type_=None, path=None, monospaced=False):
+    def add_message(self, msg, type_=None, path=None, monospaced=False,
+                    activate=True):
         """Add a message.
 
         Args:
           msg: The message to add.
           type_: Message type ('info', 'output',
                  'error', 'warning', 'query', None).
+          activate: If False, don't switch to the messages page.
         """
-        self.assure_visible()
+        if activate:
+            self.assure_visible()
         assert type_ in (None, 'info', 'output', 'error', 'warning', 'query')
         stock_id = None
         foreground = None
@@ -1015,7 +1082,8 @@ class ResultsView(object):
         # Somehow this works smarter than treeview.scroll_to_cell(path).
         # See: http://www.mail-archive.com/pygtk@daa.com.au/msg17059.html
         self.messages.scroll_to_cell(str(len(model)-1))
-        self.widget.set_current_page(2)
+        if activate:
+            self.widget.set_current_page(2)
         return model.get_path(itr)
 
     def add_error(self, msg, monospaced=False):
@@ -1046,21 +1114,48 @@ class ResultList(object):
         self._setup_widget()
         self.instance = win
         self.query = None
+        self._expose_tag = None
 
     def _setup_widget(self):
         self.grid = Grid()
         self.builder.get_object("sw_grid").add(self.grid)
 
+    def on_grid_first_expose(self, grid, event, query, start):
+        grid.disconnect(self._expose_tag)
+        self._expose_tag = None
+        query.record_timing(TIMING_PAINT, time.time()-start)
+        query.emit('rendered')
+
     def set_query(self, query):
+        if self.query is not None and self.query is not query:
+            self.query.close()
+        if self._expose_tag is not None:
+            self.grid.disconnect(self._expose_tag)
+            self._expose_tag = None
         self.query = query
         self.grid.reset()
         if self.query.description:
+            if self.query.has_more:
+                # The cursor's rowcount isn't reliable before all rows
+                # were fetched (e.g. 0 for cx_Oracle, 2**64-1 for
+                # MySQLdb's SSCursor), the window grows as rows arrive.
+                rows = RowWindow(self.query.rows, self.query.fetch_rows,
+                                 self.query.page_size,
+                                 store=ResultStore(self.query.page_size))
+            else:
+                rows = self.query.rows
+            start = time.time()
             try:
-                self.grid.set_result(self.query.rows, self.query.description,
+                self.grid.set_result(rows, self.query.description,
                                      self.query.coding_hint)
             except Exception, err:
                 logging.exception('Failed to display query results')
                 dialogs.error(_(u'Failed to display results'), str(err))
+                return
+            now = time.time()
+            self.query.record_timing(TIMING_MODEL, now-start)
+            self._expose_tag = self.grid.connect_after(
+                'expose-event', self.on_grid_first_expose, self.query, now)
 
 
 
@@ -67,6 +67,7 @@ class MainWindow(gtk.Window):
         self.app = app
         self._editor = None
         self._editor_conn_tag = None  # Signal ID
+        self._editor_query_tag = None  # Signal ID
         self._tracked_conn = None  # Tracked connection
         self._editors = []
         self.clipboard = gtk.clipboard_get()
@@ -252,6 +253,10 @@ class MainWindow(gtk.Window):
              _(u'Exec_ute Current Statement'), '<control>F5',
              _(u'Executes statement at cursor'),
              self.on_query_execute_current),
+            ('query-cancel', gtk.STOCK_STOP,
+             _(u'_Cancel Query'), '<control>Pause',
+             _(u'Cancel the running query'),
+             self.on_query_cancel),
             ('query-begin', gtk.STOCK_INDENT,
              _(u'Transaction'), 'F6',
              _(u'Begin transaction on current connection'),
@@ -608,6 +613,13 @@ class MainWindow(gtk.Window):
     def on_query_execute_current(self, action):
         self.get_active_editor().execute_query(True)
 
+    def on_query_cancel(self, action):
+        self.get_active_editor().cancel_query()
+
+    def on_editor_query_running(self, editor, param):
+        action = self._get_action('query-cancel')
+        action.set_sensitive(editor.can_cancel_query())
+
     def on_query_menu_activate(self, menuitem):
         self._rebuild_activate_editor_actions()
 
@@ -794,6 +806,9 @@ class MainWindow(gtk.Window):
         if self._editor_conn_tag and self._editor:
             self._editor.disconnect(self._editor_conn_tag)
             self._editor_conn_tag = None
+        if self._editor_query_tag and self._editor:
+            self._editor.disconnect(self._editor_query_tag)
+            self._editor_query_tag = None
         if self._editor:
             handler_id = self._editor.get_data('cf::sig_editor_buffer_changed')
             if handler_id:
@@ -805,6 +820,8 @@ class MainWindow(gtk.Window):
                 "connection-changed", self.on_editor_connection_changed)
             self.on_editor_connection_changed(
                 self._editor, self._editor.connection)
+            self._editor_query_tag = self._editor.connect(
+                "notify::query-running", self.on_editor_query_running)
             conn = self._editor.connection
             if conn:
                 prop =conn.get_property('transaction-state')
@@ -818,6 +835,9 @@ class MainWindow(gtk.Window):
             elif group.get_name() == 'query':
                 group.set_sensitive(bool(isinstance(self._editor, Editor)
                                          and self._editor.connection))
+        action = self._get_action('query-cancel')
+        action.set_sensitive(bool(isinstance(self._editor, Editor)
+                             and self._editor.can_cancel_query()))
         sensitive = bool((self._editor
                           and isinstance(self._editor, Editor)))
         action = self._get_action('file-save')
@@ -928,6 +948,7 @@ UI = '''
       <separator />
       <menuitem name="Execute" action="query-execute" />
       <menuitem name="ExecuteCurrent" action="query-execute-current" />
+      <menuitem name="Cancel" action="query-cancel" />
       <menuitem name="Begin" action="query-begin" />
       <menuitem name="Commit" action="query-commit" />
       <menuitem name="Rollback" action="query-rollback" />
@@ -970,6 +991,7 @@ UI = '''
     <placeholder name="EditorConnection" />
     <separator />
     <toolitem name="QueryExecute" action="query-execute" />
+    <toolitem name="QueryCancel" action="query-cancel" />
     <toolitem name="QueryBegin" action="query-begin" />
     <toolitem name="QueryCommit" action="query-commit" />
     <toolitem name="QueryRollback" action="query-rollback" />
@@ -19,7 +19,9 @@
 """Custom statusbar"""
 
 import gtk
+import pango
 
+from cf.filter.jobs import JOB_RUNNING, JOB_FAILED
 from cf.ui.editor import Editor
 
 
@@ -50,8 +52,31 @@ class CrunchyStatusbar(gtk.Statusbar):
         self.lbl_insmode.show()
         self._add_item(self.lbl_insmode, False, True)
 
+        hbox = gtk.HBox()
+        hbox.set_spacing(3)
+        self.export_progress = gtk.ProgressBar()
+        self.export_progress.set_size_request(200, -1)
+        self.export_progress.set_ellipsize(pango.ELLIPSIZE_MIDDLE)
+        hbox.pack_start(self.export_progress, False, False)
+        btn = gtk.Button()
+        btn.set_relief(gtk.RELIEF_NONE)
+        btn.set_focus_on_click(False)
+        btn.set_tooltip_text(_(u'Cancel export'))
+        img = gtk.image_new_from_stock(gtk.STOCK_STOP, gtk.ICON_SIZE_MENU)
+        btn.add(img)
+        btn.connect('clicked', self.on_cancel_export)
+        hbox.pack_start(btn, False, False)
+        hbox.show_all()
+        self.export_frame = self._add_item(hbox, False, True)
+        self.export_frame.hide()
+
         self.instance.connect('active-editor-changed',
                               lambda i, e: self.set_editor(e))
+        self._export_sigs = [
+            self.app.exports.connect('job-added', self.on_export_changed),
+            self.app.exports.connect('job-changed', self.on_export_changed),
+        ]
+        self.connect('destroy', self.on_destroy)
 
     def _add_item(self, widget, expand=True, fill=True, padding=0):
         """Adds a widget to the statusbar using pack_start.
@@ -131,11 +156,78 @@ class CrunchyStatusbar(gtk.Statusbar):
     # Callbacks
     # ---
 
+    def on_cancel_export(self, button):
+        jobs = self.app.exports.get_active_jobs()
+        if len(jobs) == 1:
+            jobs[0].cancel()
+            return
+        menu = gtk.Menu()
+        for job in jobs:
+            item = gtk.MenuItem(_(u'Cancel export to %(filename)s')
+                                % {'filename': job.get_label()})
+            item.connect('activate', lambda item, job: job.cancel(), job)
+            menu.append(item)
+        if len(jobs) > 1:
+            menu.append(gtk.SeparatorMenuItem())
+            item = gtk.MenuItem(_(u'Cancel all exports'))
+            item.connect('activate',
+                         lambda item: self.app.exports.cancel_all())
+            menu.append(item)
+        menu.show_all()
+        menu.popup(None, None, None, 0, gtk.get_current_event_time())
+
+    def on_destroy(self, statusbar):
+        for sig in self._export_sigs:
+            self.app.exports.disconnect(sig)
+        self._export_sigs = []
+
+    def on_export_changed(self, manager, job):
+        if job.status == JOB_FAILED and job.error is not None:
+            self.set_message(_(u'Export to %(filename)s failed: %(error)s')
+                             % {'filename': job.get_label(),
+                                'error': job.error})
+        self._update_export_progress()
+
     def on_tv_mark_set(self, textbuffer, iter_, mark):
         mark = textbuffer.get_insert()
         iter_ = textbuffer.get_iter_at_mark(mark)
         self._set_curpos(iter_.get_line()+1, iter_.get_line_offset()+1)
 
+    def _update_export_progress(self):
+        jobs = self.app.exports.get_active_jobs()
+        if not jobs:
+            self.export_frame.hide()
+            return
+        if len(jobs) == 1:
+            job = jobs[0]
+            if job.bytes_written is not None:
+                text = _(u'%(filename)s: %(size).1f MB') % {
+                    'filename': job.get_label(),
+                    'size': job.bytes_written/(1024*1024.0)}
+            elif job.status == JOB_RUNNING:
+                text = _(u'%(filename)s: %(rows)d rows') % {
+                    'filename': job.get_label(),
+                    'rows': job.rows_written}
+            else:
+                text = job.get_label()
+        else:
+            text = _(u'%(count)d exports') % {'count': len(jobs)}
+        self.export_progress.set_text(text)
+        # Show the overall fraction if all row counts are known.
+        done = 0
+        total = 0
+        for job in jobs:
+            if not job.row_count:
+                total = None
+                break
+            done += job.rows_written
+            total += job.row_count
+        if total:
+            self.export_progress.set_fraction(min(1.0, float(done)/total))
+        else:
+            self.export_progress.pulse()
+        self.export_frame.show()
+
     # ---
     # Public methods
     # ---
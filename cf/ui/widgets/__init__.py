@@ -25,6 +25,9 @@ import gtk
 import pango
 
 from cf.db import Connection, Datasource
+from cf.db.resultstore import ResultStore
+from cf.filter.jobs import ExportJob, JOB_FINISHED
+from cf.ui.widgets.grid import RowWindow
 
 
 class ConnectionButton(gtk.MenuToolButton):
@@ -173,9 +176,11 @@ class DataExportDialog(gtk.FileChooserDialog):
       >>> dlg.destroy()
     """
 
-    def __init__(self, app, parent, data, selected, statement, description):
+    def __init__(self, app, parent, data, selected, statement, description,
+                 query=None):
         """
-        The constructor of this class takes 6 arguments:
+        The constructor of this class takes 6 arguments and an optional
+        query:
 
         :Parameter:
             app
@@ -184,7 +189,8 @@ class DataExportDialog(gtk.FileChooserDialog):
                 The parent widget, usualy something like
                 ``self.instance.widget``
             data
-                List of rows (``[ [col1, col2, col3], ...]``)
+                List of rows (``[ [col1, col2, col3], ...]``) or a
+                sequence of rows fetched on demand
             selected
                 List of indices of selected rows (``None`` means that no
                 rows are selected)
@@ -196,6 +202,10 @@ class DataExportDialog(gtk.FileChooserDialog):
                 A DB-API2-like description.
                 Read the comments on the ``description`` attribute of cursor
                 objects in `PEP 249`_ for details.
+            query
+                The `cf.db.Query` that produced the data. If given, filters
+                supporting bulk exports can re-run the statement and
+                export all rows directly from the database.
 
 
         .. Note:: Usually there's no need to define ``data`` and
@@ -216,6 +226,7 @@ class DataExportDialog(gtk.FileChooserDialog):
         self.selected = selected
         self.statement = statement
         self.description = description
+        self.query = query
         self.app = app
         self._setup_widget()
         self._setup_connections()
@@ -231,6 +242,9 @@ class DataExportDialog(gtk.FileChooserDialog):
                                                    u"selected rows")))
         self.export_selection.set_sensitive(bool(self.selected))
         vbox.pack_start(self.export_selection, False, False)
+        self.export_bulk = gtk.CheckButton(_(u"Export _all rows directly "
+                                             u"from the database"))
+        vbox.pack_start(self.export_bulk, False, False)
         self.open_file = gtk.CheckButton(_(u"_Open file when finished"))
         vbox.pack_start(self.open_file, False, False)
         vbox.show_all()
@@ -267,12 +281,17 @@ class DataExportDialog(gtk.FileChooserDialog):
     def _filter_changed(self, filter):
         plugin = filter.get_data("plugin")
         self.edit_export_options.set_sensitive(plugin.has_options)
+        # Other statements than SELECT would be executed again.
+        self.export_bulk.set_sensitive(
+            self.query is not None and plugin.supports_bulk_export
+            and self.query.parsed.get_type() == "SELECT")
 
     def export_data(self):
         """Exports the data
 
         This method handles the export options given in the dialog and
-        calls the ``export`` method of the choosen `export filter`_.
+        submits a job running the ``export`` method of the choosen
+        `export filter`_ in the background. The job is returned.
 
         .. _export filter: cf.plugins.core.ExportPlugin.html
         """
@@ -280,22 +299,71 @@ class DataExportDialog(gtk.FileChooserDialog):
                             self.get_current_folder())
         plugin = self.get_filter().get_data("plugin")
         self.app.config.set("editor.export.recent_filter", plugin.id)
+        if self.export_bulk.get_property("sensitive") \
+        and self.export_bulk.get_active():
+            job = self._create_bulk_job(plugin)
+        else:
+            job = self._create_job(plugin)
+        if self.open_file is not None and self.open_file.get_active():
+            sig = []
+            def on_job_changed(manager, changed_job):
+                if changed_job is not job or not job.done:
+                    return
+                manager.disconnect(sig[0])
+                if job.status == JOB_FINISHED:
+                    gtk.show_uri(gtk.gdk.screen_get_default(),
+                                 job.options["uri"], 0)
+            sig.append(self.app.exports.connect("job-changed",
+                                                on_job_changed))
+        return self.app.exports.submit(job)
+
+    def _create_bulk_job(self, plugin):
+        # The statement is executed again on a separate connection, the
+        # backend writes the rows straight to the file.
+        opts = {"filename": self.get_filename(),
+                "uri": self.get_uri(),
+                "query": self.statement}
+        return ExportJob(plugin, opts, query=self.query, bulk=True)
+
+    def _create_job(self, plugin):
         if self.export_selection.get_property("sensitive") \
         and self.export_selection.get_active():
-            rows = []
-            for i in self.selected:
-                rows.append(self.data[i])
+            rows = [self.data[i] for i in self.selected]
+        elif isinstance(self.data, RowWindow):
+            # The remaining rows of the editor's cursor are fetched into
+            # the grid's result store, by the export thread if the
+            # cursor can be used from other threads. Otherwise they're
+            # fetched page by page in the main loop while the job waits.
+            idle = self.query.connection.threadsafety < 2
+            rows = _iter_streamed_rows(self.data, self.query, idle)
         else:
             rows = self.data
         opts = {"filename": self.get_filename(),
                 "uri": self.get_uri(),
-                "query": self.statement}
+                "query": self.statement,
+                "row_count": None}
+        if isinstance(rows, (list, ResultStore)):
+            opts["row_count"] = len(rows)
+        if self.query is not None:
+            backend = self.query.connection.datasource.backend
+            opts["dbapi"] = backend.dbapi()
         if self.edit_export_options.get_property("sensitive") \
         and self.edit_export_options.get_active():
-            opts.update(plugin.show_options(self.description, rows))
-        plugin.export(self.description, rows, opts)
-        if self.open_file is not None and self.open_file.get_active():
-            gtk.show_uri(gtk.gdk.screen_get_default(), opts['uri'], 0)
+            if isinstance(rows, list):
+                sample = rows
+            else:
+                sample = self.data
+            opts.update(plugin.show_options(self.description, sample))
+        return ExportJob(plugin, opts, self.description, rows)
+
+
+def _iter_streamed_rows(window, query, idle=False):
+    # Runs in the export thread.
+    for row in window.iter_rows(idle):
+        yield row
+    if query is not None and not query.complete:
+        raise RuntimeError('The result was closed before all rows were'
+                           ' exported')
 
 
 class ConnectionsDialog(object):
@@ -21,6 +21,7 @@
 # NOTE:
 #     This module should have no cf dependencies!
 
+import bisect
 import mimetypes
 import tempfile
 
@@ -36,8 +37,16 @@ except ImportError:
 
 import sys
 import os
+import thread
+import threading
 
 GRID_LABEL_MAX_LENGTH = 100
+GRID_LABEL_CACHE_SIZE = 5000
+GRID_MAX_PAGES = 20
+
+# Kinds of model columns, see GridModel.
+(COLUMN_LABEL, COLUMN_DATA, COLUMN_FG, COLUMN_BG,
+ COLUMN_ROWNUM) = range(5)
 
 class Grid(gtk.TreeView):
     """Data grid
@@ -78,8 +87,6 @@ class Grid(gtk.TreeView):
         self.description = None
         self.set_rules_hint(True)
         self.get_selection().set_mode(gtk.SELECTION_NONE)
-        self.selected_columns = list()
-        self.selected_rows = list()
         self.connect("button-press-event", self.on_button_pressed)
 
     def _setup_columns(self, rows):
@@ -120,8 +127,12 @@ class Grid(gtk.TreeView):
         self.set_fixed_height_mode(True)
 
     def _setup_model(self, rows, description, coding_hint):
-        model = GridModel(rows, description, self.get_style(),
-                          coding_hint=coding_hint)
+        if isinstance(rows, RowWindow):
+            model_class = LazyGridModel
+        else:
+            model_class = GridModel
+        model = model_class(rows, description, self.get_style(),
+                            coding_hint=coding_hint)
         old_model = self.get_model()
         if old_model:
             del old_model
@@ -264,8 +275,7 @@ class Grid(gtk.TreeView):
 
     def on_first_header_clicked(self, column):
         selected = not column.get_data("pressed")
-        for xcolumn in self.get_columns()[1:]:
-            self.select_column(xcolumn, selected)
+        self.select_columns(self.get_columns()[1:], selected)
         column.set_data("pressed", selected)
 
     def on_open_blob(self, menuitem, data, app_info, mime):
@@ -311,6 +321,32 @@ class Grid(gtk.TreeView):
         dlg.run()
         dlg.destroy()
 
+    def _get_selection(self):
+        model = self.get_model()
+        if isinstance(model, GridModel):
+            return model.selected_cells
+        return None
+
+    def _set_column_background(self, column, selected):
+        if selected:
+            style = self.get_style().bg[gtk.STATE_SELECTED]
+        else:
+            style = self.get_style().bg[gtk.STATE_NORMAL]
+        for renderer in column.get_cell_renderers():
+            renderer.set_property("cell-background-gdk", style)
+            renderer.set_property("cell-background-set", selected)
+
+    def _clear_columns(self):
+        for column in self.get_selected_columns():
+            self._set_column_background(column, False)
+        selection = self._get_selection()
+        if selection is not None:
+            selection.columns = 0
+
+    def _emit_selection_changed(self):
+        self.queue_draw()
+        self.emit("selection-changed", self._get_selection())
+
     def cell_is_selected(self, row, column):
         """Returns ``True`` is a cell is selected
 
@@ -359,16 +395,26 @@ class Grid(gtk.TreeView):
                 return i
 
     def get_selected_cells(self):
-        """Returns selected cells"""
+        """Returns selected cells
+
+        The returned `GridSelection` can be iterated to get
+        (row, column) tuples.
+        """
         return self.get_model().selected_cells
 
     def get_selected_columns(self):
         """Returns selected columns"""
-        return self.selected_columns
+        selection = self._get_selection()
+        if selection is None:
+            return []
+        return [self.get_column(i+1) for i in selection.iter_columns()]
 
     def get_selected_rows(self):
         """Returns selected rows"""
-        return self.selected_rows
+        selection = self._get_selection()
+        if selection is None:
+            return []
+        return list(selection.rows)
 
     def reset(self):
         """Resets the grid"""
@@ -391,7 +437,7 @@ class Grid(gtk.TreeView):
             row
                 Row number
         """
-        return row in self.selected_rows
+        return row in self.get_model().selected_cells.rows
 
     def select_cell(self, row, column, selected):
         """Selects a cell
@@ -405,17 +451,14 @@ class Grid(gtk.TreeView):
                 ``True`` if the cell should be selected
         """
         col = self.get_model_index(column)-1
-        path = (row, col)
-        model = self.get_model()
-        self.unselect_cells()
+        selection = self.get_model().selected_cells
         if selected:
-            self.unselect_rows()
-            self.unselect_columns()
-        if selected and path not in model.selected_cells:
-            model.selected_cells.append(path)
-        elif not selected and path in model.selected_cells:
-            model.selected_cells.remove(path)
-        self.emit("selection-changed", model.selected_cells)
+            self._clear_columns()
+            selection.clear()
+            selection.cell = (row, col)
+        elif selection.cell == (row, col):
+            selection.cell = None
+        self._emit_selection_changed()
 
     def select_column(self, column, selected):
         """Selects a column
@@ -426,32 +469,34 @@ class Grid(gtk.TreeView):
             selected
                 ``True`` if the column should be selected
         """
-        if column in self.get_selected_columns() \
-        and not selected:
-            style = self.get_style().bg[gtk.STATE_NORMAL]
-            background_set = False
-            self.selected_columns.remove(column)
-        elif column not in self.get_selected_columns() \
-        and selected:
-            style = self.get_style().bg[gtk.STATE_SELECTED]
-            background_set = True
-            self.unselect_rows()
-            self.unselect_cells()
-            self.selected_columns.append(column)
+        self.select_columns([column], selected)
+
+    def select_columns(self, columns, selected):
+        """Selects or unselects multiple columns at once
+
+        :Parameter:
+            columns
+                a sequence of ``gtk.TreeViewColumn`` instances
+            selected
+                ``True`` if the columns should be selected
+        """
+        selection = self.get_model().selected_cells
+        mask = 0
+        for column in columns:
+            mask |= 1 << (self.get_model_index(column)-1)
+        if selected:
+            new_mask = selection.columns | mask
         else:
+            new_mask = selection.columns & ~mask
+        if new_mask == selection.columns:
             return
-        for renderer in column.get_cell_renderers():
-            renderer.set_property("cell-background-gdk", style)
-            renderer.set_property("cell-background-set", background_set)
-        # rebuild selected_cells
-        self.unselect_cells()
-        model = self.get_model()
-        for i in range(len(model.rows)):
-            for column in self.get_selected_columns():
-                j = self.get_model_index(column)-1
-                model.selected_cells.append((i, j))
-        self.queue_draw()
-        self.emit("selection-changed", model.selected_cells)
+        if selected:
+            selection.rows.clear()
+            selection.cell = None
+        for column in columns:
+            self._set_column_background(column, selected)
+        selection.columns = new_mask
+        self._emit_selection_changed()
 
     def select_row(self, row, selected):
         """Selects a row
@@ -462,26 +507,29 @@ class Grid(gtk.TreeView):
             selected
                 ``True`` if the row should be selected
         """
-        if selected and not self.row_is_selected(row):
-            self.unselect_columns()
-            if not self.selected_rows:
-                self.unselect_cells()
-            self.selected_rows.append(row)
-            model = self.get_model()
-            for i in range(len(self.get_columns())):
-                path = (row, i)
-                model.selected_cells.append(path)
-        elif not selected and self.row_is_selected(row):
-            self.selected_rows.remove(row)
-            model = self.get_model()
-            for i in range(len(self.get_columns())):
-                path = (row, i)
-                if path in model.selected_cells:
-                    model.selected_cells.remove(path)
-        else:
+        if selected == self.row_is_selected(row):
             return
-        self.queue_draw()
-        self.emit("selection-changed", model.selected_cells)
+        self.select_rows(row, row+1, selected)
+
+    def select_rows(self, start, stop, selected):
+        """Selects or unselects a range of rows at once
+
+        :Parameter:
+            start
+                the first row number
+            stop
+                the row number after the last row of the range
+            selected
+                ``True`` if the rows should be selected
+        """
+        selection = self.get_model().selected_cells
+        if selected:
+            self._clear_columns()
+            selection.cell = None
+            selection.rows.add(start, stop)
+        else:
+            selection.rows.remove(start, stop)
+        self._emit_selection_changed()
 
     def set_result(self, rows, description, coding_hint="utf-8"):
         """Sets the result and updates the grid
@@ -498,20 +546,153 @@ class Grid(gtk.TreeView):
 
     def unselect_cells(self):
         """Unselects all cells"""
-        model = self.get_model()
-        model.selected_cells = []
+        selection = self._get_selection()
+        if selection is not None and selection.cell is not None:
+            selection.cell = None
+            self._emit_selection_changed()
 
     def unselect_columns(self):
         """Unselects all columns"""
-        while self.get_selected_columns():
-            column = self.get_selected_columns()[0]
-            self.select_column(column, False)
+        selection = self._get_selection()
+        if selection is not None and selection.columns:
+            self._clear_columns()
+            self._emit_selection_changed()
 
     def unselect_rows(self):
         """Unselect all rows"""
-        while self.get_selected_rows():
-            row = self.get_selected_rows()[0]
-            self.select_row(row, False)
+        selection = self._get_selection()
+        if selection is not None and selection.rows:
+            selection.rows.clear()
+            self._emit_selection_changed()
+
+
+class RowRanges(object):
+    """Set of row numbers stored as sorted, non-overlapping ranges.
+
+    Membership tests use a binary search over the ranges, so selecting
+    large blocks of rows stays cheap.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._stops = []
+
+    def __contains__(self, row):
+        idx = bisect.bisect_right(self._starts, row)-1
+        return idx >= 0 and row < self._stops[idx]
+
+    def __iter__(self):
+        for start, stop in zip(self._starts, self._stops):
+            for row in xrange(start, stop):
+                yield row
+
+    def __len__(self):
+        return sum(stop-start
+                   for start, stop in zip(self._starts, self._stops))
+
+    def __nonzero__(self):
+        return bool(self._starts)
+
+    def add(self, start, stop):
+        """Adds the rows *start* to *stop* (exclusive)."""
+        if start >= stop:
+            return
+        # Find all ranges that overlap or touch the new range.
+        first = bisect.bisect_left(self._stops, start)
+        last = bisect.bisect_right(self._starts, stop)
+        if first < last:
+            start = min(start, self._starts[first])
+            stop = max(stop, self._stops[last-1])
+        self._starts[first:last] = [start]
+        self._stops[first:last] = [stop]
+
+    def remove(self, start, stop):
+        """Removes the rows *start* to *stop* (exclusive)."""
+        if start >= stop:
+            return
+        first = bisect.bisect_right(self._stops, start)
+        last = bisect.bisect_left(self._starts, stop)
+        if first >= last:
+            return
+        starts = []
+        stops = []
+        if self._starts[first] < start:
+            starts.append(self._starts[first])
+            stops.append(start)
+        if self._stops[last-1] > stop:
+            starts.append(stop)
+            stops.append(self._stops[last-1])
+        self._starts[first:last] = starts
+        self._stops[first:last] = stops
+
+    def clear(self):
+        """Removes all rows."""
+        self._starts = []
+        self._stops = []
+
+    def get_ranges(self):
+        """Returns a list of (start, stop) tuples."""
+        return zip(self._starts, self._stops)
+
+
+class GridSelection(object):
+    """Selection state of a `GridModel`.
+
+    Selected rows, selected columns and a single selected cell exclude
+    each other. Rows are stored as `RowRanges`, columns as a bit mask
+    and the cell as a (row, column) tuple.
+
+    ``(row, column) in selection`` tells if a cell is selected.
+    Iterating the selection yields (row, column) tuples of all selected
+    cells.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.rows = RowRanges()
+        self.columns = 0
+        self.cell = None
+
+    def __contains__(self, cell):
+        if self.cell is not None:
+            return self.cell == cell
+        elif self.columns:
+            return bool(self.columns >> cell[1] & 1)
+        return cell[0] in self.rows
+
+    def __nonzero__(self):
+        return bool(self.cell is not None or self.columns or self.rows)
+
+    def __iter__(self):
+        n_columns = len(self.model.description)
+        if self.cell is not None:
+            yield self.cell
+        elif self.columns:
+            columns = list(self.iter_columns())
+            for row in xrange(len(self.model.rows)):
+                for col in columns:
+                    yield row, col
+        else:
+            for row in self.rows:
+                for col in xrange(n_columns):
+                    yield row, col
+
+    def iter_columns(self):
+        """Yields the numbers of selected columns."""
+        mask = self.columns
+        col = 0
+        while mask:
+            if mask & 1:
+                yield col
+            mask >>= 1
+            col += 1
+
+    def clear(self):
+        """Clears the selection."""
+        self.rows.clear()
+        self.columns = 0
+        self.cell = None
+
 
 class GridModel(gtk.GenericTreeModel):
     """Data grid model
@@ -545,7 +726,31 @@ class GridModel(gtk.GenericTreeModel):
         self.description = description
         self.style = style
         self.coding_hint = coding_hint
-        self.selected_cells = list()
+        self.selected_cells = GridSelection(self)
+        self._get_raw_value = getattr(rows, 'get_value', None)
+        self._labels = LabelCache(GRID_LABEL_CACHE_SIZE)
+        self._setup_column_kinds()
+
+    def _setup_column_kinds(self):
+        """Build lookup tables for column kinds and types.
+
+        Both tables are indexed by the model column. An entry in
+        ``_column_kinds`` is a 2-tuple (kind, data column).
+        """
+        length = len(self.description)
+        kinds = []
+        types = []
+        for kind, type_ in ((COLUMN_LABEL, str),
+                            (COLUMN_DATA, gobject.TYPE_PYOBJECT),
+                            (COLUMN_FG, gtk.gdk.Color),
+                            (COLUMN_BG, gtk.gdk.Color)):
+            kinds.extend((kind, i) for i in xrange(length))
+            types.extend([type_]*length)
+        # The row number is found at on_get_n_columns().
+        kinds.extend([None, (COLUMN_ROWNUM, None)])
+        types.extend([None, int])
+        self._column_kinds = kinds
+        self._column_types = types
 
     def _get_markup_for_value(self, value, strip_length=True, markup=True):
         style = self.style
@@ -600,21 +805,13 @@ class GridModel(gtk.GenericTreeModel):
 
     def on_get_column_type(self, index):
         '''returns the type of a column in the model'''
-        length = len(self.description)
-        range_label = range(length)
-        range_data = range(length, length*2)
-        range_fg = range(length*2, length*3)
-        range_bg = range(length*3, length*4)
-        if index in range_label:
-            return str
-        elif index in range_data:
-            return gobject.TYPE_PYOBJECT
-        elif index == self.on_get_n_columns():
-            return int
-        elif (index in range_fg) or (index in range_bg):
-            return gtk.gdk.Color
-        else:
+        try:
+            type_ = self._column_types[index]
+        except IndexError:
+            type_ = None
+        if type_ is None:
             raise RuntimeError, "Unexpected index"
+        return type_
 
     def on_get_path(self, iter):
         '''returns the tree path (a tuple of indices at the various
@@ -629,35 +826,43 @@ class GridModel(gtk.GenericTreeModel):
         else:
             return None
 
+    def _get_raw(self, iter, data_column):
+        # Columnar results return single values without building rows.
+        if self._get_raw_value is not None:
+            return self._get_raw_value(iter, data_column)
+        return self.rows[iter][data_column]
+
     def on_get_value(self, iter, column):
         '''returns the value stored in a particular column for the node'''
-        length = len(self.description)
-        range_label = range(length)
-        range_data = range(length, length*2)
-        range_fg = range(length*2, length*3)
-        range_bg = range(length*3, length*4)
-        if column in range_label:
-            raw = self.rows[iter][column]
-            markup = self._get_markup_for_value(raw)
+        try:
+            kind = self._column_kinds[column]
+        except IndexError:
+            kind = None
+        if kind is None:
+            raise RuntimeError, "Unexpected index %r" % column
+        kind, data_column = kind
+        if kind == COLUMN_LABEL:
+            key = (iter, data_column)
+            markup = self._labels.get(key)
+            if markup is None:
+                raw = self._get_raw(iter, data_column)
+                markup = self._get_markup_for_value(raw)
+                self._labels.set(key, markup)
             return markup
-        elif column in range_data:
-            return self.rows[iter][column-len(self.description)]
-        elif column == self.on_get_n_columns():
+        elif kind == COLUMN_DATA:
+            return self._get_raw(iter, data_column)
+        elif kind == COLUMN_ROWNUM:
             return iter+1
-        elif column in range_fg:
-            data_column = column-length*2
+        elif kind == COLUMN_FG:
             if (iter, data_column) in self.selected_cells:
                 return self.style.fg[gtk.STATE_SELECTED]
             else:
                 return None
-        elif column in range_bg:
-            data_column = column-length*3
+        else:
             if (iter, data_column) in self.selected_cells:
                 return self.style.bg[gtk.STATE_SELECTED]
             else:
                 return None
-        else:
-            raise RuntimeError, "Unexpected index %r" % column
 
     def on_iter_next(self, iter):
         '''returns the next node at this level of the tree'''
@@ -687,6 +892,294 @@ class GridModel(gtk.GenericTreeModel):
         return None
 
 
+class LabelCache(object):
+    """Bounded mapping that discards the least recently used items.
+
+    The entries are kept in a circular doubly linked list, so that both
+    lookups and updates take constant time.
+    """
+
+    PREV, NEXT, KEY, VALUE = range(4)
+
+    def __init__(self, size):
+        self.size = size
+        self._map = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._map)
+
+    def get(self, key, default=None):
+        """Returns the value for *key* and marks it as recently used."""
+        link = self._map.get(key)
+        if link is None:
+            return default
+        PREV, NEXT = self.PREV, self.NEXT
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+        root = self._root
+        last = root[PREV]
+        last[NEXT] = root[PREV] = link
+        link[PREV] = last
+        link[NEXT] = root
+        return link[self.VALUE]
+
+    def set(self, key, value):
+        """Stores *value* for *key*."""
+        PREV, NEXT = self.PREV, self.NEXT
+        if key in self._map:
+            self.get(key)
+            self._map[key][self.VALUE] = value
+            return
+        root = self._root
+        if len(self._map) >= self.size:
+            oldest = root[NEXT]
+            root[NEXT] = oldest[NEXT]
+            oldest[NEXT][PREV] = root
+            del self._map[oldest[self.KEY]]
+        last = root[PREV]
+        link = [last, root, key, value]
+        last[NEXT] = root[PREV] = self._map[key] = link
+
+    def clear(self):
+        """Removes all items."""
+        self._map.clear()
+        root = self._root
+        root[:] = [root, root, None, None]
+
+
+class RowWindow(object):
+    """Sequence of rows that are fetched page by page.
+
+    Only the last recently used ``max_pages`` pages are kept in memory.
+    Pages are (re-)fetched by calling ``fetch_rows(offset, count)`` which
+    should return up to *count* rows starting at row *offset*.
+
+    The length of the sequence is either the known total number of rows
+    (*row_count*) or the number of rows fetched so far. In the latter case
+    the window grows only when :meth:`fetch_more` is called.
+
+    If a `cf.db.resultstore.ResultStore` is given as *store*, all fetched
+    rows are kept in the store instead and rows are only fetched once.
+    The store can then be filled from another thread using
+    :meth:`iter_rows`.
+    """
+
+    def __init__(self, first_rows, fetch_rows, page_size, row_count=None,
+                 max_pages=GRID_MAX_PAGES, store=None):
+        """
+        The constructor takes the following arguments:
+
+        :Parameter:
+            first_rows
+                Already fetched rows, starting with the first row
+            fetch_rows
+                Callable to fetch rows, see class description
+            page_size
+                Number of rows per page
+            row_count
+                Exact total number of rows, if known. Don't pass the
+                cursor's rowcount of a streamed result, most drivers
+                only know it when all rows are fetched.
+            max_pages
+                Max. number of pages to keep in memory, ignored if
+                *store* is given
+            store
+                Empty result store for the fetched rows (optional)
+        """
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._fetch_rows = fetch_rows
+        self._store = store
+        self._lock = thread.allocate_lock()  # serializes filling the store
+        self._exhausted = len(first_rows) < page_size
+        self._pages = {}
+        self._lru = []  # page numbers, last recently used last
+        if store is not None:
+            store.extend(first_rows)
+        else:
+            for i in xrange(0, len(first_rows), page_size):
+                self._store_page(i//page_size, first_rows[i:i+page_size])
+        if row_count is None or row_count < 0:
+            self._length = len(first_rows)
+            self.complete = len(first_rows) < page_size
+        else:
+            self._length = row_count
+            self.complete = True
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('row index out of range')
+        if self._store is not None:
+            if index >= len(self._store):
+                self._lock.acquire()
+                try:
+                    while index >= len(self._store):
+                        if not self._fill_store():
+                            raise IndexError('row index out of range')
+                finally:
+                    self._lock.release()
+            return self._store[index]
+        page = self._get_page(index//self.page_size)
+        return page[index % self.page_size]
+
+    def get_value(self, index, column):
+        """Returns a single value of a row."""
+        if self._store is not None and 0 <= index < len(self._store):
+            return self._store.get_value(index, column)
+        return self[index][column]
+
+    def __iter__(self):
+        # Only the rows in the window. Fetching more rows here would
+        # change the length behind the back of the grid's model, use
+        # fetch_more() or iter_rows() instead.
+        for index in xrange(self._length):
+            yield self[index]
+
+    def _store_page(self, page_no, rows):
+        if page_no in self._pages:
+            self._lru.remove(page_no)
+        self._pages[page_no] = rows
+        self._lru.append(page_no)
+        while len(self._lru) > self.max_pages:
+            del self._pages[self._lru.pop(0)]
+
+    def _get_page(self, page_no):
+        page = self._pages.get(page_no)
+        if page is None:
+            page = self._fetch_rows(page_no*self.page_size, self.page_size)
+            self._store_page(page_no, page)
+        elif self._lru[-1] != page_no:
+            self._lru.remove(page_no)
+            self._lru.append(page_no)
+        return page
+
+    def _fill_store(self):
+        # Called with the lock held.
+        if self._exhausted:
+            return 0
+        rows = self._fetch_rows(len(self._store), self.page_size)
+        self._store.extend(rows)
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        return len(rows)
+
+    def iter_rows(self, idle=False):
+        """Iterates over all rows of the result.
+
+        Rows that weren't fetched yet are added to the store, the window
+        picks them up with the next calls of :meth:`fetch_more`. Unlike
+        iterating over the window, this can be done in another thread.
+        Requires a store.
+
+        If *idle* is ``True``, missing pages are fetched one by one in
+        idle callbacks of the main loop and the iteration waits for
+        them. Use this if the rows can only be fetched from the main
+        thread. The main loop has to run then.
+        """
+        if self._store is None:
+            raise RuntimeError('RowWindow has no store')
+        index = 0
+        while True:
+            if index >= len(self._store):
+                if idle:
+                    filled = self._fill_store_idle(index)
+                else:
+                    filled = self._fill_store_locked(index)
+                if not filled:
+                    break
+            yield self._store[index]
+            index += 1
+
+    def _fill_store_locked(self, index):
+        self._lock.acquire()
+        try:
+            return index < len(self._store) or self._fill_store()
+        finally:
+            self._lock.release()
+
+    def _fill_store_idle(self, index):
+        done = threading.Event()
+        result = []
+        def fill():
+            try:
+                result.append(self._fill_store_locked(index))
+            finally:
+                done.set()
+            return False
+        gobject.idle_add(fill)
+        done.wait()
+        return result and result[0]
+
+    def fetch_more(self):
+        """Fetches the next page and returns the number of new rows."""
+        if self.complete:
+            return 0
+        if self._store is not None:
+            self._lock.acquire()
+            try:
+                if len(self._store) == self._length:
+                    self._fill_store()
+                # The store may contain rows fetched by iter_rows().
+                new_rows = min(len(self._store)-self._length, self.page_size)
+                self._length += new_rows
+                if self._exhausted and self._length == len(self._store):
+                    self.complete = True
+            finally:
+                self._lock.release()
+            return new_rows
+        page_no, offset = divmod(self._length, self.page_size)
+        rows = self._fetch_rows(self._length, self.page_size-offset)
+        if offset:
+            # Fill up the incomplete last page.
+            rows = self._get_page(page_no)+rows
+            new_rows = len(rows)-offset
+        else:
+            new_rows = len(rows)
+        self._store_page(page_no, rows)
+        self._length += new_rows
+        if len(rows) < self.page_size:
+            self.complete = True
+        return new_rows
+
+
+class LazyGridModel(GridModel):
+    """Data grid model for rows that are fetched on demand.
+
+    The rows are given as a `RowWindow`. When the view requests values
+    from the last page, the next page is fetched in an idle callback and
+    the new rows are added to the model.
+    """
+
+    def __init__(self, rows, description, style, coding_hint="utf-8"):
+        GridModel.__init__(self, rows, description, style, coding_hint)
+        self._fetch_pending = False
+
+    def _fetch_next_page(self):
+        self._fetch_pending = False
+        start = len(self.rows)
+        new_rows = self.rows.fetch_more()
+        for i in xrange(start, start+new_rows):
+            path = (i,)
+            self.row_inserted(path, self.get_iter(path))
+        return False
+
+    def on_get_value(self, iter, column):
+        if (not self._fetch_pending and not self.rows.complete
+            and iter >= len(self.rows)-self.rows.page_size):
+            self._fetch_pending = True
+            gobject.idle_add(self._fetch_next_page)
+        return GridModel.on_get_value(self, iter, column)
+
+
 class DataViewer(gtk.Dialog):
     """Dialog to display a value"""
 
@@ -84,13 +84,19 @@ class SQLView(gtksourceview2.View):
             'changed', self.on_config_changed)
         self.update_textview_options()
         self._buffer_changed_cb = None
+        # Statements are stored as (start mark, end mark) tuples in
+        # buffer order. The marks move along with buffer changes, only
+        # the region between the dirty marks needs to be split again.
+        self._statements = []
+        self._dirty = None
+        self.buffer.connect('insert-text', self.on_insert_text)
+        self.buffer.connect('delete-range', self.on_delete_range)
         self.buffer.connect('end-user-action', self.on_buffer_changed)
         self.buffer.connect('mark-set', self.on_mark_set)
         if self.editor is not None:
             self.editor.connect('connection-changed', lambda e, c:
                                 self.on_buffer_changed(self.buffer))
         self.connect('expose-event', self.on_expose)
-        self._sql_marks = set()
         self.connect('destroy', self.on_destroy)
 
     def on_buffer_changed(self, buffer):
@@ -98,15 +104,21 @@ class SQLView(gtksourceview2.View):
         if self._buffer_changed_cb is not None:
             gobject.source_remove(self._buffer_changed_cb)
             self._buffer_changed_cb = None
-        self._buffer_change_cb = gobject.idle_add(self.buffer_changed_cb,
-                                                  buffer)
+        self._buffer_changed_cb = gobject.idle_add(self.buffer_changed_cb,
+                                                   buffer)
 
     def on_config_changed(self, config, option, value):
         """Updates view and buffer on configuration change."""
         if option.startswith('editor.'):
             gobject.idle_add(self.update_textview_options)
         if option == "sqlparse.enabled":
-            gobject.idle_add(self.buffer_changed_cb, self.buffer)
+            gobject.idle_add(self.buffer_changed_cb, self.buffer, True)
+
+    def on_delete_range(self, buffer_, start, end):
+        self._mark_dirty(start, end)
+
+    def on_insert_text(self, buffer_, iter_, text, length):
+        self._mark_dirty(iter_, iter_)
 
     def on_destroy(self, *args):
         self.app.config.disconnect(self._sig_app_config_changed)
@@ -117,7 +129,6 @@ class SQLView(gtksourceview2.View):
         if left_margin != event.window:
             return False
 
-        buffer_ = view.get_buffer()
         color = self.get_style().base[gtk.STATE_SELECTED]
 
         cr = event.window.cairo_create()
@@ -134,42 +145,41 @@ class SQLView(gtksourceview2.View):
         margin_width, _ = left_margin.get_size()
         cr.translate(margin_width-16, offset)
 
-        forward = True
-        within_statement = self._iter_in_statement(iter_.get_line())
+        lineno = iter_.get_line()
+        statements = self._iter_statement_lines(
+            self._find_statement_line(lineno))
+        upcoming = next(statements, None)
+        active = []
         curr = self.get_current_statement()
         if curr:
             clstart, clend = [x.get_line() for x in curr]
         else:
             clstart = clend = None
-        current = False
 
         while not iter_.is_end():
             y, height = view.get_line_yrange(iter_)
             if y >= visible_rect.y:
                 break
             lineno = iter_.get_line()
+            # Only statements overlapping the visible lines are looked at.
+            while upcoming is not None and upcoming[0] <= lineno:
+                active.append(upcoming)
+                upcoming = next(statements, None)
+            active = [lines for lines in active if lines[1] >= lineno]
             start = False
             end = False
-            for mark in buffer_.get_source_marks_at_line(lineno, None):
-                name = mark.get_category()
-                if name.startswith('sql'):
-                    if name.endswith('-start'):
-                        within_statement = True
-                        start = True
-                    elif name.endswith('-end'):
-                        end = True
+            for startl, endl in active:
+                start = start or startl == lineno
+                end = end or endl == lineno
             if clstart is not None and clend is not None:
                 current = (lineno>=clstart and lineno<=clend)
             else:
                 current = False
-            if within_statement:
+            if active:
                 self._render_sql_marker(cr, 16, height, color,
                                         start, end, current)
-            if end == True:
-                within_statement = False
-                current = False
             cr.translate(0, height)
-            forward = iter_.forward_line()
+            iter_.forward_line()
 
     def _render_sql_marker(self, cr, width, height, color,
                            start, end, current):
@@ -259,31 +269,165 @@ class SQLView(gtksourceview2.View):
         self.queue_draw()
 
     def _iter_in_statement(self, lineno):
-        for start, end in self.get_statements():
-            startl = start.get_line()
-            endl = end.get_line()
-            if lineno >= startl and lineno <= endl:
-                return True
+        index = self._find_statement_line(lineno)
+        if index < len(self._statements):
+            return self._get_statement_lines(index)[0] <= lineno
         return False
 
-    def buffer_changed_cb(self, buffer):
-        """Update marks."""
-        # TODO(andi): Needs optimizations. Is there a way to fetch all marks?
-        while self._sql_marks:
-            mark = self._sql_marks.pop()
-            self.buffer.delete_mark(mark)
-        cursor_iter = buffer.get_iter_at_mark(buffer.get_insert())
-        cursor_line = cursor_iter.get_line()
-        if self.app.config.get("sqlparse.enabled", True):
-            for iter_start, iter_end in self.find_statements():
-                # Mark beginning of line
-                iter_start.set_line_offset(0)
-                iter_end.set_line_offset(0)
-                mark = buffer.create_source_mark(None, 'sql-start',
-                                                 iter_start)
-                self._sql_marks.add(mark)
-                mark = buffer.create_source_mark(None, 'sql-end', iter_end)
-                self._sql_marks.add(mark)
+    def _mark_dirty(self, start, end):
+        """Extends the region that needs to be split again."""
+        buffer_ = self.buffer
+        if self._dirty is None:
+            self._dirty = (buffer_.create_mark(None, start, True),
+                           buffer_.create_mark(None, end, False))
+            return
+        dirty_start, dirty_end = self._dirty
+        if start.compare(buffer_.get_iter_at_mark(dirty_start)) < 0:
+            buffer_.move_mark(dirty_start, start)
+        if end.compare(buffer_.get_iter_at_mark(dirty_end)) > 0:
+            buffer_.move_mark(dirty_end, end)
+
+    def _get_offset(self, mark):
+        return self.buffer.get_iter_at_mark(mark).get_offset()
+
+    def _find_statement(self, offset):
+        """Returns index of the first statement ending at or after offset."""
+        lo, hi = 0, len(self._statements)
+        while lo < hi:
+            mid = (lo+hi)//2
+            if self._get_offset(self._statements[mid][1]) < offset:
+                lo = mid+1
+            else:
+                hi = mid
+        return lo
+
+    def _get_statement_lines(self, index):
+        """Returns (start line, end line) of a statement."""
+        buffer_ = self.buffer
+        start_mark, end_mark = self._statements[index]
+        return (buffer_.get_iter_at_mark(start_mark).get_line(),
+                buffer_.get_iter_at_mark(end_mark).get_line())
+
+    def _iter_statement_lines(self, index):
+        """Yields (start line, end line) of statements from index on."""
+        for i in xrange(index, len(self._statements)):
+            yield self._get_statement_lines(i)
+
+    def _find_statement_line(self, lineno):
+        """Returns index of the first statement ending on or after lineno."""
+        lo, hi = 0, len(self._statements)
+        while lo < hi:
+            mid = (lo+hi)//2
+            if self._get_statement_lines(mid)[1] < lineno:
+                lo = mid+1
+            else:
+                hi = mid
+        return lo
+
+    def _get_statement_iters(self, index):
+        """Returns iters for the full lines covered by a statement."""
+        buffer_ = self.buffer
+        start_mark, end_mark = self._statements[index]
+        start = buffer_.get_iter_at_mark(start_mark)
+        start.set_line_offset(0)
+        end = buffer_.get_iter_at_mark(end_mark)
+        if not end.ends_line():
+            end.forward_to_line_end()
+        return start, end
+
+    def _split_region(self, start, end):
+        """Returns (start, end) offsets of the statements in a region."""
+        buffer_ = self.buffer
+        content = buffer_.get_text(buffer_.get_iter_at_offset(start),
+                                   buffer_.get_iter_at_offset(end))
+        content = content.decode('utf-8')
+        result = []
+        pos = 0
+        for stmt in sqlparse.split(content):
+            stmt = stmt.strip()
+            if not stmt:
+                continue
+            # FIXME: Does not work if linebreaks in buffers are not '\n'.
+            #    sqlparse unifies them!
+            idx = content.find(stmt, pos)
+            if idx == -1:
+                continue
+            pos = idx+len(stmt)
+            result.append((start+idx, start+pos))
+        return result
+
+    def _update_statements(self, first, last, dirty_end=0):
+        """Splits statements[first:last] again and updates their marks.
+
+        The region is extended until the new statements end at a known
+        boundary after *dirty_end* that is followed by unchanged
+        statements. Statements outside the region are kept as they are.
+        """
+        buffer_ = self.buffer
+        num_statements = len(self._statements)
+        if first > 0:
+            region_start = self._get_offset(self._statements[first-1][1])
+        else:
+            region_start = 0
+        while True:
+            if last >= num_statements:
+                last = num_statements
+                region_end = buffer_.get_char_count()
+                found = self._split_region(region_start, region_end)
+                break
+            region_end = self._get_offset(self._statements[last-1][1])
+            if last-2 >= first:
+                boundary = self._get_offset(self._statements[last-2][1])
+            else:
+                boundary = region_start
+            if dirty_end < boundary < region_end:
+                found = self._split_region(region_start, region_end)
+                if boundary in [end for start, end in found]:
+                    break
+            last += max(last-first, 1)
+        for start_mark, end_mark in self._statements[first:last]:
+            buffer_.delete_mark(start_mark)
+            buffer_.delete_mark(end_mark)
+        marks = []
+        for start, end in found:
+            start_mark = buffer_.create_source_mark(
+                None, 'sql-start', buffer_.get_iter_at_offset(start))
+            end_mark = buffer_.create_source_mark(
+                None, 'sql-end', buffer_.get_iter_at_offset(end))
+            marks.append((start_mark, end_mark))
+        self._statements[first:last] = marks
+
+    def _clear_statements(self):
+        while self._statements:
+            start_mark, end_mark = self._statements.pop()
+            self.buffer.delete_mark(start_mark)
+            self.buffer.delete_mark(end_mark)
+
+    def buffer_changed_cb(self, buffer, full=False):
+        """Update marks.
+
+        Only the statements around the changed region are split again,
+        unless *full* is ``True``.
+        """
+        if not self.app.config.get("sqlparse.enabled", True):
+            self._clear_statements()
+        elif full or not self._statements:
+            self._update_statements(0, len(self._statements))
+        elif self._dirty is not None:
+            dirty_start, dirty_end = [self._get_offset(mark)
+                                      for mark in self._dirty]
+            # The last statement may end without a delimiter, so it's
+            # always split again when the change is behind it.
+            first = min(self._find_statement(dirty_start),
+                        len(self._statements)-1)
+            # Include the next statement to verify the boundary after
+            # the changed region.
+            last = self._find_statement(dirty_end)+2
+            self._update_statements(first, last, dirty_end)
+        if self._dirty is not None:
+            buffer.delete_mark(self._dirty[0])
+            buffer.delete_mark(self._dirty[1])
+            self._dirty = None
         self._buffer_changed_cb = None
         self.queue_draw()
         return False
@@ -327,53 +471,21 @@ class SQLView(gtksourceview2.View):
             List of 2-tuples (start iter, end iter).
         """
         buffer_ = self.get_buffer()
-        buffer_start, buffer_end = buffer_.get_bounds()
-        content = buffer_.get_text(buffer_start, buffer_end)
-        iter_ = buffer_.get_start_iter()
-        for stmt in sqlparse.split(content):
-            if not stmt.strip():
-                continue
-            # FIXME: Does not work if linebreaks in buffers are not '\n'.
-            #    sqlparse unifies them!
-            bounds = iter_.forward_search(stmt.strip(),
-                                          gtk.TEXT_SEARCH_TEXT_ONLY)
-            if bounds is None:
-                continue
-            start, end = bounds
-            yield start, end
-            iter_ = end
-            if not iter_:
-                raise StopIteration
-        raise StopIteration
+        for start, end in self._split_region(0, buffer_.get_char_count()):
+            yield (buffer_.get_iter_at_offset(start),
+                   buffer_.get_iter_at_offset(end))
 
     def get_statements(self):
         """Returns iter 2-tuples for marked statements."""
-        buffer_ = self.buffer
-        iter_ = buffer_.get_iter_at_line(0)
-        start = None
-        end = None
-        while not iter_.is_end():
-            lineno = iter_.get_line()
-            for mark in buffer_.get_source_marks_at_line(lineno, None):
-                name = mark.get_category()
-                if name.endswith('-start'):
-                    start = buffer_.get_iter_at_mark(mark)
-                elif name.endswith('-end'):
-                    end = buffer_.get_iter_at_mark(mark)
-            if start is not None and end is not None:
-                end.forward_to_line_end()
-                yield start, end
-                start = end = None
-            iter_.forward_line()
-        raise StopIteration
+        for index in xrange(len(self._statements)):
+            yield self._get_statement_iters(index)
 
     def get_current_statement(self):
         """Returns iters for statement where insert mark is or None."""
         iter_ = self.buffer.get_iter_at_mark(self.buffer.get_insert())
         lineno = iter_.get_line()
-        for start, end in self.get_statements():
-            startl = start.get_line()
-            endl = end.get_line()
-            if lineno >= startl and lineno <= endl:
-                return start, end
+        index = self._find_statement_line(lineno)
+        if (index < len(self._statements)
+            and self._get_statement_lines(index)[0] <= lineno):
+            return self._get_statement_iters(index)
         return None
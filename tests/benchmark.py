@@ -0,0 +1,532 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Run benchmarks for the core engine.
+
+The benchmarks run headless against SQLite databases and synthetic
+catalogs, no database server or display is needed. The command line
+script accepts regular expressions as command line arguments. Only
+benchmarks matching one of the patterns are executed.
+
+For example
+
+  python tests/benchmark.py meta query
+
+runs the benchmarks for meta information and query execution.
+
+Each benchmark is run ``--repeat`` times and the fastest run is reported.
+Synthetic data is generated with a fixed seed, so numbers are comparable
+across runs on the same machine. Use ``--history FILE`` to compare the
+results with the last run recorded in *FILE* and to append the results
+of this run. If a benchmark is slower than ``--threshold`` percent, the
+script exits with status 1.
+
+Use ``--scale`` to run the benchmarks with smaller or larger data sets,
+e.g. ``--scale 0.1`` for a quick run.
+"""
+
+import __builtin__
+import datetime
+import optparse
+import os
+import platform
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+TESTDIR = os.path.abspath(os.path.dirname(__file__))
+
+sys.path.insert(0, os.path.join(TESTDIR, '../'))
+
+__builtin__.__dict__.setdefault('_', lambda x: x)
+
+import gtk
+
+from cf import autocompletion
+from cf.db import Datasource, Query, objects
+from cf.db.backends.postgres import Postgres, PG_CATALOG_PHASES
+from cf.db.meta import DatabaseMeta
+from cf.db.resultstore import MemoryBudget, ResultStore
+from cf.db.url import URL
+from cf.filter import exportfilter
+from cf.ui.widgets.grid import GridModel
+from cf.ui.widgets.sqlview import SQLView
+
+
+SEED = 4711
+
+# Number of lookups per run of the find benchmarks.
+LOOKUPS = 1000
+
+# Names used to build object names in synthetic catalogs.
+WORDS = ('account', 'address', 'audit', 'customer', 'invoice', 'item',
+         'order', 'payment', 'product', 'region', 'shipment', 'stock',
+         'supplier', 'tax', 'user', 'warehouse')
+
+BENCHMARKS = []
+
+# Directory for databases and exported files, created by main().
+tempdir = None
+
+
+def benchmark(name, sizes):
+    """Registers a benchmark.
+
+    The decorated function is called with a size and returns a list of
+    3-tuples (case, callable, operations). *callable* is timed, the
+    number of *operations* it performs is used to calculate a rate.
+    """
+    def decorator(func):
+        BENCHMARKS.append((name, sizes, func))
+        return func
+    return decorator
+
+
+# ----
+# Synthetic data
+# ----
+
+def generate_catalog(size, seed=SEED):
+    """Returns *size* catalog rows as returned by the PostgreSQL backend.
+
+    Most objects are tables, the rest are views, sequences, functions
+    and users. Objects are spread over one schema per 1000 objects.
+    """
+    rnd = random.Random(seed)
+    num_schemas = max(1, size//1000)
+    schemas = [(i+1, i == 0 and 'public' or 'schema_%d' % i)
+               for i in xrange(num_schemas)]
+    rows = []
+    for oid in xrange(1000, 1000+size):
+        nspoid, nspname = rnd.choice(schemas)
+        name = '%s_%s_%d' % (rnd.choice(WORDS), rnd.choice(WORDS), oid)
+        choice = rnd.random()
+        if choice < .01:
+            rows.append({'nspoid': None, 'nspname': None, 'reloid': oid,
+                         'relname': name, 'description': None,
+                         'objtype': 'user'})
+            continue
+        elif choice < .75:
+            objtype = 'table'
+        elif choice < .85:
+            objtype = 'view'
+        elif choice < .9:
+            objtype = 'sequence'
+        else:
+            objtype = 'function'
+        rows.append({'nspoid': nspoid, 'nspname': nspname, 'reloid': oid,
+                     'relname': name, 'description': 'Object %d' % oid,
+                     'objtype': objtype})
+    return rows
+
+
+def generate_rows(size, seed=SEED):
+    """Returns *size* result rows with integer, float, text and
+    timestamp values. Every 10th value in the text column is NULL.
+    """
+    rnd = random.Random(seed)
+    start = datetime.datetime(2009, 1, 1)
+    rows = []
+    for i in xrange(size):
+        if i % 10:
+            name = u'%s %d' % (rnd.choice(WORDS), rnd.randint(0, 10**6))
+        else:
+            name = None
+        rows.append((i, rnd.random()*1000, name,
+                     start+datetime.timedelta(seconds=i)))
+    return rows
+
+
+ROWS_DESCRIPTION = (('id', None, None, None, None, None, None),
+                    ('amount', None, None, None, None, None, None),
+                    ('name', None, None, None, None, None, None),
+                    ('created', None, None, None, None, None, None))
+
+
+def generate_statements(size, seed=SEED):
+    """Returns a SQL script with *size* statements."""
+    rnd = random.Random(seed)
+    statements = []
+    for i in xrange(size):
+        table = '%s_%d' % (rnd.choice(WORDS), i)
+        kind = i % 3
+        if kind == 0:
+            statements.append('SELECT a.id, a.name\n  FROM %s a\n'
+                              ' WHERE a.name LIKE \'%%;%%\'\n'
+                              ' ORDER BY a.id;' % table)
+        elif kind == 1:
+            statements.append('INSERT INTO %s (id, name) VALUES (%d, '
+                              '\'value; %d\');' % (table, i, i))
+        else:
+            statements.append('-- update %d\nUPDATE %s SET name = NULL\n'
+                              ' WHERE id IN (SELECT id FROM %s);'
+                              % (i, table, table))
+    return '\n\n'.join(statements)
+
+
+# ----
+# Stand-ins for the application
+# ----
+
+class BenchmarkPostgres(Postgres):
+    """PostgreSQL backend answering catalog queries with generated rows."""
+
+    def __init__(self, rows):
+        Postgres.__init__(self)
+        phase_sql = dict(PG_CATALOG_PHASES)
+        self._results = {
+            phase_sql['relations']: [row for row in rows if row['objtype']
+                                     in ('table', 'view', 'sequence')],
+            phase_sql['functions']: [row for row in rows
+                                     if row['objtype'] == 'function'],
+            phase_sql['users']: [row for row in rows
+                                 if row['objtype'] == 'user'],
+            phase_sql['languages']: [],
+        }
+
+    def _query(self, connection, sql):
+        if sql == 'show search_path':
+            return [('public',)]
+        return self._results[sql]
+
+
+class FakeApp(object):
+
+    def __init__(self):
+        self.config = {'meta.cache_enabled': False}
+
+    def set_status_message(self, msg, context=1):
+        pass
+
+    def pop_status_message(self, context=1):
+        pass
+
+
+class FakeManager(object):
+
+    def __init__(self):
+        self.app = FakeApp()
+
+
+class FakeConnection(object):
+
+    threadsafety = 0
+
+    def close(self):
+        pass
+
+
+class CatalogDatasource(object):
+    """Data source whose meta information is loaded synchronously."""
+
+    def __init__(self, backend):
+        self.id = None
+        self.manager = FakeManager()
+        self.backend = backend
+        self.internal_connection = FakeConnection()
+
+
+class FakeEditor(object):
+
+    def __init__(self, meta):
+        self.connection = FakeEditorConnection(meta)
+
+
+class FakeEditorConnection(object):
+
+    def __init__(self, meta):
+        self.meta = meta
+
+
+class StatementBuffer(object):
+    """Provides what SQLView.find_statements needs without a widget."""
+
+    _split_region = SQLView._split_region.im_func
+    find_statements = SQLView.find_statements.im_func
+
+    def __init__(self, text):
+        self.buffer = gtk.TextBuffer()
+        self.buffer.set_text(text)
+
+    def get_buffer(self):
+        return self.buffer
+
+
+_catalog_cache = {}
+
+
+def get_meta(size):
+    """Returns catalog rows, backend and loaded meta information for a
+    catalog of *size* objects.
+    """
+    if size not in _catalog_cache:
+        _catalog_cache.clear()
+        rows = generate_catalog(size)
+        backend = BenchmarkPostgres(rows)
+        meta = DatabaseMeta(CatalogDatasource(backend))
+        _catalog_cache[size] = (rows, backend, meta)
+    return _catalog_cache[size]
+
+
+# ----
+# Benchmarks
+# ----
+
+@benchmark('meta', (10000, 100000, 1000000))
+def bench_meta(size):
+    rows, backend, meta = get_meta(size)
+    rnd = random.Random(SEED)
+    samples = [rnd.choice(rows) for i in xrange(LOOKUPS)]
+    names = [row['relname'] for row in samples]
+    tables = [row['reloid'] for row in samples if row['objtype'] == 'table']
+    collections = meta.find(cls=objects.Tables)
+
+    def initialize():
+        DatabaseMeta(CatalogDatasource(backend))
+
+    def find_name():
+        for name in names:
+            meta.find(name=name)
+
+    def find_parent():
+        for coll in collections:
+            meta.find(cls=objects.Table, parent=coll)
+
+    def find_exact():
+        for oid in tables:
+            meta.find_exact(oid=oid, cls=objects.Table)
+
+    return [('initialize', initialize, size),
+            ('find.name', find_name, len(names)),
+            ('find.parent', find_parent, len(collections)),
+            ('find_exact', find_exact, len(tables))]
+
+
+@benchmark('completion', (10000, 100000, 1000000))
+def bench_completion(size):
+    rows, backend, meta = get_meta(size)
+    editor = FakeEditor(meta)
+    rnd = random.Random(SEED)
+    fragments = [rnd.choice(WORDS)[:3] for i in xrange(50)]
+    fragments += ['%s_%d' % (rnd.choice(WORDS)[-3:], rnd.randint(1, 9))
+                  for i in xrange(50)]
+    completions = autocompletion.build_completions(editor, 'ord', None)
+
+    def build():
+        for fragment in fragments:
+            autocompletion.build_completions(editor, fragment)
+
+    def matches():
+        autocompletion.find_matches(completions, 'ord')
+
+    return [('build_completions', build, len(fragments)),
+            ('find_matches', matches, len(completions))]
+
+
+@benchmark('statements', (100, 1000, 10000))
+def bench_statements(size):
+    view = StatementBuffer(generate_statements(size))
+
+    def find():
+        list(view.find_statements())
+
+    return [('find_statements', find, size)]
+
+
+@benchmark('grid', (10000, 100000))
+def bench_grid(size):
+    rows = generate_rows(size)
+    store = ResultStore(budget=MemoryBudget(), columnar=True)
+    store.extend(rows)
+    style = gtk.Style()
+    num_columns = len(ROWS_DESCRIPTION)
+
+    def get_values(rows, offset):
+        model = GridModel(rows, ROWS_DESCRIPTION, style)
+        get_value = model.on_get_value
+        for row in xrange(size):
+            for column in xrange(offset, offset+num_columns):
+                get_value(row, column)
+
+    return [('label', lambda: get_values(rows, 0), size*num_columns),
+            ('label.columnar', lambda: get_values(store, 0),
+             size*num_columns),
+            ('data', lambda: get_values(rows, num_columns),
+             size*num_columns),
+            ('data.columnar', lambda: get_values(store, num_columns),
+             size*num_columns)]
+
+
+@benchmark('query', (10000, 100000, 1000000))
+def bench_query(size):
+    filename = os.path.join(tempdir, 'query-%d.db' % size)
+    conn = sqlite3.connect(filename)
+    conn.execute('create table bench (id integer, amount real, name text,'
+                 ' created timestamp)')
+    conn.executemany('insert into bench values (?, ?, ?, ?)',
+                     generate_rows(size))
+    conn.commit()
+    conn.close()
+    datasource = Datasource(None)
+    datasource.url = URL('sqlite', database=filename)
+    connection = datasource.open_background_connection()
+    statement = 'select * from bench'
+
+    def execute():
+        query = Query(statement, connection)
+        query.execute()
+        assert len(query.rows) == size
+        query.rows.close()
+
+    def stream():
+        query = Query(statement, connection, page_size=500)
+        query.execute()
+        for row in query.iter_rows():
+            pass
+        query.close()
+
+    return [('execute', execute, size),
+            ('execute.stream', stream, size)]
+
+
+def get_export_filters():
+    filters = [exportfilter.CSVExportFilter]
+    for module, names in (('ooolib', ['OOCalcExportFilter']),
+                          ('xlwt', ['XlsExportFilter']),
+                          ('pyarrow', ['ArrowExportFilter',
+                                       'ParquetExportFilter'])):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        filters.extend(getattr(exportfilter, name) for name in names)
+    return filters
+
+
+@benchmark('export', (10000, 100000))
+def bench_export(size):
+    rows = generate_rows(size)
+    cases = []
+    for cls in get_export_filters():
+        plugin = cls(None)
+        filename = os.path.join(tempdir, 'export%s'
+                                % cls.file_filter_pattern[0][1:])
+
+        def export(plugin=plugin, filename=filename):
+            plugin.export(ROWS_DESCRIPTION, rows, {'filename': filename,
+                                                   'row_count': size})
+            os.remove(filename)
+
+        cases.append((cls.__name__, export, size))
+    return cases
+
+
+# ----
+# Runner
+# ----
+
+def measure(func, repeat):
+    """Returns the fastest of *repeat* runs in seconds."""
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def get_environment():
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlite': sqlite3.sqlite_version}
+
+
+def load_history(filename):
+    """Returns the results of the last run recorded in *filename*."""
+    if not os.path.isfile(filename):
+        return None
+    last = None
+    for line in open(filename):
+        if line.strip():
+            last = line
+    if last is None:
+        return None
+    return json.loads(last)
+
+
+def main():
+    global tempdir
+    parser = optparse.OptionParser(usage='%prog [options] [pattern ...]')
+    parser.add_option('-r', '--repeat', type='int', default=3,
+                      help='number of runs per benchmark (default: 3)')
+    parser.add_option('-s', '--scale', type='float', default=1.0,
+                      help='factor applied to data set sizes')
+    parser.add_option('--history', metavar='FILE',
+                      help='compare with and append to FILE')
+    parser.add_option('-t', '--threshold', type='float', default=10.0,
+                      help='slowdown in percent reported as regression'
+                      ' (default: 10)')
+    opts, args = parser.parse_args()
+    patterns = [re.compile(arg, re.IGNORECASE) for arg in args]
+    previous = None
+    if opts.history:
+        previous = load_history(opts.history)
+    results = {}
+    regressions = []
+    tempdir = tempfile.mkdtemp(prefix='cf-benchmark-')
+    print '%-40s %10s %12s %14s %8s' % ('benchmark', 'size', 'best [s]',
+                                        'ops/s', 'change')
+    try:
+        for name, sizes, func in BENCHMARKS:
+            if patterns and not [p for p in patterns if p.search(name)]:
+                continue
+            for size in sizes:
+                size = max(1, int(size*opts.scale))
+                for case, case_func, ops in func(size):
+                    key = '%s.%s@%d' % (name, case, size)
+                    best = measure(case_func, opts.repeat)
+                    results[key] = {'best': best, 'ops': ops}
+                    change = ''
+                    if previous and key in previous['results']:
+                        old = previous['results'][key]['best']
+                        if old:
+                            percent = (best-old)*100/old
+                            change = '%+.1f%%' % percent
+                            if percent > opts.threshold:
+                                regressions.append(key)
+                    print '%-40s %10d %12.4f %14.0f %8s' % (
+                        '%s.%s' % (name, case), size, best,
+                        ops/max(best, 1e-9), change)
+                    sys.stdout.flush()
+    finally:
+        shutil.rmtree(tempdir)
+    if opts.history:
+        f = open(opts.history, 'a')
+        try:
+            f.write(json.dumps({'environment': get_environment(),
+                                'results': results}))
+            f.write('\n')
+        finally:
+            f.close()
+    if regressions:
+        print
+        print 'Regressions (more than %.0f%% slower):' % opts.threshold
+        for key in regressions:
+            print '  %s' % key
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
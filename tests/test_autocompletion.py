@@ -0,0 +1,172 @@
+import time
+import unittest
+
+import gobject
+
+from cf.autocompletion import CompletionWorker, compute_matches
+
+
+class FakeEditor(object):
+
+    def __init__(self):
+        self.lookups = 0
+
+    @property
+    def connection(self):
+        # Accessed when matches are computed.
+        self.lookups += 1
+        return None
+
+
+class FakeCollection(object):
+
+    def __init__(self, meta):
+        self.meta = meta
+
+    def get_children(self):
+        self.meta.loads.append(self)
+        return self.meta.find(parent=self)
+
+
+class FakeTable(object):
+
+    typeid = 'table'
+
+    def __init__(self, meta):
+        self.columns = FakeCollection(meta)
+
+
+class FakeColumn(object):
+
+    name = 'customer_id'
+    typestr = 'Column'
+
+
+class FakeMeta(object):
+    # Only the columns of the cached table are loaded.
+
+    def __init__(self):
+        self.loads = []
+        self.cached = FakeTable(self)
+        self.missing = FakeTable(self)
+
+    def can_refresh_in_background(self):
+        return False
+
+    def load_columns(self, tables):
+        self.loads.extend(tables)
+
+    def find(self, name=None, parent=None):
+        if name == 'orders':
+            return [self.cached]
+        elif name == 'customers':
+            return [self.missing]
+        elif parent is self.cached.columns:
+            return [FakeColumn()]
+        return []
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.meta = FakeMeta()
+
+
+class MetaEditor(object):
+
+    def __init__(self):
+        self.connection = FakeConnection()
+
+
+class RecordingWorker(CompletionWorker):
+
+    def __init__(self, editor):
+        CompletionWorker.__init__(self, editor)
+        self.popups = []
+        self.requests = []
+
+    def _on_timeout(self, popup):
+        self._timeout = None
+        self.popups.append(popup)
+        return False
+
+    def _compute(self, serial, request, callback, args):
+        self.requests.append(request)
+        CompletionWorker._compute(self, serial, request, callback, args)
+
+
+class TestCompletionWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.editor = FakeEditor()
+        self.worker = RecordingWorker(self.editor)
+
+    def _process_events(self, seconds=.1):
+        context = gobject.main_context_default()
+        end = time.time()+seconds
+        while time.time() < end:
+            if not context.iteration(False):
+                time.sleep(.01)
+
+    def test_debounce(self):
+        self.worker.schedule('first', delay=10)
+        self.worker.schedule('second', delay=10)
+        self._process_events()
+        self.assertEqual(self.worker.popups, ['second'])
+
+    def test_outdated_request(self):
+        delivered = []
+        serial = self.worker._serial
+        self.worker.cancel()
+        self.worker._compute(serial, ('sel', None), delivered.append, ())
+        self.assertEqual(self.editor.lookups, 0)
+        self.assertEqual(
+            self.worker._deliver(serial, 'sel', [], delivered.append, ()),
+            False)
+        self.assertEqual(delivered, [])
+
+    def test_latest_request(self):
+        delivered = []
+        # Requests made while the worker thread is busy replace each other.
+        self.worker._running = True
+        self.worker.submit(('sel', None), delivered.append)
+        self.worker.submit(('sele', None), delivered.append)
+        self.worker._run()
+        self.assertEqual(self.worker.requests, [('sele', None)])
+        self.failIf(self.worker._running)
+        # The editor changed, the result is dropped.
+        self.worker.cancel()
+        self._process_events()
+        self.assertEqual(delivered, [])
+
+
+class TestComputeMatches(unittest.TestCase):
+
+    def setUp(self):
+        self.editor = MetaEditor()
+        self.meta = self.editor.connection.meta
+
+    def _names(self, matches):
+        return [compl[1][0] for value in matches.itervalues()
+                for compl in value]
+
+    def test_skip_loading(self):
+        statement = 'select * from orders, customers'
+        matches = compute_matches(self.editor, '', statement, load=False)
+        self.assertEqual(self._names(matches), ['customer_id'])
+        self.assertEqual(self.meta.loads, [])
+        matches = compute_matches(self.editor, 'o.cust',
+                                  'select * from orders o', load=False)
+        self.assertEqual(self._names(matches), ['customer_id'])
+        self.assertEqual(self.meta.loads, [])
+
+    def test_worker(self):
+        # Columns are never loaded on the editor's connection in the
+        # worker thread.
+        worker = CompletionWorker(self.editor)
+        worker._compute(worker._serial, ('', 'select * from customers'),
+                        None, ())
+        self.assertEqual(self.meta.loads, [])
+        compute_matches(self.editor, '', 'select * from customers')
+        self.assertEqual(self.meta.loads,
+                         [self.meta.missing, self.meta.missing.columns])
@@ -0,0 +1,236 @@
+import sqlite3
+import threading
+import unittest
+from StringIO import StringIO
+
+import sqlparse
+
+from cf.db import objects
+from cf.db.backends.mysql import MySQL
+from cf.db.backends.postgres import Postgres
+from cf.db.backends.sqlite import SQLite
+from cf.db.meta import ObjectStore
+
+
+class FakeMeta(object):
+
+    def __init__(self):
+        self.store = ObjectStore()
+        self.find = self.store.find
+
+    def set_object(self, obj):
+        self.store.add(obj)
+
+    def update_object(self, obj):
+        self.store.update(obj)
+
+    def remove_object(self, obj):
+        self.store.remove(obj)
+
+    def find_exact(self, **kwds):
+        res = self.find(**kwds)
+        if len(res) == 1:
+            return res[0]
+        return None
+
+
+class QueryRecorder(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def _query(self, connection, sql):
+        self.queries.append(sql)
+        return self.rows
+
+
+class FakeMySQL(QueryRecorder, MySQL):
+    pass
+
+
+class FakePostgres(QueryRecorder, Postgres):
+    pass
+
+
+class FakeDatasource(object):
+
+    def __init__(self, statement_timeout=None):
+        self.statement_timeout = statement_timeout
+
+
+class FakeConnection(object):
+
+    def __init__(self, datasource=None):
+        self.connection = sqlite3.connect(':memory:')
+        self.datasource = datasource or FakeDatasource()
+        self.client_timeout = None
+
+    def execute(self, sql):
+        return self.connection.execute(sql).fetchall()
+
+    def get_dbapi_connection(self):
+        return self.connection
+
+
+class FakeQuery(object):
+
+    def __init__(self, statement, connection):
+        self.statement = statement
+        self.connection = connection
+        self.coding_hint = 'utf-8'
+        self.parsed = sqlparse.parse(statement)[0]
+
+
+class CopyConnection(object):
+    """Records COPY statements, serves as connection and cursor."""
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def copy_expert(self, sql, fp):
+        self.statements.append(sql)
+
+    def close(self):
+        pass
+
+
+def column_row(table, name, pos):
+    return {'id': 'db.%s.%s' % (table, name), 'parent': 'db.%s' % table,
+            'name': name, 'description': None, 'pos': pos,
+            'data_type': 'int(11)', 'column_default': None,
+            'is_nullable': 'NO', 'column_key': pos == 1 and 'PRI' or ''}
+
+
+class TestMySQLColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.meta = FakeMeta()
+        self.schema = objects.Schema(self.meta, name='db', oid='db')
+        self.meta.set_object(self.schema)
+        self.tables = objects.Tables(self.meta, parent=self.schema)
+        self.meta.set_object(self.tables)
+        self.t1 = self._table('t1')
+        self.t2 = self._table('t2')
+
+    def _table(self, name):
+        table = objects.Table(self.meta, name=name, oid='db.%s' % name,
+                              parent=self.tables, schema=self.schema)
+        self.meta.set_object(table)
+        return table
+
+    def test_batched(self):
+        backend = FakeMySQL([column_row('t1', 'id', 1),
+                             column_row('t1', 'name', 2),
+                             column_row('t2', 'id', 1)])
+        backend.refresh_many([self.t1.columns, self.t2.columns],
+                                self.meta, None)
+        self.assertEqual(len(backend.queries), 1)
+        self.assert_("table_name = 't2'" in backend.queries[0])
+        cols = sorted(self.meta.find(cls=objects.Column,
+                                     parent=self.t1.columns))
+        self.assertEqual([col.name for col in cols], ['id', 'name'])
+        self.assert_(cols[0].pk)
+        # Dropped columns are removed on the next refresh.
+        backend.rows = [column_row('t1', 'id', 1)]
+        backend.refresh_many([self.t1.columns], self.meta, None)
+        self.assertEqual(len(self.meta.find(cls=objects.Column,
+                                            parent=self.t1.columns)), 1)
+        self.assertEqual(len(self.meta.find(cls=objects.Column,
+                                            parent=self.t2.columns)), 1)
+
+
+class TestBatchedRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.meta = FakeMeta()
+        self.tables = objects.Tables(self.meta)
+        self.meta.set_object(self.tables)
+        self.t1 = self._table('t1', 1)
+        self.t2 = self._table('t2', 2)
+
+    def _table(self, name, oid):
+        table = objects.Table(self.meta, name=name, oid=oid,
+                              parent=self.tables)
+        self.meta.set_object(table)
+        return table
+
+    def test_postgres(self):
+        backend = FakePostgres([
+            {'oid': 10, 'conrelid': 1, 'conname': 't1_pkey',
+             'description': None},
+            {'oid': 11, 'conrelid': 2, 'conname': 't2_pkey',
+             'description': None}])
+        backend.refresh_many([self.t1.constraints, self.t2.constraints],
+                             self.meta, None)
+        self.assertEqual(len(backend.queries), 1)
+        self.assert_("any('{1,2}'::oid[])" in backend.queries[0]
+                     or "any('{2,1}'::oid[])" in backend.queries[0])
+        self.assertEqual(self.meta.find(parent=self.t2.constraints)[0].name,
+                         't2_pkey')
+
+    def test_sqlite(self):
+        conn = FakeConnection()
+        conn.execute('create table t1 (id integer primary key, x text)')
+        conn.execute('create table t2 (y)')
+        SQLite().refresh_many([self.t1.columns, self.t2.columns],
+                              self.meta, conn)
+        cols = self.meta.find(cls=objects.Column, parent=self.t1.columns)
+        self.assertEqual(sorted(col.name for col in cols), ['id', 'x'])
+        self.assertEqual(len(self.meta.find(cls=objects.Column,
+                                            parent=self.t2.columns)), 1)
+
+
+class TestBulkExport(unittest.TestCase):
+
+    def test_batched_writer(self):
+        conn = FakeConnection()
+        conn.execute('create table t (id integer, name text)')
+        conn.connection.executemany('insert into t values (?, ?)',
+                                    [(1, u'foo'), (2, u'b\xe4r'), (3, None)])
+        fp = StringIO()
+        progress = []
+        written = SQLite().bulk_export(FakeQuery('select * from t', conn),
+                                       fp, progress.append)
+        self.assertEqual(fp.getvalue(),
+                         'id,name\r\n1,foo\r\n2,b\xc3\xa4r\r\n3,\r\n')
+        self.assertEqual(written, len(fp.getvalue()))
+        self.assertEqual(progress, [written])
+
+    def test_select_only(self):
+        conn = FakeConnection()
+        conn.execute('create table t (id integer)')
+        query = FakeQuery('delete from t', conn)
+        self.assertRaises(RuntimeError, SQLite().bulk_export, query,
+                          StringIO())
+        self.assertRaises(RuntimeError, Postgres().bulk_export, query,
+                          StringIO())
+
+    def test_copy_trailing_comment(self):
+        conn = FakeConnection()
+        conn.connection = CopyConnection()
+        Postgres().bulk_export(FakeQuery('select 1 -- one', conn),
+                               StringIO())
+        self.assertEqual(conn.connection.statements,
+                         ['COPY (select 1 -- one\n) TO STDOUT WITH CSV HEADER'])
+
+class TestCancel(unittest.TestCase):
+
+    def test_sqlite_cancel(self):
+        conn = FakeConnection()
+        timer = threading.Timer(.1, SQLite().cancel, (conn,))
+        timer.start()
+        self.assertRaises(sqlite3.OperationalError, conn.execute,
+                          'with recursive c(x) as (select 1 union all '
+                          'select x+1 from c) select count(*) from c')
+
+    def test_client_timeout(self):
+        conn = FakeConnection(FakeDatasource(statement_timeout=5))
+        SQLite().prepare_connection(conn)
+        self.assertEqual(conn.client_timeout, 5)
+        conn = FakeConnection()
+        SQLite().prepare_connection(conn)
+        self.assertEqual(conn.client_timeout, None)
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cf.db.cache import CatalogCache
+from cf.db.url import make_url
+
+
+class FakeDatasource(object):
+
+    def __init__(self, url):
+        self.id = 'abc'
+        self.url = make_url(url)
+
+    @property
+    def public_url(self):
+        return str(self.url)
+
+
+class TestCatalogCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.ds = FakeDatasource('postgres://user@localhost/db')
+        self.cache = CatalogCache(self.ds, self.dirname)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_roundtrip(self):
+        self.assertEqual(self.cache.load(), None)
+        rows = {('rel', 1): [{'reloid': 1, 'relname': 'foo', 0: 1}],
+                ('rel', 2): [{'reloid': 2, 'relname': 'bar',
+                              'description': 'Bar'}]}
+        state = {('rel', 1): '100', ('rel', 2): '101'}
+        self.cache.save(rows, state)
+        cached_rows, cached_state = self.cache.load()
+        self.assertEqual(cached_state, state)
+        self.assertEqual(cached_rows[('rel', 1)],
+                         [{'reloid': 1, 'relname': 'foo',
+                           'description': None}])
+        self.assertEqual(cached_rows[('rel', 2)][0]['description'], 'Bar')
+
+    def test_signature(self):
+        self.cache.save({}, {})
+        self.assertNotEqual(self.cache.load(), None)
+        self.ds.url = make_url('postgres://other@localhost/db')
+        self.assertEqual(self.cache.load(), None)
+        self.cache.clear()
+        self.failIf(os.path.exists(self.cache.filename))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import cPickle
+import datetime
+import unittest
+
+from cf.db import columnar
+from cf.db.columnar import ColumnBatch
+
+
+class TestColumnBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            (1, 1.5, 'foo', u'b\xe4r', datetime.datetime(2009, 5, 1, 12, 30),
+             datetime.date(1969, 12, 31), [1]),
+            (None, None, None, None, None, None, None),
+            (3L, 2.0, '', u'', datetime.datetime(1900, 1, 1, 0, 0, 0, 5),
+             datetime.date(2009, 1, 1), {}),
+        ]
+        self.batch = ColumnBatch(self.rows)
+
+    def test_kinds(self):
+        kinds = [column.kind for column in self.batch.columns]
+        self.assertEqual(kinds, [columnar.KIND_INT, columnar.KIND_FLOAT,
+                                 columnar.KIND_STR, columnar.KIND_UNICODE,
+                                 columnar.KIND_DATETIME, columnar.KIND_DATE,
+                                 columnar.KIND_OBJECT])
+        self.assertEqual(self.batch.columns[2].data, 'foo')
+        self.assert_(self.batch.columns[0].is_null(1))
+        self.failIf(self.batch.columns[0].is_null(0))
+
+    def test_values(self):
+        self.assertEqual(len(self.batch), 3)
+        self.assertEqual(list(self.batch), self.rows)
+        self.assertEqual(self.batch[-1], self.rows[-1])
+        self.assertEqual(self.batch[1:], self.rows[1:])
+        self.assertEqual(self.batch.get_value(0, 3), u'b\xe4r')
+        self.assertEqual(type(self.batch.get_value(2, 0)), long)
+        self.assertRaises(IndexError, self.batch.__getitem__, 3)
+
+    def test_fallback(self):
+        batch = ColumnBatch([(1, 'a'), (2**70, u'b')])
+        self.assertEqual(batch.columns[0].kind, columnar.KIND_OBJECT)
+        self.assertEqual(batch.columns[1].kind, columnar.KIND_OBJECT)
+        self.assertEqual(list(batch), [(1, 'a'), (2**70, u'b')])
+
+    def test_pickle(self):
+        batch = cPickle.loads(cPickle.dumps(self.batch, 2))
+        self.assertEqual(list(batch), self.rows)
@@ -0,0 +1,186 @@
+import csv
+import decimal
+import os
+import tempfile
+import unittest
+
+import gobject
+
+from cf.filter import exportfilter
+from cf.filter.exportfilter import CSVExportFilter
+from cf.filter import jobs
+from cf.plugins import core
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+class TestCSVExport(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.plugin = CSVExportFilter(None)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_stream(self):
+        progress = []
+        self.plugin.connect('progress',
+                            lambda plugin, done, total: progress.append(done))
+        count = core.EXPORT_PROGRESS_INTERVAL*2+1
+        rows = ((i, 'row %d' % i) for i in xrange(count))
+        description = (('id', None), ('name', None))
+        self.plugin.export(description, rows, {'filename': self.filename})
+        # Progress is reported in the main loop.
+        context = gobject.main_context_default()
+        while context.pending():
+            context.iteration(False)
+        self.assertEqual(progress, [core.EXPORT_PROGRESS_INTERVAL,
+                                    core.EXPORT_PROGRESS_INTERVAL*2, count])
+        written = list(csv.reader(open(self.filename)))
+        self.assertEqual(written[0], ['id', 'name'])
+        self.assertEqual(written[-1], [str(count-1), 'row %d' % (count-1)])
+        self.assertEqual(len(written), count+1)
+
+
+class FakeDBAPI(object):
+    STRING = 1
+    BINARY = 2
+    NUMBER = 3
+    DATETIME = 4
+
+
+class TestColumnarHelpers(unittest.TestCase):
+
+    def test_iter_chunks(self):
+        chunks = list(exportfilter.iter_chunks(iter(range(5)), 2))
+        self.assertEqual(chunks, [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(exportfilter.iter_chunks([], 2)), [])
+
+    def test_column_kinds(self):
+        description = (('a', 1), ('b', 2), ('c', 3), ('d', 4), ('e', 5),
+                       ('f', None))
+        self.assertEqual(exportfilter.get_column_kinds(description,
+                                                       FakeDBAPI),
+                         ['string', 'binary', 'number', 'datetime', None,
+                          None])
+        self.assertEqual(exportfilter.get_column_kinds(description),
+                         [None]*6)
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class TestArrowExport(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.arrow')
+        os.close(fd)
+        self.plugin = exportfilter.ArrowExportFilter(None)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def _export(self, description, rows, dbapi=None):
+        self.plugin.export(description, rows, {'filename': self.filename,
+                                               'row_group_size': 2,
+                                               'dbapi': dbapi})
+        # Python 2 strings would be read as a buffer.
+        source = pyarrow.OSFile(self.filename)
+        try:
+            return pyarrow.ipc.open_file(source).read_all()
+        finally:
+            source.close()
+
+    def test_first_chunk(self):
+        D = decimal.Decimal
+        description = (('empty', None), ('number', None), ('amount', None),
+                       ('mixed', None))
+        rows = [(None, 1, D('1.5'), 1),
+                (None, 2, D('2.5'), u'two'),
+                (None, 3.0, D('123.5'), 3),
+                (u'x', None, 5, None),
+                (None, 4, D('4.5'), None)]
+        table = self._export(description, rows)
+        # The types are resolved from the first two rows, decimals get
+        # the largest precision.
+        self.assertEqual([field.type for field in table.schema],
+                         [pyarrow.string(), pyarrow.int64(),
+                          pyarrow.decimal128(38, 1), pyarrow.string()])
+        columns = [table.column(i).to_pylist() for i in range(4)]
+        self.assertEqual(columns[0], [None, None, None, u'x', None])
+        self.assertEqual(columns[1], [1, 2, 3, None, 4])
+        self.assertEqual(columns[2], [D('1.5'), D('2.5'), D('123.5'),
+                                      D('5'), D('4.5')])
+        self.assertEqual(columns[3], [u'1', u'two', u'3', None, None])
+        # Each chunk is written as it arrives.
+        self.assertEqual(table.to_batches()[0].num_rows, 2)
+
+    def test_description(self):
+        D = decimal.Decimal
+        description = (('id', FakeDBAPI.NUMBER),
+                       ('price', FakeDBAPI.NUMBER, None, None, 10, 2),
+                       ('rate', FakeDBAPI.NUMBER),
+                       ('name', FakeDBAPI.STRING))
+        rows = [(1, D('1.50'), None, 'a'),
+                (2, D('2.25'), None, None),
+                (3, D('1234.75'), D('0.5'), 'c')]
+        table = self._export(description, rows, FakeDBAPI)
+        self.assertEqual([field.type for field in table.schema],
+                         [pyarrow.int64(), pyarrow.decimal128(10, 2),
+                          pyarrow.float64(), pyarrow.string()])
+        self.assertEqual(table.column(1).to_pylist()[-1], D('1234.75'))
+        self.assertEqual(table.column(2).to_pylist(), [None, None, 0.5])
+        self.assertEqual(table.column(3).to_pylist(), [u'a', None, u'c'])
+
+    def test_cast_fails(self):
+        description = (('id', None),)
+        rows = [(1,), (2,), (3.5,)]
+        self.assertRaises(RuntimeError, self._export, description, rows)
+
+    def test_compression(self):
+        if hasattr(pyarrow.ipc, 'IpcWriteOptions'):
+            self.assertEqual(self.plugin.compression_choices,
+                             [None, 'lz4', 'zstd'])
+        else:
+            self.assertEqual(self.plugin.compression_choices, [None])
+
+
+class TestExportJob(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.plugin = CSVExportFilter(None)
+        self.reports = []
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def _job(self, rows):
+        return jobs.ExportJob(self.plugin, {'filename': self.filename},
+                              (('id', None),), rows)
+
+    def test_run(self):
+        job = self._job([(i,) for i in xrange(10)])
+        job.run(self.reports.append)
+        self.assertEqual(job.status, jobs.JOB_FINISHED)
+        self.assertEqual(job.rows_written, 10)
+        self.assertEqual(self.reports, [job, job])
+        self.assertEqual(len(open(self.filename).readlines()), 11)
+
+    def test_cancel(self):
+        def rows():
+            for i in xrange(core.EXPORT_PROGRESS_INTERVAL*2):
+                if i == 5:
+                    job.cancel()
+                yield (i,)
+        job = self._job(rows())
+        job.run(self.reports.append)
+        self.assertEqual(job.status, jobs.JOB_CANCELLED)
+        self.assertEqual(job.rows_written, 5)
+        self.failIf(os.path.exists(self.filename))
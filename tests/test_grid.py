@@ -0,0 +1,47 @@
+import unittest
+
+from cf.ui.widgets.grid import GridSelection, RowRanges
+
+
+class TestRowRanges(unittest.TestCase):
+
+    def test_merge(self):
+        ranges = RowRanges()
+        ranges.add(5, 10)
+        ranges.add(20, 30)
+        ranges.add(10, 12)
+        self.assertEqual(ranges.get_ranges(), [(5, 12), (20, 30)])
+        ranges.add(11, 21)
+        self.assertEqual(ranges.get_ranges(), [(5, 30)])
+        self.assertEqual(len(ranges), 25)
+
+    def test_remove(self):
+        ranges = RowRanges()
+        ranges.add(5, 30)
+        ranges.remove(7, 9)
+        self.assertEqual(ranges.get_ranges(), [(5, 7), (9, 30)])
+        self.assert_(6 in ranges)
+        self.failIf(7 in ranges)
+        self.failIf(30 in ranges)
+        ranges.remove(0, 100)
+        self.failIf(ranges)
+
+
+class TestGridSelection(unittest.TestCase):
+
+    class Model(object):
+        description = [('a',), ('b',), ('c',)]
+        rows = [(1, 2, 3)] * 4
+
+    def test_exclusive(self):
+        selection = GridSelection(self.Model())
+        self.failIf(selection)
+        selection.columns = 1 << 0 | 1 << 2
+        self.assert_((3, 2) in selection)
+        self.failIf((3, 1) in selection)
+        self.assertEqual(len(list(selection)), 8)
+        selection.clear()
+        selection.rows.add(1, 2)
+        self.assertEqual(list(selection), [(1, 0), (1, 1), (1, 2)])
+        selection.cell = (0, 1)
+        self.assertEqual(list(selection), [(0, 1)])
@@ -0,0 +1,46 @@
+import unittest
+
+import gobject
+import gtk
+
+from cf.ui.widgets.grid import GridModel, LabelCache
+
+
+class TestLabelCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = LabelCache(2)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+        self.assertEqual(cache.get(2), None)
+        self.assertEqual(cache.get(1), 'a')
+        self.assertEqual(len(cache), 2)
+
+
+class TestGridModel(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [(1, 'a'), (2, 'b')]
+        self.model = GridModel(self.rows, (('id',), ('name',)), gtk.Style())
+
+    def test_column_types(self):
+        model = self.model
+        self.assertEqual(model.on_get_column_type(1), str)
+        self.assertEqual(model.on_get_column_type(2), gobject.TYPE_PYOBJECT)
+        self.assertEqual(model.on_get_column_type(7), gtk.gdk.Color)
+        self.assertEqual(
+            model.on_get_column_type(model.on_get_n_columns()), int)
+        self.assertRaises(RuntimeError, model.on_get_column_type, 8)
+
+    def test_values(self):
+        model = self.model
+        self.assertEqual(model.on_get_value(1, 1), u'b')
+        self.assertEqual(model.on_get_value(1, 2), 2)
+        self.assertEqual(model.on_get_value(1, model.on_get_n_columns()), 2)
+        self.assertEqual(model.on_get_value(1, 5), None)
+        # Labels are rendered once.
+        self.rows[1] = (2, 'c')
+        self.assertEqual(model.on_get_value(1, 1), u'b')
+        self.assertEqual(model.on_get_value(1, 3), 'c')
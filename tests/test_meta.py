@@ -0,0 +1,294 @@
+import threading
+import time
+import unittest
+
+from cf.db import objects
+from cf.db.meta import CompletionIndex, DatabaseMeta, ObjectStore
+
+
+class FakeMeta(object):
+
+    def __init__(self):
+        self.store = ObjectStore()
+
+    def set_object(self, obj):
+        self.store.add(obj)
+
+    def update_object(self, obj):
+        self.store.update(obj)
+
+
+class TestObjectStore(unittest.TestCase):
+
+    def setUp(self):
+        self.meta = FakeMeta()
+        self.store = self.meta.store
+        self.tables = objects.Tables(self.meta)
+        self.meta.set_object(self.tables)
+
+    def test_find_by_parent_and_class(self):
+        t1 = objects.Table(self.meta, name='foo', oid=1, parent=self.tables)
+        t2 = objects.Table(self.meta, name='bar', oid=2, parent=self.tables)
+        self.meta.set_object(t1)
+        self.meta.set_object(t2)
+        res = self.store.find(parent=self.tables, cls=objects.Table)
+        self.assertEqual(set(res), set([t1, t2]))
+        self.assert_(self.tables in self.store.find(cls=objects.Collection))
+        self.assertEqual(self.store.find(oid=2), [t2])
+        self.assertEqual(self.store.find(oid=3), [])
+
+    def test_find_by_name(self):
+        t1 = objects.Table(self.meta, name='Foo', parent=self.tables)
+        self.meta.set_object(t1)
+        self.assertEqual(self.store.find(name='Foo'), [t1])
+        self.assertEqual(self.store.find(name='foo'), [])
+
+    def test_reindex(self):
+        coll = objects.Columns(self.meta)
+        self.meta.set_object(coll)
+        col = objects.Column(self.meta, coll)
+        self.meta.set_object(col)
+        self.assertEqual(self.store.find(parent=coll, name=''), [col])
+        col.name = 'bar'
+        self.assertEqual(self.store.find(parent=coll, name=''), [])
+        self.assertEqual(self.store.find(parent=coll, name='bar'), [col])
+        self.meta.set_object(col)
+        self.assertEqual(len(self.store.find(cls=objects.Column)), 1)
+
+
+class TestLeafObject(unittest.TestCase):
+
+    def setUp(self):
+        self.meta = FakeMeta()
+        self.store = self.meta.store
+        self.columns = objects.Columns(self.meta)
+        self.meta.set_object(self.columns)
+
+    def test_properties(self):
+        col = objects.Column(self.meta, self.columns, name='foo', oid=1,
+                             pos=3)
+        self.assertEqual(col.props.name, 'foo')
+        self.assertEqual(col.get_property('oid'), 1)
+        self.assertEqual(col.sortorder, -1)
+        self.assertEqual(col.get_data('pos'), 3)
+        self.assertEqual(col.pos, 3)
+        col.props.pk = True
+        self.assert_(col.get_property('pk'))
+        self.failIf(col.has_children())
+        self.assert_(col.property_matches('name__ilike', 'FO'))
+        self.assertRaises(AttributeError, col.get_property, 'foo')
+        self.assertRaises(AttributeError, col.set_property, 'foo', 1)
+
+    def test_compact(self):
+        col = objects.Column(self.meta, self.columns, name='foo')
+        self.assertEqual(col.__dict__, {})
+        self.failIf(isinstance(col, objects.gobject.GObject))
+
+    def test_reindex(self):
+        col = objects.Column(self.meta, self.columns, oid=1)
+        self.meta.set_object(col)
+        col.name = 'bar'
+        self.assertEqual(self.store.find(parent=self.columns, name='bar'),
+                         [col])
+        self.assertEqual(self.store.find(cls=objects.Column, oid=1), [col])
+
+    def test_notify(self):
+        col = objects.Column(self.meta, self.columns)
+        changes = []
+        col.connect('notify::name',
+                    lambda obj, name: changes.append((obj, name)))
+        col.comment = 'baz'
+        col.props.name = 'foo'
+        self.assertEqual(changes, [(col, 'name')])
+        self.assertRaises(TypeError, col.connect, 'changed', None)
+
+
+class TestCompletionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = CompletionIndex()
+        for name in ('customer', 'customer_address', 'address', 'Order',
+                     'order_item'):
+            self.index.add(name, name, 'Table')
+
+    def _names(self, fragment, limit=None):
+        return [name for pos, name, descr
+                in self.index.find(fragment, limit)]
+
+    def test_prefix_and_substring(self):
+        self.assertEqual(self._names('cust'),
+                         ['customer', 'customer_address'])
+        self.assertEqual(self._names('address'),
+                         ['address', 'customer_address'])
+        self.assertEqual(self._names('ORD'), ['Order', 'order_item'])
+        self.assertEqual(self._names('er'),
+                         ['Order', 'order_item', 'customer',
+                          'customer_address'])
+        self.assertEqual(self._names('xyz'), [])
+
+    def test_limit(self):
+        self.assertEqual(self._names('cust', 1), ['customer'])
+        self.assertEqual(self._names('address', 1), ['address'])
+
+    def test_add_remove(self):
+        self.index.remove('address')
+        self.assertEqual(self._names('address'), ['customer_address'])
+        self.index.add('address', 'addresses', 'View')
+        self.assertEqual(self.index.find('addresses'),
+                         [(0, 'addresses', 'View')])
+        self.assertEqual(len(self.index), 5)
+
+
+class FakeConnection(object):
+
+    def __init__(self, threadsafety):
+        self.threadsafety = threadsafety
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBackend(object):
+
+    drivername = 'fake'
+    supports_pooling = True
+
+    def get_catalog_phases(self):
+        return ['relations', 'users']
+
+    def get_catalog(self, connection, keys=None, phase=None):
+        return [{'phase': phase, 'conn': connection}]
+
+    def load_catalog(self, meta, connection, rows):
+        meta.loaded.extend(rows)
+
+
+class FakeApp(object):
+
+    def __init__(self):
+        self.config = {'meta.cache_enabled': False}
+
+    def set_status_message(self, msg, context=1):
+        pass
+
+    def pop_status_message(self, context=1):
+        pass
+
+
+class FakeManager(object):
+
+    def __init__(self):
+        self.app = FakeApp()
+
+
+class FakeDatasource(object):
+
+    def __init__(self, threadsafety):
+        self.id = None
+        self.manager = FakeManager()
+        self.backend = FakeBackend()
+        self.internal_connection = FakeConnection(threadsafety)
+        self.opened = []
+
+    def open_background_connection(self):
+        conn = FakeConnection(self.internal_connection.threadsafety)
+        self.opened.append(conn)
+        return conn
+
+
+class LoadingMeta(DatabaseMeta):
+
+    def __init__(self, datasource):
+        self.loaded = []
+        DatabaseMeta.__init__(self, datasource)
+
+
+class TestDatabaseMetaLoading(unittest.TestCase):
+
+    def test_synchronous(self):
+        ds = FakeDatasource(0)
+        meta = LoadingMeta(ds)
+        self.assertEqual([row['phase'] for row in meta.loaded],
+                         ['relations', 'users'])
+        self.assertEqual(ds.opened, [])
+        self.assert_(meta.conn is ds.internal_connection)
+
+    def test_find_completions(self):
+        meta = LoadingMeta(FakeDatasource(0))
+        meta.set_object(objects.Table(meta, name='customers', oid=1))
+        self.assertEqual([name for pos, name, descr
+                          in meta.find_completions('stom')], ['customers'])
+        meta.remove_object(meta.find(name='customers')[0])
+        self.assertEqual(meta.find_completions('stom'), [])
+
+    def test_find_while_refreshing(self):
+        meta = LoadingMeta(FakeDatasource(0))
+        columns = objects.Columns(meta)
+        columns.props.refresh_required = True
+        meta.set_object(columns)
+        refreshing = threading.Event()
+        resume = threading.Event()
+        def refresh_many(collections, meta, connection):
+            refreshing.set()
+            resume.wait(5)
+        meta.backend.refresh_many = refresh_many
+        worker = threading.Thread(target=meta.refresh_collections,
+                                  args=([columns],))
+        worker.start()
+        try:
+            refreshing.wait(5)
+            # Lookups don't wait for the query.
+            self.assertEqual(meta.find(cls=objects.Columns), [columns])
+            self.assertEqual(meta.find_completions('foo'), [])
+            self.assert_(worker.isAlive())
+        finally:
+            resume.set()
+            worker.join()
+        self.failIf(columns.props.refresh_required)
+
+    def test_refresh_connection(self):
+        # Connections of modules with threadsafety 1 stay in the editor's
+        # thread, refreshes use a pooled connection.
+        ds = FakeDatasource(1)
+        meta = LoadingMeta(ds)
+        timeout = time.time()+5
+        while meta.progress != (2, 2) and time.time() < timeout:
+            time.sleep(0.01)
+        self.assert_(meta.can_refresh_in_background())
+        columns = objects.Columns(meta)
+        columns.props.refresh_required = True
+        meta.set_object(columns)
+        used = []
+        meta.backend.refresh_many = lambda colls, meta, conn: used.append(conn)
+        opened = len(ds.opened)
+        meta.refresh_collections([columns])
+        self.assertEqual(used, ds.opened[opened:])
+        self.assert_(used[0].closed)
+        ds.backend.supports_pooling = False
+        self.failIf(meta.can_refresh_in_background())
+
+    def test_no_pooling(self):
+        # SQLite connections may see different databases.
+        ds = FakeDatasource(2)
+        ds.backend.supports_pooling = False
+        meta = LoadingMeta(ds)
+        self.assertEqual(len(meta.loaded), 2)
+        self.assertEqual(ds.opened, [])
+        self.assert_(meta.conn is ds.internal_connection)
+
+    def test_background(self):
+        ds = FakeDatasource(2)
+        meta = LoadingMeta(ds)
+        timeout = time.time()+5
+        while meta.conn is ds.internal_connection and time.time() < timeout:
+            time.sleep(0.01)
+        self.assertEqual(meta.progress, (2, 2))
+        self.assertEqual(sorted(row['phase'] for row in meta.loaded),
+                         ['relations', 'users'])
+        # Each phase used its own connection, one of them is kept.
+        self.assertEqual(len(ds.opened), 2)
+        self.assert_(meta.conn in ds.opened)
+        self.assertEqual([conn.closed for conn in ds.opened].count(True), 1)
+        meta.close()
+        self.assert_(not [conn for conn in ds.opened if not conn.closed])
@@ -0,0 +1,108 @@
+import unittest
+
+from cf.db.pool import ConnectionPool
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+
+    def rollback(self):
+        if not self.alive:
+            raise RuntimeError('connection lost')
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBackend(object):
+
+    def __init__(self):
+        self.opened = []
+        self.can_reset = False
+
+    def get_connection(self, url):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+    def check_connection(self, conn):
+        return conn.alive
+
+    def reset_connection(self, conn):
+        conn.rollback()
+        return self.can_reset
+
+
+class FakeDatasource(object):
+
+    def __init__(self):
+        self.backend = FakeBackend()
+        self.url = None
+        self.connections = set()
+
+    def close_unused_connections(self, max_idle=0):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.ds = FakeDatasource()
+        self.pool = ConnectionPool(self.ds, min_size=1, max_size=2,
+                                   idle_timeout=60)
+
+    def test_reuse(self):
+        conn, created = self.pool.acquire()
+        self.assert_(created)
+        self.pool.release(conn)
+        self.assertEqual(len(self.pool), 1)
+        self.assertEqual(self.pool.acquire(), (conn, False))
+        self.assertEqual(len(self.ds.backend.opened), 1)
+
+    def test_session_changed(self):
+        conn, created = self.pool.acquire()
+        self.pool.release(conn, session_changed=True)
+        self.assert_(conn.closed)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_session_reset(self):
+        self.ds.backend.can_reset = True
+        conn, created = self.pool.acquire()
+        self.pool.release(conn, session_changed=True)
+        self.assertFalse(conn.closed)
+        # The reset connection needs to be set up again.
+        self.assertEqual(self.pool.acquire(), (conn, True))
+
+    def test_broken_connections(self):
+        conn, created = self.pool.acquire()
+        self.pool.release(conn)
+        conn.alive = False
+        conn2, created = self.pool.acquire()
+        self.assert_(created)
+        self.assert_(conn.closed)
+        conn2.alive = False
+        self.pool.release(conn2)
+        self.assert_(conn2.closed)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_max_size(self):
+        conns = [self.pool.acquire()[0] for i in range(3)]
+        for conn in conns:
+            self.pool.release(conn)
+        self.assertEqual(len(self.pool), 2)
+        self.assert_(conns[-1].closed)
+
+    def test_reap(self):
+        conns = [self.pool.acquire()[0] for i in range(2)]
+        for conn in conns:
+            self.pool.release(conn)
+        self.assertEqual(self.pool.reap(), 0)
+        now = self.pool._idle[-1][1]+61
+        self.assertEqual(self.pool.reap(now), 1)
+        self.assertEqual(len(self.pool), 1)
+        self.pool.clear()
+        self.assertEqual(len(self.pool), 0)
+        self.assert_(conns[0].closed and conns[1].closed)
@@ -2,7 +2,7 @@ from tests.utils import DbTest
 
 import sqlparse
 import sqlparse.sql
-from cf.db import Query
+from cf.db import Query, TIMING_EXECUTE, TIMING_FETCH, TIMING_FIRST_ROW
 
 
 class TestQuery(DbTest):
@@ -15,3 +15,73 @@ class TestQuery(DbTest):
         q = Query('select * from foo', self.conn)
         self.assert_(isinstance(q.parsed, sqlparse.sql.Statement),
                      'Expected sqlparse.sql.Statement, got %r' % q.parsed)
+
+    def test_streaming(self):
+        self.conn.execute('create table foo (val integer)')
+        for i in range(25):
+            self.conn.execute('insert into foo (val) values (%d)' % i)
+        q = Query('select val from foo order by val', self.conn,
+                  page_size=10)
+        q.execute()
+        self.assertEqual(len(q.rows), 10)
+        self.assert_(q.has_more)
+        self.assertEqual(q.fetch_more(), [(i,) for i in range(10, 20)])
+        rows = list(q.iter_rows())
+        self.assertEqual(len(rows), 15)
+        self.assertEqual(rows[-1], (24,))
+        self.failIf(q.has_more)
+        self.assert_(q.complete)
+        self.assertEqual(q.fetch_more(), [])
+
+    def test_fetch_rows(self):
+        self.conn.execute('create table foo (val integer)')
+        for i in range(25):
+            self.conn.execute('insert into foo (val) values (%d)' % i)
+        q = Query('select val from foo order by val', self.conn,
+                  page_size=10)
+        q.execute()
+        self.assertEqual(q.fetch_rows(2, 3), [(2,), (3,), (4,)])
+        # Rows are skipped to reach the offset.
+        self.assertEqual(q.fetch_rows(15, 2), [(15,), (16,)])
+        # SQLite cursors can't be scrolled back and the statement isn't
+        # executed again.
+        self.assertEqual(q.fetch_rows(12, 2), [])
+        self.assertEqual(q.fetch_rows(17, 2), [(17,), (18,)])
+
+    def test_close_streamed(self):
+        self.conn.execute('create table foo (val integer)')
+        for i in range(25):
+            self.conn.execute('insert into foo (val) values (%d)' % i)
+        q = Query('select val from foo', self.conn, page_size=10)
+        q.execute()
+        q.close()
+        self.assertEqual(q.fetch_more(), [])
+        # Not all rows were fetched.
+        self.failIf(q.complete)
+
+    def test_execute_closes_stream(self):
+        self.conn.execute('create table foo (val integer)')
+        for i in range(25):
+            self.conn.execute('insert into foo (val) values (%d)' % i)
+        q = Query('select val from foo', self.conn, page_size=10)
+        q.execute()
+        self.assert_(q.has_more)
+        q2 = Query('select count(*) from foo', self.conn)
+        q2.execute()
+        self.assertEqual(q2.rows[0], (25,))
+        # The first result can't be fetched anymore.
+        self.failIf(q.has_more)
+        self.failIf(q.complete)
+        self.assertEqual(self.conn._stream, None)
+
+    def test_timings(self):
+        self.conn.execute('create table foo (val integer)')
+        for i in range(25):
+            self.conn.execute('insert into foo (val) values (%d)' % i)
+        q = Query('select val from foo', self.conn)
+        q.execute()
+        phases = [phase for phase, seconds in q.get_timings()]
+        self.assertEqual(phases[:3],
+                         [TIMING_FIRST_ROW, TIMING_EXECUTE, TIMING_FETCH])
+        self.assertEqual(q.rows_fetched, 25)
+        self.assert_(q.bytes_fetched > 0)
@@ -0,0 +1,73 @@
+import unittest
+
+from cf.db.columnar import ColumnBatch
+from cf.db.resultstore import MemoryBudget, ResultStore
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.budget = MemoryBudget()
+        self.store = ResultStore(page_size=10, budget=self.budget)
+
+    def test_sequence(self):
+        rows = [(i, 'row %d' % i) for i in range(25)]
+        self.store.extend(iter(rows))
+        self.assertEqual(len(self.store), 25)
+        self.assertEqual(list(self.store), rows)
+        self.assertEqual(self.store[-1], rows[-1])
+        self.assertEqual(self.store[8:12], rows[8:12])
+        self.assertRaises(IndexError, self.store.__getitem__, 25)
+
+    def test_columnar(self):
+        rows = [(i, 'row %d' % i) for i in range(25)]
+        self.store.extend(rows)
+        self.assert_(isinstance(self.store._pages[0], ColumnBatch))
+        self.assertEqual(type(self.store._pages[-1]), list)
+        self.assertEqual(self.store.get_value(12, 1), 'row 12')
+        self.assertEqual(self.store.get_value(24, 0), 24)
+        self.assertEqual(list(self.store), rows)
+        store = ResultStore(page_size=10, budget=self.budget, columnar=False)
+        store.extend(rows)
+        self.assertEqual(type(store._pages[0]), list)
+        self.assertEqual(store.get_value(12, 1), 'row 12')
+
+    def test_spill(self):
+        rows = [(i, 'row %d' % i) for i in range(100)]
+        self.store.extend(rows[:50])
+        self.budget.limit = self.budget.used//2
+        self.store.extend(rows[50:])
+        self.assert_(self.budget.used <= self.budget.limit)
+        self.assert_(self.store._locations)
+        self.assertEqual(self.store[5], rows[5])
+        self.assertEqual(list(self.store), rows)
+        self.assert_(self.budget.used <= self.budget.limit)
+
+    def test_spill_binary(self):
+        rows = [(i, buffer('\x01\x02%c' % i)) for i in range(20)]
+        self.store.extend(rows)
+        self.budget.limit = 1
+        self.budget.enforce()
+        self.assertEqual(self.store._pages[0], None)
+        self.assertEqual(str(self.store[0][1]), '\x01\x02\x00')
+        self.assertEqual(str(self.store.get_value(19, 1)), '\x01\x02\x13')
+
+    def test_spill_failed(self):
+        rows = [(i, lambda: i) for i in range(10)]
+        self.store.extend(rows)
+        self.budget.limit = 1
+        self.budget.enforce()
+        # Unpicklable pages stay in memory.
+        self.assertEqual(self.budget.used, 0)
+        self.assertEqual(self.store._resident, set())
+        self.assertEqual(self.store[3][0], 3)
+
+    def test_shared_budget(self):
+        other = ResultStore(page_size=10, budget=self.budget)
+        self.store.extend([(i,) for i in range(20)])
+        other.extend([(i,) for i in range(20)])
+        used = self.budget.used
+        self.store.close()
+        self.assert_(0 < self.budget.used < used)
+        del other
+        self.assertEqual(self.budget.used, 0)
@@ -0,0 +1,80 @@
+import threading
+import unittest
+
+import gobject
+
+from cf.db.resultstore import MemoryBudget, ResultStore
+from cf.ui.widgets.grid import RowWindow
+
+
+class TestRowWindow(unittest.TestCase):
+
+    def test_paging(self):
+        data = [(i,) for i in range(95)]
+        fetch = lambda offset, count: data[offset:offset+count]
+        window = RowWindow(data[:10], fetch, 10, max_pages=3)
+        self.assertEqual(len(window), 10)
+        # Iterating doesn't fetch more rows.
+        self.assertEqual(list(window), data[:10])
+        self.assertEqual(len(window), 10)
+        while window.fetch_more():
+            pass
+        self.assertEqual(list(window), data)
+        self.assert_(window.complete)
+        self.assertEqual(window[42], (42,))
+        self.assertEqual(window[90:93], data[90:93])
+        self.assert_(len(window._pages) <= 3)
+
+    def test_store(self):
+        data = [(i,) for i in range(95)]
+        fetched = []
+        def fetch(offset, count):
+            fetched.append(offset)
+            return data[offset:offset+count]
+        store = ResultStore(page_size=10, budget=MemoryBudget())
+        window = RowWindow(data[:10], fetch, 10, row_count=95, store=store)
+        self.assertEqual(window[42], (42,))
+        self.assertEqual(list(window), data)
+        self.assertEqual(window[3], (3,))
+        self.assertEqual(fetched, range(10, 100, 10))
+
+    def test_iter_rows(self):
+        data = [(i,) for i in range(95)]
+        fetch = lambda offset, count: data[offset:offset+count]
+        store = ResultStore(page_size=10, budget=MemoryBudget())
+        window = RowWindow(data[:10], fetch, 10, store=store)
+        exported = []
+        worker = threading.Thread(
+            target=lambda: exported.extend(window.iter_rows()))
+        worker.start()
+        worker.join()
+        self.assertEqual(exported, data)
+        self.assertEqual(len(window), 10)
+        # The window picks up the stored rows page by page.
+        self.assertEqual(window.fetch_more(), 10)
+        while window.fetch_more():
+            pass
+        self.assertEqual(len(window), 95)
+        self.assert_(window.complete)
+
+    def test_iter_rows_idle(self):
+        data = [(i,) for i in range(95)]
+        fetched_by = set()
+        def fetch(offset, count):
+            fetched_by.add(threading.currentThread())
+            return data[offset:offset+count]
+        store = ResultStore(page_size=10, budget=MemoryBudget())
+        window = RowWindow(data[:10], fetch, 10, store=store)
+        exported = []
+        loop = gobject.MainLoop()
+        def export():
+            exported.extend(window.iter_rows(idle=True))
+            gobject.idle_add(loop.quit)
+        gobject.threads_init()
+        worker = threading.Thread(target=export)
+        worker.start()
+        loop.run()
+        worker.join()
+        self.assertEqual(exported, data)
+        # All pages were fetched by the main loop.
+        self.assertEqual(fetched_by, set([threading.currentThread()]))
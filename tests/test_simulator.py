@@ -0,0 +1,198 @@
+import threading
+import time
+import unittest
+
+from cf.db import objects
+from cf.db import simulator
+from cf.db.backends.simulated import Simulated
+from cf.db.backends.simulated import SimulatedMySQL, SimulatedOracle
+from cf.db.backends.simulated import SimulatedPostgres
+from cf.db.url import URL
+
+from test_backends import FakeMeta, FakeDatasource, FakeQuery
+
+
+class SimulatedConnection(object):
+
+    def __init__(self, flavor='postgres', statement_timeout=None, **kwds):
+        self.datasource = FakeDatasource(statement_timeout)
+        self.datasource.url = URL('simulated', flavor=flavor, **kwds)
+        self.connection = simulator.connect(flavor=flavor, **kwds)
+        self.client_timeout = None
+
+    def execute(self, sql):
+        cursor = self.connection.cursor()
+        cursor.execute(sql)
+        if cursor.description:
+            return cursor.fetchall()
+
+    def execute_raw(self, sql):
+        cursor = self.connection.cursor()
+        cursor.execute(sql)
+        ret = []
+        for row in cursor.fetchall():
+            data = {}
+            for idx, item in enumerate(cursor.description):
+                data[item[0]] = row[idx]
+                data[idx] = row[idx]
+            ret.append(data)
+        return ret
+
+    def get_dbapi_connection(self):
+        return self.connection
+
+
+class TestCatalog(unittest.TestCase):
+
+    def _initialize(self, backend, conn):
+        meta = FakeMeta()
+        backend.initialize(meta, conn)
+        return meta
+
+    def _count(self, kind):
+        catalog = simulator.get_catalog(200)
+        return len([rel for rel in catalog.relations if rel.kind == kind])
+
+    def test_postgres(self):
+        conn = SimulatedConnection(objects=200)
+        backend = SimulatedPostgres()
+        meta = self._initialize(backend, conn)
+        tables = meta.find(cls=objects.Table)
+        self.assertEqual(len(tables), self._count('table'))
+        backend.refresh_many([table.columns for table in tables[:10]],
+                             meta, conn)
+        self.assert_(meta.find(cls=objects.Column, parent=tables[0].columns))
+        # Catalog rows by key, as used by the meta cache.
+        keys = [backend.get_catalog_key(row)
+                for row in backend.get_catalog(conn)[:5]]
+        self.assertEqual(len(backend.get_catalog(conn, keys)), 5)
+
+    def test_postgres_keys(self):
+        conn = SimulatedConnection(objects=200)
+        backend = SimulatedPostgres()
+        rows = backend.get_catalog(conn)
+        keys = set(backend.get_catalog_key(row) for row in rows)
+        # All rows are covered by the state query.
+        self.failIf(keys.difference(backend.get_catalog_state(conn)))
+        self.assertEqual(set(kind for kind, oid in keys),
+                         set(['rel', 'proc', 'lang', 'user']))
+        for kind in ('proc', 'lang'):
+            key = [key for key in keys if key[0] == kind][0]
+            self.assertEqual([backend.get_catalog_key(row)
+                              for row in backend.get_catalog(conn, [key])],
+                             [key])
+        # Changed functions are loaded again on demand.
+        meta = self._initialize(backend, conn)
+        row = [row for row in rows if row['objtype'] == 'function'][0]
+        funcs = meta.find_exact(cls=objects.Functions,
+                                parent=meta.find_exact(oid=row['nspoid'],
+                                                       cls=objects.Schema))
+        funcs.props.refresh_required = False
+        backend.load_catalog(meta, conn, [row])
+        self.assert_(funcs.props.refresh_required)
+
+    def test_mysql(self):
+        conn = SimulatedConnection('mysql', objects=200)
+        backend = SimulatedMySQL()
+        meta = self._initialize(backend, conn)
+        views = meta.find(cls=objects.View)
+        self.assertEqual(len(views), self._count('view'))
+        backend.refresh_many([view.columns for view in views], meta, conn)
+        cols = meta.find(cls=objects.Column, parent=views[0].columns)
+        self.assertEqual(min(col.sortorder for col in cols), 1)
+
+    def test_oracle(self):
+        conn = SimulatedConnection('oracle', objects=200)
+        backend = SimulatedOracle()
+        meta = self._initialize(backend, conn)
+        # The backend's catalog query reports views as tables.
+        tables = meta.find(cls=objects.Table)
+        self.assertEqual(len(tables),
+                         self._count('table')+self._count('view'))
+        backend.refresh_many([table.indexes for table in tables], meta,
+                             conn)
+        self.assertEqual(len(meta.find(cls=objects.Index)),
+                         self._count('table'))
+
+
+class TestErrors(unittest.TestCase):
+
+    def _get_position(self, backend, conn, statement):
+        query = FakeQuery(statement, conn)
+        try:
+            conn.execute(statement)
+        except simulator.Error, err:
+            return backend.get_error_position(query, err)
+        self.fail('No error raised')
+
+    def test_error_position(self):
+        statement = 'select *\n  from missing'
+        for flavor, backend in (('postgres', SimulatedPostgres()),
+                                ('mysql', SimulatedMySQL()),
+                                ('oracle', SimulatedOracle())):
+            conn = SimulatedConnection(flavor)
+            self.assertEqual(self._get_position(backend, conn, statement),
+                             (2, 8), flavor)
+
+
+class TestExecution(unittest.TestCase):
+
+    def test_rows(self):
+        conn = SimulatedConnection(objects=200, rows=50)
+        table = simulator.get_catalog(200).relations[0].name
+        rows = conn.execute('select * from %s' % table)
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(rows[-1][0], 50)
+        self.assertEqual(conn.execute('select count(*) from %s' % table),
+                         [(50,)])
+
+    def test_latency(self):
+        conn = simulator.connect(latency=.05, throughput=1000)
+        table = conn.catalog.relations[0].name
+        cursor = conn.cursor()
+        start = time.time()
+        cursor.execute('select * from %s' % table)
+        cursor.fetchmany(100)
+        # Two round-trips and 100 rows at 1000 rows/s.
+        self.assert_(time.time()-start >= .2)
+
+    def test_cancel(self):
+        conn = SimulatedConnection()
+        backend = SimulatedPostgres()
+        timer = threading.Timer(.1, backend.cancel, (conn,))
+        timer.start()
+        start = time.time()
+        self.assertRaises(simulator.QueryCanceledError, conn.execute,
+                          'select pg_sleep(10)')
+        self.assert_(time.time()-start < 5)
+        self.assertEqual(conn.execute('select 1'), [(1,)])
+
+    def test_kill_query(self):
+        conn = SimulatedConnection('mysql')
+        timer = threading.Timer(.1, SimulatedMySQL().cancel, (conn,))
+        timer.start()
+        try:
+            conn.execute('select sleep(10)')
+        except simulator.OperationalError, err:
+            self.assertEqual(err.args[0], 1317)
+        else:
+            self.fail('Query not killed')
+
+    def test_statement_timeout(self):
+        conn = SimulatedConnection('oracle', statement_timeout=1)
+        SimulatedOracle().prepare_connection(conn)
+        self.assertEqual(conn.client_timeout, None)
+        conn.connection.callTimeout = 100
+        self.assertRaises(simulator.OperationalError, conn.execute,
+                          'begin dbms_session.sleep(10); end;')
+
+
+class TestSimulated(unittest.TestCase):
+
+    def test_flavor(self):
+        backend = Simulated()
+        url = URL('simulated', flavor='oracle', objects='10')
+        conn = backend.get_connection(url)
+        self.assert_(isinstance(backend.flavor, SimulatedOracle))
+        self.assertEqual(backend.prepare_statement('select 1;'), 'select 1')
+        conn.close()
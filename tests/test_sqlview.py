@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the statement marks in the SQL view."""
+
+from utils import AppTest
+
+from cf.ui.widgets.sqlview import SQLView
+
+
+class FakeWindow(object):
+
+    def __init__(self, app):
+        self.app = app
+
+
+class SQLViewTest(AppTest):
+
+    def setUp(self):
+        super(SQLViewTest, self).setUp()
+        self.view = SQLView(FakeWindow(self.app))
+        self.buffer = self.view.get_buffer()
+
+    def tearDown(self):
+        self.view.destroy()
+        super(SQLViewTest, self).tearDown()
+
+    def set_text(self, text):
+        self.buffer.set_text(text)
+        self.update()
+
+    def update(self):
+        self.view.buffer_changed_cb(self.buffer)
+
+    def get_statements(self):
+        buffer_ = self.buffer
+        return [buffer_.get_text(buffer_.get_iter_at_mark(start),
+                                 buffer_.get_iter_at_mark(end))
+                for start, end in self.view._statements]
+
+    def place_cursor(self, line, offset=0):
+        iter_ = self.buffer.get_iter_at_line_offset(line, offset)
+        self.buffer.place_cursor(iter_)
+
+    def get_current_statement(self):
+        bounds = self.view.get_current_statement()
+        if bounds is None:
+            return None
+        return self.buffer.get_text(*bounds)
+
+
+class TestStatementSplitting(SQLViewTest):
+
+    def setUp(self):
+        super(TestStatementSplitting, self).setUp()
+        self.set_text('select 1;\nselect 2;\nselect 3;')
+        self.marks = list(self.view._statements)
+
+    def test_split(self):
+        self.assertEqual(self.get_statements(),
+                         ['select 1;', 'select 2;', 'select 3;'])
+        self.assertEqual(self.view._dirty, None)
+
+    def test_edit_inside(self):
+        self.buffer.insert(self.buffer.get_iter_at_offset(18), ' + 1')
+        self.update()
+        self.assertEqual(self.get_statements(),
+                         ['select 1;', 'select 2 + 1;', 'select 3;'])
+        # The statement in front of the change keeps its marks.
+        self.assertEqual(self.view._statements[0], self.marks[0])
+
+    def test_edit_between(self):
+        self.buffer.insert(self.buffer.get_iter_at_offset(9), '\n\n')
+        self.update()
+        self.assertEqual(self.get_statements(),
+                         ['select 1;', 'select 2;', 'select 3;'])
+
+    def test_edit_across(self):
+        # Removes "1;\nselect " from the first and second statement.
+        self.buffer.delete(self.buffer.get_iter_at_offset(7),
+                           self.buffer.get_iter_at_offset(17))
+        self.update()
+        self.assertEqual(self.get_statements(), ['select 2;', 'select 3;'])
+
+    def test_insert_semicolon(self):
+        self.buffer.insert(self.buffer.get_iter_at_offset(16), ' 1; select')
+        self.update()
+        self.assertEqual(self.get_statements(),
+                         ['select 1;', 'select 1;', 'select 2;',
+                          'select 3;'])
+
+    def test_delete_semicolon(self):
+        self.buffer.delete(self.buffer.get_iter_at_offset(8),
+                           self.buffer.get_iter_at_offset(9))
+        self.update()
+        self.assertEqual(self.get_statements(),
+                         ['select 1\nselect 2;', 'select 3;'])
+
+    def test_keep_following(self):
+        self.buffer.insert(self.buffer.get_end_iter(),
+                           '\nselect 4;\nselect 5;')
+        self.update()
+        marks = list(self.view._statements)
+        self.buffer.delete(self.buffer.get_iter_at_offset(8),
+                           self.buffer.get_iter_at_offset(9))
+        self.update()
+        self.assertEqual(self.get_statements(),
+                         ['select 1\nselect 2;', 'select 3;', 'select 4;',
+                          'select 5;'])
+        # Statements behind the changed region aren't split again.
+        self.assertEqual(self.view._statements[-1], marks[-1])
+
+    def test_append(self):
+        self.buffer.insert(self.buffer.get_end_iter(), '\nselect 4')
+        self.update()
+        self.assertEqual(self.get_statements(),
+                         ['select 1;', 'select 2;', 'select 3;',
+                          'select 4'])
+        self.buffer.insert(self.buffer.get_end_iter(), ', 5')
+        self.update()
+        self.assertEqual(self.get_statements()[-1], 'select 4, 5')
+
+
+class TestCurrentStatement(SQLViewTest):
+
+    def setUp(self):
+        super(TestCurrentStatement, self).setUp()
+        self.set_text('select 1,\n  2;\n\nselect 3;\n')
+
+    def test_first_line(self):
+        self.place_cursor(0)
+        self.assertEqual(self.get_current_statement(), 'select 1,\n  2;')
+
+    def test_last_line(self):
+        self.place_cursor(1, 4)
+        self.assertEqual(self.get_current_statement(), 'select 1,\n  2;')
+        self.place_cursor(3)
+        self.assertEqual(self.get_current_statement(), 'select 3;')
+
+    def test_between(self):
+        self.place_cursor(2)
+        self.assertEqual(self.get_current_statement(), None)
+        self.assertEqual(self.view._find_statement_line(2), 1)
+
+    def test_after_last(self):
+        self.place_cursor(4)
+        self.assertEqual(self.get_current_statement(), None)
+        self.assertEqual(self.view._find_statement_line(4), 2)